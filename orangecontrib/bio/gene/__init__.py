@@ -2,6 +2,15 @@ from __future__ import absolute_import
 import sys
 import os
 import time
+import mmap
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+import six
+import numpy
 
 from ..utils import serverfiles
 
@@ -81,7 +90,157 @@ class GeneHistory(object):
             setattr(self, attr, value)
 
 
-class NCBIGeneInfo(dict):
+class GeneInfoTable(object):
+    """
+    A read-only mapping of gene ids to lines of a gene_info file. The file
+    is memory-mapped and only an index of the sorted gene ids and the line
+    offsets is kept (in a memory-mapped cache next to the file), so lines
+    are decoded on access and the pages are shared between processes.
+    Lines starting with "#" are skipped; for repeated gene ids the last
+    line is used.
+    """
+
+    #: Format of the index cache. Increase on incompatible changes.
+    FORMAT = 1
+
+    def __init__(self, filename, cache=True):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._data = b""
+        self.index = self._load_index(cache)
+        self._ids = self.index["gene_id"]
+        self._starts = self.index["start"]
+        self._ends = self.index["end"]
+        self._order = None
+
+    def _load_index(self, cache=True):
+        if not cache:
+            return self._build_index()
+        stat = os.stat(self.filename)
+        version = (self.FORMAT, stat.st_size, stat.st_mtime)
+        index_filename = self.filename + ".index.npy"
+        meta_filename = self.filename + ".index.pickle"
+        try:
+            with open(meta_filename, "rb") as f:
+                if pickle.load(f) == version:
+                    return numpy.load(index_filename, mmap_mode="r")
+        except Exception:
+            pass
+
+        index = self._build_index()
+        suffix = ".%i.tmp" % os.getpid()
+        try:
+            # the index first: the metadata marks a complete cache
+            if os.path.exists(meta_filename):
+                os.remove(meta_filename)
+            with open(index_filename + suffix, "wb") as f:
+                numpy.save(f, index)
+            os.rename(index_filename + suffix, index_filename)
+            with open(meta_filename + suffix, "wb") as f:
+                pickle.dump(version, f, 2)
+            os.rename(meta_filename + suffix, meta_filename)
+        except (IOError, OSError):
+            pass
+        return index
+
+    def _build_index(self):
+        """
+        Return a record array of (gene_id, start, end, row) sorted by
+        gene_id, where start:end is the line's position in the file and
+        row the order of the gene ids in the file.
+        """
+        data = self._data
+        size = len(data)
+        buf = numpy.frombuffer(data, dtype=numpy.uint8) if size else \
+            numpy.zeros(0, dtype=numpy.uint8)
+        ends = numpy.flatnonzero(buf == ord("\n"))
+        if size and (not len(ends) or ends[-1] != size - 1):
+            ends = numpy.r_[ends, size]
+        starts = numpy.r_[0, ends[:-1] + 1].astype(ends.dtype)
+        # strip "\r" of "\r\n" line ends
+        ends = ends - ((ends > starts) &
+                       (buf[numpy.maximum(ends - 1, 0)] == ord("\r")))
+
+        # the gene id is the second (tab separated) field
+        tabs = numpy.r_[numpy.flatnonzero(buf == ord("\t")), size, size]
+        first = numpy.searchsorted(tabs, starts)
+        keep = (ends > starts) & (tabs[first] < ends)
+        keep[keep] &= buf[starts[keep]] != ord("#")
+        starts, ends, first = starts[keep], ends[keep], first[keep]
+        id_starts = tabs[first] + 1
+        id_ends = numpy.minimum(tabs[first + 1], ends)
+
+        ids = numpy.array([data[i: j] for i, j in zip(id_starts, id_ends)],
+                          dtype=bytes)
+        if not len(ids):
+            ids = ids.astype("S1")
+        # sort by gene id and, for repeated ids, by position in the file
+        order = numpy.argsort(ids, kind="mergesort")
+        sorted_ids = ids[order]
+        group_start = numpy.r_[True, sorted_ids[1:] != sorted_ids[:-1]]
+        group_end = numpy.r_[group_start[1:], True]
+        # the first line of a repeated id gives its row, the last its line
+        row = order[group_start]
+        line = order[group_end]
+        file_order = numpy.empty(len(row), dtype=numpy.int64)
+        file_order[numpy.argsort(row)] = numpy.arange(len(row))
+
+        index = numpy.zeros(len(row), dtype=[("gene_id", ids.dtype),
+                                             ("start", numpy.int64),
+                                             ("end", numpy.int64),
+                                             ("row", numpy.int64)])
+        index["gene_id"] = sorted_ids[group_start]
+        index["start"] = starts[line]
+        index["end"] = ends[line]
+        index["row"] = file_order
+        return index
+
+    def _position(self, gene_id):
+        if isinstance(gene_id, six.text_type):
+            gene_id = gene_id.encode("utf-8")
+        elif not isinstance(gene_id, bytes):
+            return -1
+        ids = self._ids
+        if not len(ids) or len(gene_id) > ids.dtype.itemsize:
+            return -1
+        i = ids.searchsorted(gene_id)
+        return i if i < len(ids) and ids[i] == gene_id else -1
+
+    def _line(self, i):
+        line = self._data[self._starts[i]: self._ends[i]]
+        return line.decode("utf-8") if six.PY3 else line
+
+    def __getitem__(self, gene_id):
+        """ Return the gene_info line for `gene_id`. """
+        i = self._position(gene_id)
+        if i == -1:
+            raise KeyError(gene_id)
+        return self._line(i)
+
+    def __contains__(self, gene_id):
+        return self._position(gene_id) != -1
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        """ Iterate over the gene ids in the order of the file. """
+        if self._order is None:
+            self._order = numpy.argsort(self.index["row"])
+        ids = self._ids
+        for i in self._order:
+            yield ids[i].decode("utf-8") if six.PY3 else ids[i]
+
+    def lines(self, gene_ids):
+        """ Return a list of gene_info lines (or None) for `gene_ids`. """
+        return [self._line(i) if i != -1 else None
+                for i in map(self._position, gene_ids)]
+
+
+class NCBIGeneInfo(Mapping):
     TAX_MAP = {
             "2104": "272634",  # Mycoplasma pneumoniae
             "4530": "39947",  # Oryza sativa
@@ -102,8 +261,8 @@ class NCBIGeneInfo(dict):
 
 
         fname = serverfiles.localpath_download("NCBI_geneinfo", "gene_info.%s.db" % self.taxid)
-        file = open(fname, "rt")
-        self.update(dict([(line.split("\t", 3)[1], line) for line in file.read().splitlines() if line.strip() and not line.startswith("#")]))
+        self._table = GeneInfoTable(fname)
+        self._added = {}
 
         self.matcher = genematcher
         if self.matcher == None:
@@ -153,11 +312,15 @@ class NCBIGeneInfo(dict):
 
     @classmethod    
     def load(cls, file):
-        """ A class method that loads gene info from file
+        """ A class method that loads gene info from file (without a gene
+        matcher, so only indexing by gene ids works).
         """
-        if type(file) in [str, unicode]:
-            file = open(file, "rb")
-        return cls((line.split("\t", 3)[1], line) for line in file.read().splitlines() if line.strip() and not line.startswith("#"))
+        self = cls.__new__(cls)
+        self.taxid = None
+        self.matcher = None
+        self._table = GeneInfoTable(file)
+        self._added = {}
+        return self
         
     def get_info(self, gene_id, def_=None):
         """ Search and return the GeneInfo object for gene_id
@@ -177,13 +340,20 @@ class NCBIGeneInfo(dict):
 
     def __getitem__(self, key):
 #        return self.get(gene_id, self.matcher[gene_id])
-        return GeneInfo(dict.__getitem__(self, key))
+        return GeneInfo(self.line(key))
+
+    def line(self, key):
+        """ Return the gene_info line for gene id `key`.
+        """
+        if key in self._added:
+            return self._added[key]
+        return self._table[key]
 
     def __setitem__(self, key, value):
         if type(value) == str:
-            dict.__setitem__(self, key, value)
+            self._added[key] = value
         else:
-            dict.__setitem__(self, key, repr(value))
+            self._added[key] = repr(value)
 
     def get(self, key, def_=None):
         try:
@@ -191,15 +361,35 @@ class NCBIGeneInfo(dict):
         except KeyError:
             return def_
 
+    def __contains__(self, key):
+        return key in self._added or key in self._table
+
+    def __len__(self):
+        return len(self._table) + \
+            sum(1 for key in self._added if key not in self._table)
+
+    def __iter__(self):
+        for key in self._table:
+            yield key
+        for key in self._added:
+            if key not in self._table:
+                yield key
+
+    def iterkeys(self):
+        return iter(self)
+
     def itervalues(self):
-        for val in dict.itervalues(self):
-            yield GeneInfo(val)
+        for key in self:
+            yield self[key]
 
     def iteritems(self):
-        for key, val in zip(self.iterkeys(), self.itervalues()):
-            yield key, val
+        for key in self:
+            yield key, self[key]
 
     if sys.version_info < (3, ):
+        def keys(self):
+            return list(self)
+
         def values(self):
             return list(self.itervalues())
 
@@ -207,10 +397,10 @@ class NCBIGeneInfo(dict):
             return list(self.iteritems())
     else:
         def values(self):
-            return map(GeneInfo, super().values())
+            return map(self.__getitem__, self)
 
         def items(self):
-            return ((key, GeneInfo(value)) for key, value in super().items())
+            return ((key, self[key]) for key in self)
 
     @staticmethod
     def get_geneinfo_from_ncbi(file, progressCallback=None):
@@ -351,8 +541,12 @@ Gene matcher.
 "Database" for each organism is a list of sets of gene aliases.
 """
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import os
+import sqlite3
+import threading
+
+import numpy
 
 gene_matcher_path = None
 
@@ -472,6 +666,17 @@ class Matcher(object):
         mat = self.match(gene)
         return mat[0] if len(mat) == 1 else None
 
+    def match_many(self, genes):
+        """
+        Return an array of indices of unique matching targets for a list
+        of genes (-1 where :func:`umatch` would return None).
+        """
+        return self.matcho.match_many(genes)
+
+    def umatch_many(self, genes):
+        """ Return a list of unique matching targets (or None) for genes. """
+        return self.matcho.umatch_many(genes)
+
     def explain(self, gene):
         """ 
         Return gene matches with explanations as lists of tuples:
@@ -479,6 +684,14 @@ class Matcher(object):
         """
         notImplemented()
 
+    def cache_key(self):
+        """
+        Return a hashable key identifying the matcher and the version
+        of its aliases, or None if results of :func:`match_many` should
+        not be cached.
+        """
+        return None
+
 def buffer_path():
     """ Returns buffer path from Orange's setting folder if not 
     defined differently (in gene_matcher_path). """
@@ -529,6 +742,132 @@ def auto_pickle(filename, version, func, *args, **kwargs):
 
     return output
 
+class AliasIndex(object):
+    """
+    An on-disk (SQLite) index of a list of sets of gene aliases. Ids of
+    sets of aliases are their indices in the list. The index is queried
+    lazily, so opening it does not load the aliases into memory, and
+    the file pages are shared by all processes using it.
+    """
+
+    #: Format of the index file. Increase on incompatible changes.
+    FORMAT = "1"
+
+    #: Maximum number of SQL variables in a single query.
+    MAX_VARIABLES = 500
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(filename, timeout=15,
+                                    check_same_thread=False)
+        self._con.text_factory = str
+        self._con.execute("PRAGMA mmap_size=268435456")
+        self.version = self._info("version")
+        self.groups_count = int(self._info("groups") or 0)
+
+    def _info(self, key):
+        row = self._con.execute(
+            "SELECT value FROM info WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @classmethod
+    def open(cls, filename, version, create_aliases):
+        """
+        Open the index in `filename`. If it does not exist or was built
+        for a different `version` (ignored if None) rebuild it from the
+        aliases returned by `create_aliases`.
+        """
+        if os.path.exists(filename):
+            try:
+                index = cls(filename)
+                if index._info("format") == cls.FORMAT and \
+                        (version is None or index.version == version):
+                    return index
+                index.close()
+            except sqlite3.DatabaseError:
+                pass
+        return cls.build(filename, version, create_aliases())
+
+    @classmethod
+    def build(cls, filename, version, aliases):
+        """
+        Build an index of `aliases` (a list of sets of aliases) in
+        `filename` and return it.
+        """
+        tmpname = "%s.%i.tmp" % (filename, os.getpid())
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        con = sqlite3.connect(tmpname)
+        con.text_factory = str
+        try:
+            con.execute("PRAGMA journal_mode=OFF")
+            con.execute("PRAGMA synchronous=OFF")
+            con.execute("CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT)")
+            con.execute("CREATE TABLE aliases (id INTEGER, alias TEXT, "
+                        "lower TEXT)")
+            groups = [0]
+
+            def rows():
+                for i, group in enumerate(aliases):
+                    groups[0] = i + 1
+                    for alias in group:
+                        yield i, alias, alias.lower()
+
+            con.executemany("INSERT INTO aliases VALUES (?, ?, ?)", rows())
+            con.execute("CREATE INDEX alias_index ON aliases (alias)")
+            con.execute("CREATE INDEX lower_index ON aliases (lower)")
+            con.execute("CREATE INDEX id_index ON aliases (id)")
+            con.executemany("INSERT INTO info VALUES (?, ?)",
+                            [("format", cls.FORMAT), ("version", version),
+                             ("groups", str(groups[0]))])
+            con.commit()
+        finally:
+            con.close()
+
+        if os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmpname, filename)
+        return cls(filename)
+
+    def close(self):
+        self._con.close()
+
+    def ids(self, gene, ignore_case=True):
+        """ Return a set of ids of sets of aliases containing `gene`. """
+        return self.ids_many([gene], ignore_case)[0]
+
+    def ids_many(self, genes, ignore_case=True):
+        """ Return a list of sets of alias set ids, one for each gene. """
+        column = "lower" if ignore_case else "alias"
+        genes = [gene.lower() if ignore_case else gene for gene in genes]
+        found = defaultdict(set)
+        unique = sorted(set(genes))
+        with self._lock:
+            for start in range(0, len(unique), self.MAX_VARIABLES):
+                chunk = unique[start: start + self.MAX_VARIABLES]
+                query = "SELECT %s, id FROM aliases WHERE %s IN (%s)" % \
+                        (column, column, ", ".join(["?"] * len(chunk)))
+                for name, id in self._con.execute(query, chunk):
+                    found[name].add(id)
+        return [set(found.get(gene, ())) for gene in genes]
+
+    def group(self, id):
+        """ Return the set of aliases with `id`. """
+        with self._lock:
+            rows = self._con.execute(
+                "SELECT alias FROM aliases WHERE id=?", (id,)).fetchall()
+        return set(alias for alias, in rows)
+
+    def groups(self):
+        """ Return all sets of aliases as a list. """
+        groups = [set() for _ in range(self.groups_count)]
+        with self._lock:
+            for id, alias in self._con.execute(
+                    "SELECT id, alias FROM aliases"):
+                groups[id].add(alias)
+        return groups
+
 class MatcherAliases(Matcher):
     """
     Genes matcher based on a list of sets of given aliases.
@@ -548,11 +887,23 @@ class MatcherAliases(Matcher):
             gene = gene.lower()
         return self.mdict[gene]
 
+    def to_ids_many(self, genes):
+        """ Return a list of sets of alias set ids, one for each gene. """
+        mdict = self.mdict
+        if self.ignore_case:
+            genes = [gene.lower() for gene in genes]
+        return [mdict.get(gene, ()) for gene in genes]
+
+    def aliases_group(self, id):
+        """ Return the set of aliases with the given id. """
+        return self.aliases[id]
+
     def set_targets(self, targets):
         """
         A reverse dictionary is made according to each target's membership
         in the sets of aliases.
         """
+        targets = list(targets)
         d = defaultdict(list)
         #d = id: [ targets ], where id is index of the set of aliases
         for target in targets:
@@ -560,7 +911,8 @@ class MatcherAliases(Matcher):
             if ids != None:
                 for id in ids:
                     d[id].append(target)
-        mo = MatchAliases(d, self)
+        mo = MatchAliases(d, self, targets)
+        mo.cache_key = self.cache_key()
         self.matcho = mo #backward compatibility - default match object
         return mo
 
@@ -570,18 +922,67 @@ class MatcherAliases(Matcher):
     def explain(self, gene):
         return self.matcho.explain(gene)
 
+#results of Match.match_many: (matcher key, targets, genes) -> indices
+_match_many_cache = OrderedDict()
+_match_many_cache_lock = threading.Lock()
+MATCH_MANY_CACHE_SIZE = 8
+
 class Match(object):
 
+    targets = None
+    cache_key = None
+
     def umatch(self, gene):
         """Returns an unique (only one matching target) target or None"""
         mat = self.match(gene)
         return mat[0] if len(mat) == 1 else None
- 
+
+    def match_lists(self, genes):
+        """ Return a list of matches (as from :func:`match`) for each gene. """
+        return [ self.match(gene) for gene in genes ]
+
+    def match_many(self, genes):
+        """
+        Return a numpy array of indices of unique matches into targets
+        for a list of genes; genes with no or multiple matches get -1.
+
+        Results of matchers with a :func:`Matcher.cache_key` are cached,
+        so that repeated matching of the same genes to the same targets
+        is not recomputed.
+        """
+        genes = list(genes)
+        key = None
+        if self.cache_key is not None:
+            key = (self.cache_key, tuple(self.targets), tuple(genes))
+            with _match_many_cache_lock:
+                if key in _match_many_cache:
+                    _match_many_cache[key] = res = _match_many_cache.pop(key)
+                    return res.copy()
+
+        positions = {}
+        for i, target in enumerate(self.targets):
+            positions.setdefault(target, i)
+        res = numpy.array([ positions[mat[0]] if len(mat) == 1 else -1
+                            for mat in self.match_lists(genes) ], dtype=int)
+
+        if key is not None:
+            with _match_many_cache_lock:
+                _match_many_cache[key] = res.copy()
+                while len(_match_many_cache) > MATCH_MANY_CACHE_SIZE:
+                    _match_many_cache.popitem(last=False)
+        return res
+
+    def umatch_many(self, genes):
+        """ Return a list of unique matches (or None) for each gene. """
+        return [ self.targets[i] if i >= 0 else None
+                 for i in self.match_many(genes) ]
+
 class MatchAliases(Match):
 
-    def __init__(self, to_targets, parent):
+    def __init__(self, to_targets, parent, targets=None):
         self.to_targets = to_targets
         self.parent = parent
+        self.targets = targets
 
     def match(self, gene):
         """
@@ -595,9 +996,19 @@ class MatchAliases(Match):
             reduce(lambda x,y: x+y, 
                 [ self.to_targets[igid] for igid in inputgeneids ], [])))
 
+    def match_lists(self, genes):
+        to_targets = self.to_targets
+        res = []
+        for inputgeneids in self.parent.to_ids_many(genes):
+            mat = set()
+            for igid in inputgeneids:
+                mat.update(to_targets.get(igid, ()))
+            res.append(list(mat))
+        return res
+
     def explain(self, gene):
         inputgeneids = self.parent.to_ids(gene)
-        return [ (self.to_targets[igid], self.parent.aliases[igid]) for igid in inputgeneids ]
+        return [ (self.to_targets[igid], self.parent.aliases_group(igid)) for igid in inputgeneids ]
 
 class MatcherAliasesPickled(MatcherAliases):
     """
@@ -609,6 +1020,11 @@ class MatcherAliasesPickled(MatcherAliases):
     Loading of gene aliases is done lazily: they are loaded when they are
     needed. Loading of aliases for components of joined matchers is often 
     unnecessary and is therefore avoided. 
+
+    Matchers with a file name keep their aliases in an on-disk
+    :class:`AliasIndex` (versioned by "create_aliases_version"), which
+    is queried by :func:`to_ids` and :func:`set_targets` instead of
+    loading all aliases into memory.
     """
     
     def set_aliases(self, aliases):
@@ -616,7 +1032,11 @@ class MatcherAliasesPickled(MatcherAliases):
 
     def get_aliases(self):
         if not self.saved_aliases: #loads aliases if not loaded
-            self.aliases = self.load_aliases()
+            index = self.index
+            if index is not None:
+                self.aliases = index.groups()
+            else:
+                self.aliases = self.load_aliases()
         #print "size of aliases ", len(self.saved_aliases)
         return self.saved_aliases
 
@@ -633,8 +1053,65 @@ class MatcherAliasesPickled(MatcherAliases):
 
     mdict = property(get_mdict, set_mdict)
 
+    @property
+    def index(self):
+        """
+        The :class:`AliasIndex` of aliases (None for matchers without
+        a file name or with aliases in a given file).
+        """
+        if self.saved_index is None:
+            fn = self.filename()
+            if fn is None or isinstance(fn, tuple):
+                return None
+            filename = os.path.join(buffer_path(), fn + ".index.sqlite")
+            self.saved_index = AliasIndex.open(
+                filename, self.create_aliases_version(), self.create_aliases)
+        return self.saved_index
+
+    def to_ids(self, gene):
+        index = self.index
+        if index is None:
+            return MatcherAliases.to_ids(self, gene)
+        return index.ids(gene, self.ignore_case)
+
+    def to_ids_many(self, genes):
+        index = self.index
+        if index is None:
+            return MatcherAliases.to_ids_many(self, genes)
+        return index.ids_many(genes, self.ignore_case)
+
+    def cache_key(self):
+        fn = self.filename()
+        version = self.create_aliases_version()
+        if fn is None or isinstance(fn, tuple) or version is None:
+            return None
+        return (self.__class__.__name__, fn, version, self.ignore_case)
+
+    def aliases_group(self, id):
+        index = self.index
+        if index is None or self.saved_aliases:
+            return MatcherAliases.aliases_group(self, id)
+        return index.group(id)
+
     def set_targets(self, targets):
-        return MatcherAliases.set_targets(self, targets)
+        index = self.index
+        if index is None:
+            return MatcherAliases.set_targets(self, targets)
+        targets = list(targets)
+        d = defaultdict(list)
+        for target, ids in zip(targets,
+                               index.ids_many(targets, self.ignore_case)):
+            for id in ids:
+                d[id].append(target)
+        mo = MatchAliases(d, self, targets)
+        mo.cache_key = self.cache_key()
+        self.matcho = mo #backward compatibility - default match object
+        return mo
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["saved_index"] = None #reopened lazily
+        return state
 
     def filename(self):
         """ Returns file name for saving aliases. """
@@ -664,6 +1141,7 @@ class MatcherAliasesPickled(MatcherAliases):
     def __init__(self, ignore_case=True):
         self.aliases = []
         self.mdict = {}
+        self.saved_index = None
         self.ignore_case = ignore_case
         self.filename() # test if valid filename can be built
 
@@ -899,10 +1377,15 @@ class MatcherSequence(Matcher):
                                 #be problematic if a generator was passed
         for matcher in self.matchers:
             ms.append(matcher.set_targets(targets))
-        om = MatchSequence(ms)
+        om = MatchSequence(ms, targets)
+        om.cache_key = self.cache_key()
         self.matcho = om
         return om
 
+    def cache_key(self):
+        keys = tuple(matcher.cache_key() for matcher in self.matchers)
+        return None if None in keys else ("sequence",) + keys
+
     #this two functions are solely for backward compatibility
     def match(self, gene):
         return self.matcho.match(gene)
@@ -912,8 +1395,9 @@ class MatcherSequence(Matcher):
 
 class MatchSequence(Match):
 
-    def __init__(self, ms):
+    def __init__(self, ms, targets=None):
         self.ms = ms
+        self.targets = targets
 
     def match(self, gene):
         for match in self.ms:
@@ -922,6 +1406,24 @@ class MatchSequence(Match):
                 return m
         return []
 
+    def match_lists(self, genes):
+        """ Each match only sees genes unmatched by the previous ones. """
+        genes = list(genes)
+        res = [ [] for _ in genes ]
+        remaining = list(range(len(genes)))
+        for match in self.ms:
+            if not remaining:
+                break
+            mats = match.match_lists([ genes[i] for i in remaining ])
+            unmatched = []
+            for i, m in zip(remaining, mats):
+                if m:
+                    res[i] = m
+                else:
+                    unmatched.append(i)
+            remaining = unmatched
+        return res
+
     def explain(self, gene):
         for match in self.ms:
             m = match.match(gene)
@@ -943,8 +1445,12 @@ class MatcherDirect(Matcher):
         aliases = [ set([a]) for a in targets]
         self.am = MatcherAliases(aliases, ignore_case=self.ignore_case)
         self.matcho = self.am.set_targets(targets)
+        self.matcho.cache_key = self.cache_key()
         return self.matcho
 
+    def cache_key(self):
+        return ("direct", self.ignore_case)
+
     #this two functions are solely for backward compatibility
     def match(self, gene):
         return self.matcho.match(gene)
@@ -2,6 +2,8 @@ from __future__ import absolute_import
 
 import random
 import math
+import multiprocessing
+import warnings
 from collections import defaultdict
 
 import scipy.stats
@@ -128,14 +130,14 @@ class GeneSetTrans(object):
         the gene set with specified indices.
         """
         nm, name_ind = mat_ni(instance.domain, self.matcher)
-        genes = [ nm.umatch(gene) for gene in geneset ]
+        genes = nm.umatch_many(geneset)
         if takegenes:
             genes = [ genes[i] for i in takegenes ]
         return nm, name_ind, genes
 
     def _match_data(self, data, geneset, odic=False):
         nm, name_ind = mat_ni(data.domain, self.matcher)
-        genes = [ nm.umatch(gene) for gene in geneset ]
+        genes = nm.umatch_many(geneset)
         if odic:
             to_geneset = dict(zip(genes, geneset))
         takegenes = [ i for i,a in enumerate(genes) if a != None ]
@@ -145,7 +147,12 @@ class GeneSetTrans(object):
         else:
             return nm, name_ind, genes, takegenes
 
-    def __init__(self, matcher=None, gene_sets=None, min_size=3, max_size=1000, min_part=0.1, class_values=None, cv=False):
+    def __init__(self, matcher=None, gene_sets=None, min_size=3, max_size=1000, min_part=0.1, class_values=None, cv=False, batch=False):
+        """
+        If batch is True, transformed tables are computed with
+        :obj:`transform` as matrix operations; features keep their
+        per-instance get_value_from in any case.
+        """
         self.matcher = matcher
         self.gene_sets = gene_sets
         self.min_size = min_size
@@ -154,6 +161,7 @@ class GeneSetTrans(object):
         self.class_values = class_values
         self._cache = {}
         self.cv = cv
+        self.batch = batch
 
     def __call__(self, data, weight_id=None):
 
@@ -170,7 +178,7 @@ class GeneSetTrans(object):
 
         #build a data set with cross validation
         if self.cv == False:
-            return Orange.data.Table(newdomain, data)
+            return self._transformed(newdomain, data)
         else:
             # The domain has the transformer that is build on all samples,
             # while the transformed data table uses cross-validation
@@ -186,7 +194,7 @@ class GeneSetTrans(object):
                 test = data.select(cvi, f)
                 lf = self.build_features(learn, gene_sets)
                 transd = Orange.data.Domain(lf, data.domain.class_var)
-                trans_test = Orange.data.Table(transd, test)
+                trans_test = self._transformed(transd, test)
                 for ex, pos in \
                     zip(trans_test, [ i for i,n in enumerate(cvi) if n == f ]):
                     data_cv[pos] = ex.native(0)
@@ -195,6 +203,35 @@ class GeneSetTrans(object):
     def build_features(self, data, gene_sets):
         return [ self.build_feature(data, gs) for gs in gene_sets ]
 
+    def transform(self, data, features):
+        """
+        Return values of features (built by this transformer) for all
+        instances in data as a matrix (instances x features). Features
+        with a batch specification are computed with :func:`batch_transform`,
+        others per instance.
+        """
+        X = data.toNumpyMA("a")[0]
+        X = X.filled(numpy.nan) if X.size else numpy.zeros((len(data), 0))
+        out = numpy.empty((len(data), len(features)))
+        batched = [ i for i,f in enumerate(features) if getattr(f, "batch", None) is not None ]
+        if batched:
+            out[:, batched] = batch_transform(X, data.domain, self.matcher,
+                [ features[i].batch for i in batched ])
+        rest = [ i for i,f in enumerate(features) if getattr(f, "batch", None) is None ]
+        if rest:
+            trans = Orange.data.Table(Orange.data.Domain([ features[i] for i in rest ], False), data)
+            out[:, rest] = trans.toNumpyMA("a")[0].filled(numpy.nan)
+        return out
+
+    def _transformed(self, domain, data):
+        if not self.batch:
+            return Orange.data.Table(domain, data)
+        values = numpy.ma.masked_invalid(self.transform(data, domain.attributes))
+        if domain.class_var:
+            classes = data.toNumpyMA("c")[0].reshape(-1, 1)
+            values = numpy.ma.hstack((values, classes))
+        return Orange.data.Table(domain, values)
+
 def normcdf(x, mi, st):
     #implementation with scipy is almost the same as from Gary's stats
     #return 0.5*(2. - stats.erfcc((x - mi)/(st*math.sqrt(2))))
@@ -350,8 +387,8 @@ class Assess(GeneSetTrans):
         from .. import gsea as obiGsea
         if key not in self.example_buffer:
             ex_atts = [ at.name for at in ex.domain.attributes ]
-            new_atts = [ name_ind[nm.umatch(an)] if nm.umatch(an) != None else (None if self.ignore_unmatchable_context else i)
-                for i,an in enumerate(ex_atts) ]
+            new_atts = [ name_ind[mat] if mat != None else (None if self.ignore_unmatchable_context else i)
+                for i,mat in enumerate(nm.umatch_many(ex_atts)) ]
 
             #new_atts: indices of genes in original data for that sample 
             #POSSIBLE REVERSE IMPLEMENTATION (slightly different
@@ -473,7 +510,7 @@ def select_genesets(nm, gene_sets, min_size=3, max_size=1000, min_part=0.1):
 
     def ok_sizes(gs):
         """compares sizes of genesets to limitations"""
-        transl = filter(lambda x: x != None, [ nm.umatch(gene) for gene in gs.genes ])
+        transl = [ gene for gene in nm.umatch_many(gs.genes) if gene != None ]
         if len(transl) >= min_size \
             and len(transl) <= max_size \
             and float(len(transl))/len(gs.genes) >= min_part:
@@ -489,6 +526,158 @@ def vou(ex, gn, indices):
     else:
         return ex[indices[gn]].value
 
+def geneset_matrix(columns, n, weights=None):
+    """
+    Return a sparse (gene sets x n) matrix with a row for each list
+    of column indices in columns; entries are 1 or given by a matching
+    list of weight arrays. Repeated columns are summed.
+    """
+    import scipy.sparse
+    indptr = numpy.cumsum([0] + [ len(c) for c in columns ])
+    indices = numpy.concatenate([ numpy.asarray(c, dtype=int) for c in columns ] +
+                                [ numpy.zeros(0, dtype=int) ])
+    if weights is None:
+        data = numpy.ones(len(indices))
+    else:
+        data = numpy.concatenate([ numpy.asarray(w, dtype=float) for w in weights ] +
+                                 [ numpy.zeros(0) ])
+    M = scipy.sparse.csr_matrix((data, indices, indptr), shape=(len(columns), n))
+    M.sum_duplicates()
+    return M
+
+class BatchMean(object):
+    """ Mean of known values of genes (as in :obj:`Mean`). """
+
+    def __init__(self, genes):
+        self.genes = list(genes)
+
+    @staticmethod
+    def compute(X, specs, columns):
+        M = geneset_matrix(columns, X.shape[1])
+        known = ~numpy.isnan(X)
+        sums = M.dot(numpy.where(known, X, 0.).T).T
+        counts = M.dot(known.T.astype(float)).T
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return sums/counts
+
+class BatchMedian(BatchMean):
+    """ Median of known values of genes (as in :obj:`Median`). """
+
+    @staticmethod
+    def compute(X, specs, columns):
+        #gene sets of equal sizes are reduced together
+        out = numpy.empty((X.shape[0], len(columns)))
+        bysize = defaultdict(list)
+        for i, c in enumerate(columns):
+            bysize[len(c)].append(i)
+        for size, sets in bysize.items():
+            if size == 0:
+                out[:, sets] = numpy.nan
+                continue
+            inds = numpy.array([ columns[i] for i in sets ])
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning) #all unknown
+                out[:, sets] = numpy.nanmedian(X[:, inds], axis=2)
+        return out
+
+class BatchLinear(object):
+    """
+    A projection sum_j weights[j] * (x_j - center[j]) of gene values
+    (PCA, PLS, SPCA and CORGs). Unknown values contribute 0.
+    """
+
+    def __init__(self, genes, weights, center=None):
+        self.genes = list(genes)
+        self.weights = numpy.asarray(weights, dtype=float).reshape(-1)
+        self.center = numpy.zeros(len(self.genes)) if center is None \
+            else numpy.asarray(center, dtype=float).reshape(-1)
+
+    @staticmethod
+    def compute(X, specs, columns):
+        W = geneset_matrix(columns, X.shape[1], [ s.weights for s in specs ])
+        shifts = [ s.weights*s.center for s in specs ]
+        offset = numpy.array([ numpy.sum(s) for s in shifts ])
+        unknown = numpy.isnan(X)
+        out = W.dot(numpy.where(unknown, 0., X).T).T - offset
+        if unknown.any():
+            #unknown values contribute nothing: add their shifts back
+            C = geneset_matrix(columns, X.shape[1], shifts)
+            out += C.dot(unknown.T.astype(float)).T
+        return out
+
+class BatchLLR(object):
+    """
+    A sum of (normalized) log likelihood ratios of gene values under
+    two class gaussians (as in :obj:`LLR`). Unknown values have a ratio
+    of 0.
+    """
+
+    def __init__(self, genes, gaussians, normalize=None):
+        self.genes = list(genes)
+        self.gaussians = numpy.array([ [ numpy.nan if p is None else p for p in g ]
+                                       for g in gaussians ], dtype=float).reshape(-1, 4)
+        self.normalize = None if normalize is None \
+            else numpy.array(normalize, dtype=float).reshape(-1, 2)
+
+    @staticmethod
+    def compute(X, specs, columns, chunk=None):
+        columns = [ numpy.asarray(c, dtype=int) for c in columns ]
+        sizes = numpy.array([ len(c) for c in columns ])
+        starts = numpy.cumsum(sizes) - sizes
+        cols = numpy.concatenate(columns + [ numpy.zeros(0, dtype=int) ])
+        mi1, std1, mi2, std2 = numpy.concatenate(
+            [ s.gaussians for s in specs ] + [ numpy.zeros((0, 4)) ]).T
+        valid = numpy.isfinite(mi1 + std1 + mi2 + std2) & (std1 != 0) & (std2 != 0)
+        mi1, std1, mi2, std2 = [ numpy.where(valid, a, 1.) for a in (mi1, std1, mi2, std2) ]
+        #genes of features without normalization have m=0, s=1
+        m, s = numpy.concatenate(
+            [ numpy.tile([0., 1.], (len(c), 1)) if sp.normalize is None else sp.normalize
+              for sp, c in zip(specs, columns) ] + [ numpy.zeros((0, 2)) ]).T
+        scale = numpy.where(s == 0, 0., 1.) #disregard genes without differences
+        s = numpy.where(s == 0, 1., s)
+        out = numpy.zeros((X.shape[0], len(columns)))
+        if not len(cols):
+            return out
+        nonempty = sizes > 0
+        chunk = chunk or max(1, 2**22 // len(cols))
+        for start in range(0, X.shape[0], chunk):
+            V = X[start:start + chunk, cols]
+            with numpy.errstate(invalid="ignore"):
+                r = (-(V - mi1)**2/(2*std1**2) - numpy.log(std1)) \
+                    - (-(V - mi2)**2/(2*std2**2) - numpy.log(std2))
+            r = numpy.where(valid & ~numpy.isnan(V), r, 0.)
+            r = (r - m)/s*scale
+            out[start:start + chunk, nonempty] = \
+                numpy.add.reduceat(r, starts[nonempty], axis=1)
+        return out
+
+def batch_transform(X, domain, matcher, specs):
+    """
+    Compute gene set features given by batch specifications (:obj:`BatchMean`,
+    :obj:`BatchLinear`, ...) for a whole data matrix X (unknown values are
+    nan) with attributes from domain. Genes of all features are matched
+    to the domain at once; features of the same kind are computed together.
+    Return a matrix (instances x features).
+    """
+    X = numpy.asarray(X, dtype=float)
+    nm, name_ind = mat_ni(domain, matcher)
+    genes = [ g for s in specs for g in s.genes ]
+    #unmatched genes point to a column of unknown values
+    X = numpy.hstack((X, numpy.full((X.shape[0], 1), numpy.nan)))
+    to_column = numpy.array([ name_ind[t] for t in nm.targets ] + [ X.shape[1] - 1 ], dtype=int)
+    cols = to_column[nm.match_many(genes)]
+    bounds = numpy.cumsum([0] + [ len(s.genes) for s in specs ])
+    columns = [ cols[a:b] for a, b in zip(bounds[:-1], bounds[1:]) ]
+
+    out = numpy.empty((X.shape[0], len(specs)))
+    bykind = defaultdict(list)
+    for i, s in enumerate(specs):
+        bykind[type(s)].append(i)
+    for kind, inds in bykind.items():
+        out[:, inds] = kind.compute(X, [ specs[i] for i in inds ],
+                                    [ columns[i] for i in inds ])
+    return out
+
 class SetSig(GeneSetTrans):
 
     def __init__(self, **kwargs):
@@ -527,6 +716,11 @@ class ParametrizedTransformation(GeneSetTrans):
         
     def _use_par(self, ex, constructt):
         pass
+
+    def _batch_par(self, genes, constructt):
+        """ Return a batch specification (for :func:`batch_transform`) of
+        the feature on given genes or None if there is none. """
+        return None
     
     def build_feature(self, data, gs):
 
@@ -550,6 +744,7 @@ class ParametrizedTransformation(GeneSetTrans):
             return self._use_par(ex, constructt)
         
         at.get_value_from = t
+        at.batch = self._batch_par(takegenes, constructt)
         at.dbg = constructt #for debugging
         
         return at
@@ -577,6 +772,10 @@ class PLS(ParametrizedTransformation):
            TR[:,i] = t
 
         return TR[0][0]
+
+    def _batch_par(self, genes, constructt):
+        xmean, W, _, _ = constructt
+        return BatchLinear(genes, W[:,0], xmean) #the first component only
  
 def eigvturn(A):
     """ It multiplies rows (vectors of unit lengths) where 
@@ -609,8 +808,14 @@ class PCA(ParametrizedTransformation):
 
         return a
 
+    def _batch_par(self, genes, constructt):
+        evals, evect, xmean = constructt
+        return BatchLinear(genes, evect[0], xmean)
+
 class SimpleFun(GeneSetTrans):
 
+    batch_kind = None #batch specification class
+
     def build_feature(self, data, gs):
 
         at = Orange.feature.Continuous(name=str(gs))
@@ -625,16 +830,22 @@ class SimpleFun(GeneSetTrans):
             return self.fn(exvalues)
      
         at.get_value_from = t
+        if self.batch_kind is not None:
+            at.batch = self.batch_kind(gs.genes)
         return at
 
 class Mean(SimpleFun):
 
+    batch_kind = BatchMean
+
     def __init__(self, **kwargs):
        self.fn = numpy.mean
        super(Mean, self).__init__(**kwargs)
 
 class Median(SimpleFun):
 
+    batch_kind = BatchMedian
+
     def __init__(self, **kwargs):
        self.fn = numpy.median
        super(Median, self).__init__(**kwargs)
@@ -683,6 +894,7 @@ class GSA(GeneSetTrans):
                 return numpy.mean(exvalues)
 
             at.get_value_from = t
+            at.batch = BatchMean(consider_genes)
             attributes.append(at)
 
         return attributes
@@ -731,23 +943,103 @@ def compute_corg(data, inds, tscorecache):
         
     return sortedinds[:bg]
 
+def corg_search(X, y, inds, tscores):
+    """
+    Return CORG (as :func:`compute_corg`) for a gene set given by
+    column indices inds of the data matrix X (unknown values are nan)
+    with class value indices y and t-scores of all columns. Activity
+    score separations of all prefixes of the sorted member genes are
+    computed at once from cumulative sums.
+    """
+    if not len(inds):
+        return []
+    tscores = [ tscores[i] for i in inds ]
+    sortedinds = nth(sorted(zip(inds,tscores), key=lambda x: x[1], \
+        reverse=bool(numpy.mean(tscores) >= 0)), 0)
+
+    values = X[:, sortedinds]
+    activity = numpy.cumsum(numpy.where(numpy.isnan(values), 0.0, values), axis=1) \
+        / numpy.sqrt(numpy.arange(1, len(sortedinds)+1))
+    S = numpy.abs(obiExpression.t_test_columns(activity, y))
+
+    #greedy: prefixes grow while the separation improves
+    improves = S[1:] > S[:-1]
+    bg = len(sortedinds) if improves.all() else int(numpy.argmin(improves)) + 1
+    return sortedinds[:bg]
+
+#state of corg_search_many worker processes
+_corgShared = {}
+
+def _corgInit(X, y, tscores):
+    _corgShared.clear()
+    _corgShared["X"] = obiExpression.from_shared(X)
+    _corgShared["y"] = obiExpression.from_shared(y)
+    _corgShared["tscores"] = obiExpression.from_shared(tscores)
+
+def _corgBlock(members):
+    X, y, tscores = _corgShared["X"], _corgShared["y"], _corgShared["tscores"]
+    return [ corg_search(X, y, inds, tscores) for inds in members ]
+
+def corg_search_many(X, y, members, tscores=None, n_jobs=None, block=50):
+    """
+    Return CORGs for gene sets given by lists of column indices.
+    With n_jobs > 1 blocks of gene sets are searched in worker processes
+    which share the data matrix.
+    """
+    X = numpy.asarray(X, dtype=float)
+    if tscores is None:
+        tscores = obiExpression.t_test_columns(X, y)
+    members = list(members)
+    if not n_jobs or n_jobs == 1 or len(members) <= block:
+        return [ corg_search(X, y, inds, tscores) for inds in members ]
+
+    initargs = (obiExpression.shared_array(X), obiExpression.shared_array(y),
+                obiExpression.shared_array(tscores))
+    pool = multiprocessing.Pool(n_jobs, _corgInit, initargs)
+    try:
+        blocks = pool.imap(_corgBlock, [ members[i:i+block]
+                                         for i in range(0, len(members), block) ])
+        return [ corg for b in blocks for corg in b ]
+    finally:
+        pool.terminate()
+        _corgShared.clear()
+
 class CORGs(ParametrizedTransformation):
     """
     WARNING: input has to be z_ij table! each gene needs to be normalized
     (mean=0, stdev=1) for all samples.
+
+    CORGs of gene sets are searched with :func:`corg_search_many`
+    (in n_jobs processes, if given).
     """
 
-    def build_features(self, *args, **kwargs):
-        self.tscorecache = {} #reset a cache
-        return super(CORGs, self).build_features(*args, **kwargs)
+    def __init__(self, **kwargs):
+        self.n_jobs = kwargs.pop("n_jobs", None)
+        super(CORGs, self).__init__(**kwargs)
 
-    def build_feature(self, data, gs):
+    def build_features(self, data, gene_sets):
+        gene_sets = list(gene_sets)
+        X, y = obiExpression.expression_matrix(data)
+        tscores = obiExpression.t_test_columns(X, y) #once for all gene sets
+        matched = [ self._match_data(data, list(gs.genes), odic=True) for gs in gene_sets ]
+        members = [ [ name_ind[g] for g in genes ] for _, name_ind, genes, _, _ in matched ]
+        corgs = corg_search_many(X, y, members, tscores, n_jobs=self.n_jobs)
+        return [ self._corg_feature(gs, m[1], m[4], indices)
+                 for gs, m, indices in zip(gene_sets, matched, corgs) ]
+
+    def build_feature(self, data, gs, tscores=None):
+        """ tscores are t-scores of all attributes of data (computed
+        if not given). """
+        X, y = obiExpression.expression_matrix(data)
+        if tscores is None:
+            tscores = obiExpression.t_test_columns(X, y)
+        _, name_ind, genes, _, to_geneset = self._match_data(data, list(gs.genes), odic=True)
+        indices = corg_search(X, y, [ name_ind[g] for g in genes ], tscores)
+        return self._corg_feature(gs, name_ind, to_geneset, indices)
+
+    def _corg_feature(self, gs, name_ind, to_geneset, indices):
 
         at = Orange.feature.Continuous(name=str(gs))
-        geneset = list(gs.genes)
-
-        nm, name_ind, genes, takegenes, to_geneset = self._match_data(data, geneset, odic=True)
-        indices = compute_corg(data, [ name_ind[g] for g in genes ], self.tscorecache)
 
         ind_names = dict( (a,b) for b,a in name_ind.items() )
         selected_genes = sorted(set([to_geneset[ind_names[i]] for i in indices]))
@@ -758,6 +1050,8 @@ class CORGs(ParametrizedTransformation):
             return sum(v if v != '?' else 0.0 for v in exvalues)/len(corg)**0.5
      
         at.get_value_from = t
+        at.batch = BatchLinear(selected_genes,
+            numpy.ones(len(selected_genes))/len(selected_genes)**0.5)
         return at
 
 def compute_llr(data, inds, cache):
@@ -845,6 +1139,8 @@ class LLR(ParametrizedTransformation):
             return sum(vals)
      
         at.get_value_from = t
+        at.batch = BatchLLR(genes_gs, gausse,
+            [ self._normalizec[g] for g in genes_gs ] if self.normalize else None)
         return at
 
 class LLR_slow(ParametrizedTransformation):
@@ -944,6 +1240,13 @@ class SPCA(ParametrizedTransformation):
 
         return a
 
+    def _batch_par(self, genes, constructt):
+        select, constructt = constructt
+        if len(select) == 0:
+            return BatchLinear([], [])
+        evals, evect, xmean = constructt
+        return BatchLinear([ genes[i] for i in sorted(select) ], evect[0], xmean)
+
 def _shuffleClass(data, rand):
     """ Destructive! """
     locations = range(len(data))
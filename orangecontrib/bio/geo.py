@@ -4,6 +4,8 @@ import os
 import gzip
 import re
 import io
+import hashlib
+import warnings
 
 from collections import defaultdict
 
@@ -132,9 +134,17 @@ class GDS():
 
     :param force_download: Force the download.
 
+    :param cache: Keep the parsed data in a cache next to the data file
+      (the values are memory-mapped, so that processes using the same
+      data set share them).
+
     """
 
-    def __init__(self, gdsname, verbose=False, force_download=False):
+    #: Format of the parsed data cache. Increase on incompatible changes.
+    CACHE_FORMAT = 1
+
+    def __init__(self, gdsname, verbose=False, force_download=False,
+                 cache=True):
         self.gdsname = gdsname
         self.verbose = verbose
         self.force_download = force_download
@@ -142,16 +152,83 @@ class GDS():
         d = os.path.dirname(self.filename)
         if not os.path.exists(d):
             os.makedirs(d)
-        self._getinfo() # to get the info
+        self._download()
+        self._set_soft(self._load_soft(cache))
         taxid = taxonomy.search(self.info["sample_organism"], exact=True)
         self.info["taxid"] = taxid[0] if len(taxid)==1 else None
-        self._getspotmap() # to get gene->spot and spot->gene mapping
-        self.genes = sorted(self.gene2spots.keys())        
-        self.spots = sorted(self.spot2gene.keys())        
-        self.info["gene_count"] = len(self.genes)
-        self.gdsdata = None
         self.data = None
-        
+
+    def _read_soft(self):
+        """Parse the GDS data file in a single pass."""
+        f = gzip.open(self.filename, "rb")
+        if six.PY3:
+            f = io.TextIOWrapper(f, encoding=SOFT_ENCODING)
+        with f:
+            return parse_soft(f)
+
+    def _load_soft(self, cache=True):
+        """Return :class:`SOFTData` from the cache if it was made from
+        the current data file, otherwise parse the file (and cache it)."""
+        if not cache:
+            return self._read_soft()
+        checksum = _file_checksum(self.filename)
+        values_filename = self.filename + ".cache.npy"
+        meta_filename = self.filename + ".cache.pickle"
+        try:
+            with open(meta_filename, "rb") as f:
+                meta = pickle.load(f)
+            if meta["format"] == self.CACHE_FORMAT and \
+                    meta["checksum"] == checksum:
+                values = numpy.load(values_filename, mmap_mode="r")
+                return SOFTData(meta["info"], meta["spots"], meta["genes"],
+                                values)
+        except Exception:
+            pass
+
+        soft = self._read_soft()
+        meta = {"format": self.CACHE_FORMAT, "checksum": checksum,
+                "info": dict(soft.info), "spots": soft.spots,
+                "genes": soft.genes}
+        suffix = ".%i.tmp" % os.getpid()
+        try:
+            # values first: the metadata marks a complete cache
+            if os.path.exists(meta_filename):
+                os.remove(meta_filename)
+            with open(values_filename + suffix, "wb") as f:
+                numpy.save(f, soft.values)
+            os.rename(values_filename + suffix, values_filename)
+            with open(meta_filename + suffix, "wb") as f:
+                pickle.dump(meta, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(meta_filename + suffix, meta_filename)
+        except (IOError, OSError):
+            pass
+        return soft
+
+    def _set_soft(self, soft):
+        """Set the info, spot <-> gene mappings and values from
+        :func:`parse_soft` results."""
+        self.info = soft.info
+        # the last row of a spot is used, as in a spot -> row dictionary
+        rows = dict((spot, i) for i, spot in enumerate(soft.spots))
+        self.spots = sorted(rows)
+        self._spot_rows = numpy.array([rows[spot] for spot in self.spots],
+                                      dtype=int)
+        self.spot2gene = dict((spot, soft.genes[rows[spot]])
+                              for spot in self.spots)
+        self.gene2spots = defaultdict(list)
+        for spot in self.spots:
+            self.gene2spots[self.spot2gene[spot]].append(spot)
+        self.gene2spots = dict(self.gene2spots)
+        self.genes = sorted(self.gene2spots)
+        gene_index = dict((gene, i) for i, gene in enumerate(self.genes))
+        #: gene index of each spot (in self.spots order)
+        self._spot_genes = numpy.array(
+            [gene_index[self.spot2gene[spot]] for spot in self.spots],
+            dtype=int)
+        #: spots (file rows) x samples matrix of values (NaN for unknowns)
+        self._values = soft.values
+        self.info["gene_count"] = len(self.genes)
+
     def _download(self):
         """Download GDS data file if not in local cache or forced download requested."""
         localpath = serverfiles.localpath(DOMAIN)
@@ -171,82 +248,6 @@ class GDS():
                     f.read() #verify the download
                 os.rename(targetfn + "2", targetfn)
 
-    def _getinfo(self):
-        """Parse GDS data file and return a dictionary with info."""
-        getstate = lambda x: x.split(" ")[0][1:] 
-        getid = lambda x: x.rstrip().split(" ")[2]
-        self._download()
-        f = gzip.open(self.filename, "rb")
-        if six.PY3:
-            f = io.TextIOWrapper(f, encoding=SOFT_ENCODING)
-
-        state = None; previous_state = None
-    
-        info = {"subsets" : []}
-        subset = None
-    
-        # GDS information part
-        for line in f:
-            if line[0] == "^":
-                previous_state = state; state = getstate(line)
-                if state == "SUBSET":
-                    if subset:
-                        info["subsets"] += [subset]
-                    subset = {"id" : getid(line)}
-                if state == "DATASET":
-                    info["dataset_id"] = getid(line)
-                continue
-            if state == "DATASET":
-                if previous_state == "DATABASE":
-                    tag, value = tagvalue(line)
-                    info[tag] = value
-                else:
-                    if subset:
-                        info["subsets"] += [subset]
-                    break
-            if state == "SUBSET":
-                tag, value = tagvalue(line)
-                if tag == "description" or tag == "type":
-                    subset[tag] = value
-                if tag == "sample_id":
-                    subset[tag] = value.split(",")
-        for t,v in info.items():
-            if "count" in t:
-                info[t] = int(v)
-                
-        # sample information
-        state = None
-        for line in f:
-            if state == "header":
-                info["samples"] = line.rstrip().split("\t")[2:]
-                break
-            if line.startswith("!dataset_table_begin"):
-                state = "header"
-        self.info = info
-
-    def _getspotmap(self, include_spots=None):
-        """Return gene to spot and spot to genes mapings."""
-        f = gzip.open(self.filename, "rb")
-        if six.PY3:
-            f = io.TextIOWrapper(f, encoding=SOFT_ENCODING)
-        for line in f:
-            if line.startswith("!dataset_table_begin"):
-                break
-        f.readline() # skip header
-        spot2gene = {}
-        gene2spots = {}
-        for line in f:
-            if line.startswith("!dataset_table_end"):
-                break
-            spot, gene = line.rstrip().split("\t")[0:2]
-            if include_spots and (spot not in include_spots):
-                continue 
-            spot2gene[spot] = gene
-            gene2spots[gene] = gene2spots.get(gene, []) + [spot]
-    
-        self.spot2gene = spot2gene
-        self.gene2spots = gene2spots
-        
     def sample_annotations(self, sample_type=None):
         """Return a dictionary with sample annotation."""
         annotation = {}
@@ -267,35 +268,28 @@ class GDS():
         """Return a set of sample types."""
         return set([info["type"] for info in self.info["subsets"]])
     
-    def _parse_soft(self, remove_unknown=None):
-        """Parse GDS data, returns data dictionary."""
-        f = gzip.open(self.filename, "rb")
-        if six.PY3:
-            f = io.TextIOWrapper(f, encoding=SOFT_ENCODING)
+    def _values_for(self, report_genes, merge_function, remove_unknown):
+        """Return a (names, values matrix) pair for genes or spots."""
+        keep = numpy.ones(len(self.spots), dtype=bool)
+        if remove_unknown:
+            nsamples = max(self._values.shape[1], 1)
+            unknown = numpy.isnan(self._values).sum(axis=1)[self._spot_rows]
+            keep = unknown / float(nsamples) <= remove_unknown
+        values = self._values[self._spot_rows[keep]]
+        if not report_genes:
+            names = [spot for spot, k in zip(self.spots, keep) if k]
+            return names, values
+        merged, present = merge_spots(values, self._spot_genes[keep],
+                                      len(self.genes), merge_function)
+        names = [gene for gene, p in zip(self.genes, present) if p]
+        return names, merged[present]
 
-        mfloat = lambda x: float(x) if x != 'null' else compat.unknown
-    
-        data = {}
-        # find the start of the data part
-        for line in f:
-            if line.startswith("!dataset_table_begin"):
-                break
-        f.readline()
-        
-        # load data
-        for line in f:
-            if line.startswith("!dataset_table_end"):
-                break
-            d = line.rstrip().split("\t")
-            if remove_unknown and (float(d[2:].count('null')) / len(d[2:]) > remove_unknown):
-#                print "ZZZ", float(d[2:].count('null')) / len(d[2:]), d[2:]
-                continue 
-            data[d[0]] = GeneData(d[0], d[1], [mfloat(v) for v in d[2:]])
-        self.gdsdata = data
-    
     def _to_ExampleTable(self, report_genes=True, merge_function=spots_mean,
-                                sample_type=None, transpose=False):
+                                sample_type=None, transpose=False,
+                                remove_unknown=None):
         """Convert parsed GEO format to orange, save by genes or by spots."""
+        spots, X = self._values_for(report_genes, merge_function,
+                                    remove_unknown)
         if transpose: # samples in rows
             sample2class = self.sample_to_class(sample_type)
             cvalues = sorted(set(sample2class.values()))
@@ -314,25 +308,19 @@ class GDS():
                 sample_type = list(ad.keys())[0]
 
             classvar = DiscreteVariable(name=sample_type or "class", values=cvalues)
-            spots = self.genes if report_genes else self.spots
             atts = [ContinuousVariable(name=gene) for gene in spots]
     
             metasvar = [ DiscreteVariable(name=n, values=sorted(values)) 
                 for n,values in ad.items() if n != sample_type ]
 
-            X = []
             Y = []
             metas = []
-            for (i, sampleid) in enumerate(self.info["samples"]):
-                vals = [ ( (merge_function([self.gdsdata[spot].data[i] for spot in self.gene2spots[gene]]) )
-                         if report_genes else self.gdsdata[gene].data[i] ) 
-                         for gene in spots ]
-                X.append(vals)
+            for sampleid in self.info["samples"]:
                 Y.append(sample2class.get(sampleid, None))
                 metas.append([samp_ann[sampleid].get(n, None) for n,_ in ad.items() if n != sample_type ])
 
             domain = compat.create_domain(atts, classvar, metasvar)
-            return compat.create_table(domain, X, Y, metas)
+            return compat.create_table(domain, _table_rows(X.T), Y, metas)
 
         else: # genes in rows
             annotations = self.sample_annotations(sample_type)
@@ -342,19 +330,9 @@ class GDS():
 
             geneatname = "gene" if report_genes else "spot"
             metasvar = [ StringVariable(geneatname) ]
-            nameval = self.genes if report_genes else self.spots
-
-            X = []
-            metas = []
-            for g in nameval:
-                if report_genes:
-                    X.append(list(map(lambda *x: merge_function(x),
-                        *[self.gdsdata[spot].data for spot in self.gene2spots[g]])))
-                else:
-                    X.append(self.gdsdata[g].data)
-            metas = [ [a] for a in nameval]
+            metas = [ [a] for a in spots]
             domain = compat.create_domain(atts, None, metasvar)
-            return compat.create_table(domain, X, None, metas)
+            return compat.create_table(domain, _table_rows(X), None, metas)
 
     def getdata(self, report_genes=True, merge_function=spots_mean,
                  sample_type=None, transpose=False, remove_unknown=None):
@@ -382,16 +360,11 @@ class GDS():
           of samples with unknown values is above the threshold set by
           ``remove_unknown``. If None, nothing is removed.
         """
-        if self.verbose: print("Reading data ...")
-#        if not self.gdsdata:
-        self._parse_soft(remove_unknown = remove_unknown)
-#        if remove_unknown:
-            # some spots were filtered out, need to revise spot<>gene mappings
-        self._getspotmap(include_spots=set(self.gdsdata.keys()))
         if self.verbose: print("Converting to example table ...")
         self.data = self._to_ExampleTable(merge_function=merge_function,
                                           sample_type=sample_type, transpose=transpose,
-                                          report_genes=report_genes)
+                                          report_genes=report_genes,
+                                          remove_unknown=remove_unknown)
         return self.data
 
     def __str__(self):
@@ -405,6 +378,148 @@ class GDS():
                )
 
 
+def _file_checksum(filename):
+    md5 = hashlib.md5()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class SOFTData(object):
+    """Contents of a GDS SOFT file (see :func:`parse_soft`)."""
+    def __init__(self, info, spots, genes, values):
+        self.info = info
+        self.spots = spots
+        self.genes = genes
+        self.values = values
+
+
+def parse_soft(f):
+    """
+    Parse a GDS SOFT file (an iterator over lines) in a single pass and
+    return a :class:`SOFTData` with the data set info (including sample
+    ids), lists of spot ids and their genes (in file order) and a
+    spots x samples float matrix with NaN for null values.
+    """
+    getstate = lambda x: x.split(" ")[0][1:]
+    getid = lambda x: x.rstrip().split(" ")[2]
+
+    state = None; previous_state = None
+    info = {"subsets" : []}
+    subset = None
+    header_done = False
+
+    # GDS information part
+    for line in f:
+        if line.startswith("!dataset_table_begin"):
+            break
+        if header_done:
+            continue
+        if line[0] == "^":
+            previous_state = state; state = getstate(line)
+            if state == "SUBSET":
+                if subset:
+                    info["subsets"] += [subset]
+                subset = {"id" : getid(line)}
+            if state == "DATASET":
+                info["dataset_id"] = getid(line)
+            continue
+        if state == "DATASET":
+            if previous_state == "DATABASE":
+                tag, value = tagvalue(line)
+                info[tag] = value
+            else:
+                if subset:
+                    info["subsets"] += [subset]
+                    subset = None
+                header_done = True
+        if state == "SUBSET":
+            tag, value = tagvalue(line)
+            if tag == "description" or tag == "type":
+                subset[tag] = value
+            if tag == "sample_id":
+                subset[tag] = value.split(",")
+    if subset:
+        info["subsets"] += [subset]
+    for t,v in info.items():
+        if "count" in t:
+            info[t] = int(v)
+
+    info["samples"] = samples = next(f).rstrip().split("\t")[2:]
+    nsamples = len(samples)
+
+    # a preallocated matrix (grown if the feature count is wrong)
+    values = numpy.empty((max(info.get("feature_count", 0), 1), nsamples))
+    spots, genes = [], []
+    for line in f:
+        if line.startswith("!dataset_table_end"):
+            break
+        d = line.rstrip().split("\t", 2)
+        if len(spots) == len(values):
+            values = numpy.resize(values, (2 * len(values), nsamples))
+        row = values[len(spots)]
+        if len(d) > 2:
+            v = numpy.array(d[2].replace("null", "nan").split("\t"),
+                            dtype=float)
+            row[:len(v)] = v[:nsamples]
+            row[len(v):] = numpy.nan
+        else:
+            row[:] = numpy.nan
+        spots.append(d[0])
+        genes.append(d[1] if len(d) > 1 else "")
+    return SOFTData(info, spots, genes, values[:len(spots)])
+
+
+#: NumPy reductions equivalent to the spots_* merge functions.
+_NAN_REDUCTIONS = [(spots_mean, numpy.nanmean),
+                   (spots_median, numpy.nanmedian),
+                   (spots_min, numpy.nanmin),
+                   (spots_max, numpy.nanmax)]
+
+
+def merge_spots(values, groups, ngroups, merge_function=spots_mean):
+    """
+    Merge rows of `values` (spots x samples, NaN for unknowns) that
+    belong to the same group (`groups` are group indices of rows) with
+    `merge_function`. Return a (ngroups x samples matrix, mask of groups
+    with any rows) pair. The spots_* merge functions are computed with
+    grouped NumPy reductions, other functions are called for each group
+    and sample with a list of values.
+    """
+    groups = numpy.asarray(groups, dtype=int)
+    counts = numpy.bincount(groups, minlength=ngroups)
+    order = numpy.argsort(groups, kind="mergesort")
+    starts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+    merged = numpy.empty((ngroups, values.shape[1]))
+    merged.fill(numpy.nan)
+
+    reduction = [nanf for f, nanf in _NAN_REDUCTIONS if f is merge_function]
+    if reduction:
+        # groups of equal size are reduced together
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            for size in numpy.unique(counts[counts > 0]):
+                gs = numpy.flatnonzero(counts == size)
+                rows = order[starts[gs][:, None] + numpy.arange(size)]
+                merged[gs] = reduction[0](values[rows], axis=1)
+    else:
+        for g in numpy.flatnonzero(counts):
+            block = values[order[starts[g]:starts[g] + counts[g]]]
+            for i, column in enumerate(block.T):
+                v = merge_function([x if x == x else compat.unknown
+                                    for x in column])
+                merged[g, i] = numpy.nan if compat.isunknown(v) else v
+    return merged, counts > 0
+
+
+def _table_rows(X):
+    if compat.OR3:
+        return X
+    return [[v if v == v else compat.unknown for v in row]
+            for row in X.tolist()]
+
+
 def _float_or_na(x):
     if compat.isunknown(x):
         return compat.unknown
@@ -11,6 +11,8 @@ import tarfile
 import gzip
 import re
 import sys
+import sqlite3
+import threading
 import six
 
 try:
@@ -31,6 +33,14 @@ from gzip import GzipFile
 from collections import defaultdict
 from operator import attrgetter
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+import numpy
+import scipy.sparse
+
 from orangecontrib.bio.utils import progress_bar_milestones
 
 try:
@@ -297,6 +307,9 @@ class Ontology(object):
         self.alias_mapper = {}
         self.reverse_alias_mapper = defaultdict(set)
         self.header = ""
+        self._index = None
+        self._index_filename = None
+        self._slims_cache = (None, {})
 
         if filename is not None:
             self.parse_file(filename, progress_callback)
@@ -341,6 +354,14 @@ class Ontology(object):
         object. The optional progressCallback will be called with a single
         argument to report on the progress.
         """
+        self._index = None
+        self._index_filename = None
+        if isinstance(file, basestring) and os.path.isfile(file):
+            stat = os.stat(file)
+            self._index_filename = file + ".index.npz"
+            self._index_version = "%s.%i.%i" % (
+                OntologyIndex.FORMAT, stat.st_size, int(stat.st_mtime))
+
         if isinstance(file, basestring):
             if os.path.isfile(file) and tarfile.is_tarfile(file):
                 f = tarfile.open(file).extractfile("gene_ontology_edit.obo")
@@ -435,18 +456,27 @@ class Ontology(object):
         :param str term: Term ID.
 
         """
-        queue = set([term])
-        visited = set()
-        slims = set()
-        while queue:
-            term = queue.pop()
-            visited.add(term)
-            if term in self.slims_subset:
-                slims.add(term)
-            else:
-                queue.update(set(tid for _, tid in self[term].related) -
-                             visited)
-        return slims
+        index = self.index
+        i = index.term_index[self[term].id]
+        subset, cache = self._slims_cache
+        if subset != self.slims_subset:
+            subset = frozenset(self.slims_subset)
+            cache = {}
+            self._slims_cache = (subset, cache)
+
+        if term in subset:
+            return set([term])
+        # slims reachable through non slim terms, computed for all
+        # super terms (parents come first in the topological order)
+        ancestors = index.ancestors(i)
+        for j in ancestors[numpy.argsort(index.order_position[ancestors])]:
+            if j not in cache:
+                if index.term_ids[j] in subset:
+                    cache[j] = frozenset([index.term_ids[j]])
+                else:
+                    cache[j] = frozenset().union(
+                        *[cache.get(p, ()) for p in index.parents(j)])
+        return set(cache[i])
 
     def extract_super_graph(self, terms):
         """
@@ -456,14 +486,7 @@ class Ontology(object):
 
         """
         terms = [terms] if isinstance(terms, basestring) else terms
-        visited = set()
-        queue = set(terms)
-        while queue:
-            term = queue.pop()
-            visited.add(term)
-            queue.update(set(tid for _, tid in self[term].related) -
-                         visited)
-        return visited
+        return self._extract_graph(terms, self.index.ancestors)
 
     def extract_sub_graph(self, terms):
         """
@@ -472,28 +495,53 @@ class Ontology(object):
         :param list terms: A list of term IDs.
 
         """
-        terms = [terms] if type(terms) == str else terms
-        visited = set()
-        queue = set(terms)
-        while queue:
-            term = queue.pop()
-            visited.add(term)
-            queue.update(set(tid for _, tid in self[term].related_to) -
-                         visited)
+        terms = [terms] if isinstance(terms, basestring) else terms
+        return self._extract_graph(terms, self.index.descendants)
+
+    def _extract_graph(self, terms, related):
+        index = self.index
+        indices = set()
+        visited = set(terms)
+        for term in terms:
+            i = index.term_index[self[term].id]
+            if term in self.terms:
+                indices.update(related(i))
+            else:
+                # an alternative id stands in for its primary term
+                indices.update(j for j in related(i) if j != i)
+        visited.update(index.term_ids[i] for i in indices)
         return visited
 
-    def term_depth(self, term, cache_={}):
+    def term_depth(self, term):
         """
         Return the minimum depth of a `term`.
 
         (length of the shortest path to this term from the top level term).
 
         """
-        if term not in cache_:
-            cache_[term] = min([self.term_depth(parent) + 1
-                                for _, parent in self[term].related] or
-                               [1])
-        return cache_[term]
+        index = self.index
+        return int(index.depth[index.term_index[self[term].id]])
+
+    @property
+    def index(self):
+        """
+        :class:`OntologyIndex` of the terms. It is built on first use
+        and cached next to the ontology file.
+        """
+        if self._index is None:
+            term_ids = sorted(self.terms)
+            index = None
+            if self._index_filename is not None:
+                index = OntologyIndex.load(self._index_filename,
+                                           self._index_version, term_ids)
+            if index is None:
+                index = OntologyIndex(
+                    term_ids,
+                    [[p for _, p in self.terms[t].related] for t in term_ids])
+                if self._index_filename is not None:
+                    index.save(self._index_filename, self._index_version)
+            self._index = index
+        return self._index
 
     def __getitem__(self, termid):
         """
@@ -569,6 +617,150 @@ class Ontology(object):
 
 from collections import namedtuple
 
+class OntologyIndex(object):
+    """
+    An integer index of ontology terms (`term_ids` are sorted term ids)
+    with a topological order (super terms before sub terms), minimal
+    term depths and ancestor and descendant closures stored as CSR
+    arrays (each term is included in its own closures).
+
+    :param list term_ids: Sorted term ids.
+    :param list parents: A list of parent term ids for each term.
+
+    """
+    #: Format of the cached index. Increase on incompatible changes.
+    FORMAT = "1"
+
+    _ARRAYS = ["parents_indptr", "parents_indices", "order", "depth",
+               "ancestors_indptr", "ancestors_indices",
+               "descendants_indptr", "descendants_indices"]
+
+    def __init__(self, term_ids, parents=None, arrays=None):
+        self.term_ids = list(term_ids)
+        self.term_index = dict((t, i) for i, t in enumerate(self.term_ids))
+        if arrays is None:
+            arrays = self._build(parents)
+        for name in self._ARRAYS:
+            setattr(self, name, arrays[name])
+        self.order_position = numpy.empty(len(self.order), dtype=int)
+        self.order_position[self.order] = numpy.arange(len(self.order))
+
+    def _build(self, parents):
+        n = len(self.term_ids)
+        parents = [sorted(set(self.term_index[p] for p in ps))
+                   for ps in parents]
+        children = [[] for _ in range(n)]
+        for i, ps in enumerate(parents):
+            for p in ps:
+                children[p].append(i)
+
+        # Kahn's algorithm; terms on cycles (if any) are appended last
+        missing = [len(ps) for ps in parents]
+        order = [i for i in range(n) if not missing[i]]
+        for i in order:
+            for c in children[i]:
+                missing[c] -= 1
+                if not missing[c]:
+                    order.append(c)
+        if len(order) < n:
+            done = set(order)
+            order.extend(i for i in range(n) if i not in done)
+
+        depth = numpy.ones(n, dtype=numpy.int32)
+        ancestors = [None] * n
+        for i in order:
+            closure = set([i])
+            for p in parents[i]:
+                if ancestors[p] is None:  # on a cycle
+                    closure.update(self._reachable(p, parents))
+                else:
+                    closure.update(ancestors[p])
+            ancestors[i] = closure
+            if parents[i]:
+                depth[i] = min(depth[p] for p in parents[i]) + 1
+
+        def csr(lists):
+            indptr = numpy.zeros(n + 1, dtype=numpy.int64)
+            indptr[1:] = numpy.cumsum([len(l) for l in lists])
+            indices = numpy.zeros(indptr[-1], dtype=numpy.int32)
+            for i, l in enumerate(lists):
+                indices[indptr[i]:indptr[i + 1]] = sorted(l)
+            return indptr, indices
+
+        ancestors = csr(ancestors)
+        matrix = scipy.sparse.csr_matrix(
+            (numpy.ones(len(ancestors[1]), dtype=numpy.int8),
+             ancestors[1], ancestors[0]), shape=(n, n))
+        transposed = matrix.T.tocsr()
+        transposed.sort_indices()
+        parents = csr(parents)
+        return {"parents_indptr": parents[0],
+                "parents_indices": parents[1],
+                "order": numpy.array(order, dtype=numpy.int32),
+                "depth": depth,
+                "ancestors_indptr": ancestors[0],
+                "ancestors_indices": ancestors[1],
+                "descendants_indptr": transposed.indptr.astype(numpy.int64),
+                "descendants_indices":
+                    transposed.indices.astype(numpy.int32)}
+
+    @staticmethod
+    def _reachable(i, parents):
+        visited = set([i])
+        queue = [i]
+        while queue:
+            for p in parents[queue.pop()]:
+                if p not in visited:
+                    visited.add(p)
+                    queue.append(p)
+        return visited
+
+    def parents(self, i):
+        """ Return an array of indices of parents of the `i`-th term. """
+        return self.parents_indices[
+            self.parents_indptr[i]:self.parents_indptr[i + 1]]
+
+    def ancestors(self, i):
+        """ Return an array of indices of the `i`-th term and its
+        super terms. """
+        return self.ancestors_indices[
+            self.ancestors_indptr[i]:self.ancestors_indptr[i + 1]]
+
+    def descendants(self, i):
+        """ Return an array of indices of the `i`-th term and its
+        sub terms. """
+        return self.descendants_indices[
+            self.descendants_indptr[i]:self.descendants_indptr[i + 1]]
+
+    @classmethod
+    def load(cls, filename, version, term_ids):
+        """ Load a cached index for `version` of `term_ids` or return None.
+        """
+        try:
+            with numpy.load(filename) as f:
+                if str(f["version"]) != version or \
+                        list(f["term_ids"]) != term_ids:
+                    return None
+                arrays = dict((name, f[name]) for name in cls._ARRAYS)
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+        return cls(term_ids, arrays=arrays)
+
+    def save(self, filename, version):
+        """ Cache the index in `filename` (failures are ignored). """
+        tmpname = "%s.%i.tmp.npz" % (filename, os.getpid())
+        arrays = dict((name, getattr(self, name)) for name in self._ARRAYS)
+        try:
+            numpy.savez(tmpname, version=numpy.array(version),
+                        term_ids=numpy.array(self.term_ids, dtype=six.text_type),
+                        **arrays)
+            if os.path.exists(filename):
+                os.remove(filename)
+            os.rename(tmpname, filename)
+        except (IOError, OSError):
+            pass
+
+
 _AnnotationRecordBase = namedtuple(
     "AnnotationRecord",
     annotationFields
@@ -751,6 +943,7 @@ class Annotations(object):
         """Set the ontology to use in the annotations mapping.
         """
         self.all_annotations = defaultdict(list)
+        self._term_incidence_cache = {}
         self._ontology = ontology
 
     def get_ontology(self):
@@ -798,19 +991,7 @@ class Annotations(object):
             - an open file-like object of the association file
 
         """
-        if isinstance(file, basestring):
-            if os.path.isfile(file) and tarfile.is_tarfile(file):
-                f = tarfile.open(file).extractfile("gene_association")
-            elif os.path.isfile(file) and file.endswith(".gz"):
-                f = gzip.open(file)
-            elif os.path.isfile(file):
-                f = open(file)
-            elif os.path.isdir(file):
-                f = open(os.path.join(file, "gene_association"))
-            else:
-                raise ValueError("Cannot open %r for parsing." % file)
-        else:
-            f = file
+        f = _open_annotations(file)
         lines = [line.decode() if not isinstance(line, str) else line for line in f.readlines()]
 
         milestones = progress_bar_milestones(len(lines), 100)
@@ -837,6 +1018,7 @@ class Annotations(object):
         self.annotations.append(a)
         self.term_anotations[a.GOId].append(a)
         self.all_annotations = defaultdict(list)
+        self._term_incidence_cache = {}
 
         self._gene_names_dict = None
         self._gene_names = None
@@ -880,30 +1062,17 @@ class Annotations(object):
 
         return dict([(alias(gene), gene) for gene in genes if alias(gene)])
 
-    def _collect_annotations(self, id, visited):
-        """ Recursive function collects and caches all annotations for id
-        """
-        if id not in self.all_annotations and id not in visited:
-            if id in self.ontology.reverse_alias_mapper:
-                annotations = [self.term_anotations.get(alt_id, [])
-                               for alt_id in
-                               self.ontology.reverse_alias_mapper[id]] + \
-                              [self.term_anotations[id]]
-            else:
-                ## annotations for this term alone
-                annotations = [self.term_anotations[id]]
-            visited.add(id)
-            for typeId, child in self.ontology[id].related_to:
-                aa = self._collect_annotations(child, visited)
-                if type(aa) == set:
-                    ## if it was already reduced in get_all_annotations
-                    annotations.append(aa)
-                else:
-                    annotations.extend(aa)
-            self.all_annotations[id] = annotations
-        return self.all_annotations[id]
-
-    _CollectAnnotations = _collect_annotations
+    def _sub_terms(self, id):
+        """ Return ids (with alternative ids) of `id` and its subterms. """
+        self._ensure_ontology()
+        ontology = self.ontology
+        index = ontology.index
+        terms = set()
+        for i in index.descendants(index.term_index[ontology[id].id]):
+            term = index.term_ids[i]
+            terms.add(term)
+            terms.update(ontology.reverse_alias_mapper.get(term, ()))
+        return terms
 
     def get_all_annotations(self, id):
         """ Return a set of all annotations (instances of :obj:`AnnotationRecord`)
@@ -914,11 +1083,10 @@ class Annotations(object):
         """
         self._ensure_ontology()
         id = self.ontology.alias_mapper.get(id, id)
-        if id not in self.all_annotations or \
-                type(self.all_annotations[id]) == list:
+        if id not in self.all_annotations:
             annot_set = set()
-            for annots in self._collect_annotations(id, set()):
-                annot_set.update(annots)
+            for term in self._sub_terms(id):
+                annot_set.update(self.term_anotations.get(term, ()))
             self.all_annotations[id] = annot_set
         return self.all_annotations[id]
 
@@ -1033,6 +1201,187 @@ class Annotations(object):
                         zip(res, stats.FDR([p for _, (_, p, _) in res]))])
         return res
 
+    def _term_incidence(self, evidence_codes, aspects):
+        """ Return a (gene_index, term_ids, matrix) tuple where `matrix` is
+        a sparse gene x term incidence matrix of all annotations with
+        `evidence_codes` and `aspects`, propagated to all super terms.
+        The matrices are cached for each evidence code/aspect combination.
+        """
+        key = (frozenset(evidence_codes), frozenset(aspects))
+        if key in self._term_incidence_cache:
+            return self._term_incidence_cache[key]
+        gene_terms = self._gene_terms(evidence_codes, aspects)
+
+        self._ensure_ontology()
+        ontology = self.ontology
+        index = ontology.index
+        term_ids = index.term_ids
+
+        gene_index = dict((gene, i) for i, (gene, _) in enumerate(gene_terms))
+        rows, cols = [], []
+        missing = set()
+        for row, (gene, go_ids) in enumerate(gene_terms):
+            indices = set()
+            for go_id in go_ids:
+                term = ontology.alias_mapper.get(go_id, go_id)
+                if term in ontology.terms:
+                    indices.update(index.ancestors(index.term_index[term]))
+                else:
+                    missing.add(go_id)
+            rows.extend([row] * len(indices))
+            cols.extend(indices)
+
+        if missing:
+            warnings.warn("%s terms in the annotations were not found in the "
+                          "ontology." % ",".join(map(repr, missing)),
+                          UserWarning)
+
+        matrix = scipy.sparse.csr_matrix(
+            (numpy.ones(len(rows), dtype=numpy.int32), (rows, cols)),
+            shape=(len(gene_terms), len(term_ids))
+        )
+        self._term_incidence_cache[key] = (gene_index, term_ids, matrix)
+        return self._term_incidence_cache[key]
+
+    def _gene_terms(self, evidence_codes, aspects):
+        """ Return a list of (gene, GO ids) pairs, sorted by gene, with
+        ids of terms directly annotated with `evidence_codes` and `aspects`.
+        """
+        return [(gene, [ann.GO_ID for ann in self.gene_annotations[gene]
+                        if ann.Evidence_Code in evidence_codes and
+                        ann.Aspect in aspects])
+                for gene in sorted(self.gene_annotations)]
+
+    def get_enriched_terms_batch(self, gene_lists, reference=None,
+                                 evidence_codes=None, slims_only=False,
+                                 aspect=None, prob=stats.Binomial(),
+                                 use_fdr=True, progress_callback=None):
+        """ Return a list of enriched terms dictionaries, one for each list
+        of genes in `gene_lists`. The dictionaries have the same structure
+        as the ones returned by :func:`get_enriched_terms` (with the
+        same parameters), but all lists are scored together using
+        a precomputed sparse gene x term incidence matrix.
+
+        Annotations to alternative term ids are counted under the primary
+        term id.
+
+        :param gene_lists: A list of gene lists.
+        :param reference:
+            List of genes (if None all genes included in the annotations
+            will be used).
+        :param evidence_codes: List of evidence codes to consider.
+        :param slims_only: If `True` return only slim terms.
+        :param aspect:
+            Which aspects to use. Use all by default. "P", "F", "C"
+            or a set containing these elements.
+
+        """
+        if aspect == None:
+            aspects_set = set(["P", "C", "F"])
+        elif isinstance(aspect, basestring):
+            aspects_set = set([aspect])
+        else:
+            aspects_set = set(aspect)
+
+        evidence_codes = set(evidence_codes or evidenceDict.keys())
+
+        self._ensure_ontology()
+        if slims_only and not self.ontology.slims_subset:
+            warnings.warn("Unspecified slims subset in the ontology! "
+                          "Using 'goslim_generic' subset", UserWarning)
+            self.ontology.set_slims_subset("goslim_generic")
+
+        gene_index, term_ids, matrix = \
+            self._term_incidence(evidence_codes, aspects_set)
+
+        if reference:
+            reference = set(self.get_gene_names_translator(reference).keys())
+        else:
+            reference = self.gene_names
+
+        in_reference = numpy.zeros(len(gene_index), dtype=bool)
+        in_reference[[gene_index[g] for g in reference
+                      if g in gene_index]] = True
+        ref_counts = matrix.T.dot(in_reference.astype(numpy.int32))
+
+        if slims_only:
+            selected = numpy.array([term in self.ontology.slims_subset
+                                    for term in term_ids], dtype=bool)
+        else:
+            selected = numpy.ones(len(term_ids), dtype=bool)
+
+        translators = []
+        rows, cols, ref_rows, ref_cols = [], [], [], []
+        for i, genes in enumerate(gene_lists):
+            translator = self.get_gene_names_translator(genes)
+            translators.append(translator)
+            indices = [gene_index[g] for g in translator if g in gene_index]
+            ref_indices = [j for j in indices if in_reference[j]]
+            rows.extend([i] * len(indices))
+            cols.extend(indices)
+            ref_rows.extend([i] * len(ref_indices))
+            ref_cols.extend(ref_indices)
+
+        shape = (len(translators), len(gene_index))
+        queries = scipy.sparse.csr_matrix(
+            (numpy.ones(len(rows), dtype=numpy.int32), (rows, cols)),
+            shape=shape)
+        ref_queries = scipy.sparse.csr_matrix(
+            (numpy.ones(len(ref_rows), dtype=numpy.int32),
+             (ref_rows, ref_cols)),
+            shape=shape)
+
+        # Terms annotated (directly or through a sub term) by any of the
+        # query genes, and their counts among the reference query genes.
+        annotated = queries.dot(matrix).tocsr()
+        annotated.sort_indices()
+        counts = ref_queries.dot(matrix).tocsr()
+
+        term_columns, k, m, n = [], [], [], []
+        for i, translator in enumerate(translators):
+            columns = annotated.indices[
+                annotated.indptr[i]:annotated.indptr[i + 1]]
+            columns = columns[selected[columns]]
+            row_counts = numpy.asarray(counts[i, columns].todense()).ravel() \
+                if len(columns) else numpy.zeros(0, dtype=int)
+            term_columns.append(columns)
+            k.append(row_counts)
+            m.append(ref_counts[columns])
+            n.append(numpy.repeat(len(translator), len(columns)))
+
+        if term_columns:
+            p_values = _p_values(prob, numpy.concatenate(k), len(reference),
+                                 numpy.concatenate(m), numpy.concatenate(n))
+        else:
+            p_values = numpy.zeros(0)
+
+        milestones = progress_bar_milestones(len(translators), 100)
+        results = []
+        offset = 0
+        for i, translator in enumerate(translators):
+            columns = term_columns[i]
+            pvals = p_values[offset: offset + len(columns)]
+            offset += len(columns)
+            if use_fdr:
+                pvals = stats.FDR(list(pvals))
+
+            ref_genes = sorted((gene_index[g], g) for g in translator
+                               if g in gene_index and
+                               in_reference[gene_index[g]])
+            members = matrix[[j for j, _ in ref_genes]][:, columns].tocsc()
+            res = {}
+            for j, col in enumerate(columns):
+                mapped = members.indices[
+                    members.indptr[j]:members.indptr[j + 1]]
+                res[term_ids[col]] = (
+                    [translator[ref_genes[r][1]] for r in mapped],
+                    float(pvals[j]), int(ref_counts[col]))
+            results.append(res)
+
+            if progress_callback and i in milestones:
+                progress_callback(100.0 * i / len(translators))
+        return results
+
     def get_annotated_terms(self, genes, direct_annotation_only=False,
                             evidence_codes=None, progress_callback=None):
         """Return all terms that are annotated by genes with evidence_codes.
@@ -1203,6 +1552,543 @@ class Annotations(object):
 
     DownloadAnnotationsAtRev = download_annotations_at_rev
 
+def _open_annotations(file):
+    """ Return an open annotations file. `file` can be:
+        - a tarball containing the association file named gene_association
+        - a directory name containing the association file named
+          gene_association
+        - a path to the actual (possibly gzipped) association file
+        - an open file-like object of the association file
+    """
+    if isinstance(file, basestring):
+        if os.path.isfile(file) and tarfile.is_tarfile(file):
+            return tarfile.open(file).extractfile("gene_association")
+        elif os.path.isfile(file) and file.endswith(".gz"):
+            return gzip.open(file)
+        elif os.path.isfile(file):
+            return open(file)
+        elif os.path.isdir(file):
+            return open(os.path.join(file, "gene_association"))
+        else:
+            raise ValueError("Cannot open %r for parsing." % file)
+    else:
+        return file
+
+
+class AnnotationIndex(object):
+    """
+    An on-disk (SQLite) store of annotation records indexed by gene
+    name and GO term id. Records are loaded only when they are queried.
+
+    The index file only contains the records of the annotations file it
+    was built from. Records added with :func:`add` are kept in temporary
+    tables of this instance's connection and are not seen by others.
+    """
+
+    #: Format of the index file. Increase on incompatible changes.
+    FORMAT = "1"
+
+    #: Maximum number of SQL variables in a single query.
+    MAX_VARIABLES = 500
+
+    #: Number of records inserted with a single executemany.
+    INSERT_CHUNK = 10000
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(filename, timeout=15,
+                                    check_same_thread=False)
+        self._con.text_factory = str
+        self._con.execute("PRAGMA mmap_size=268435456")
+        self._overlay = False
+        self.version = self._info("version")
+        self.header = self._info("header") or ""
+
+    def _info(self, key):
+        row = self._con.execute(
+            "SELECT value FROM info WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @classmethod
+    def open(cls, filename, version, source, progress_callback=None):
+        """
+        Open the index in `filename`. If it does not exist or was built
+        for a different `version` rebuild it from the annotations file
+        `source` (see :func:`Annotations.parse_file`).
+        """
+        if os.path.exists(filename):
+            try:
+                index = cls(filename)
+                if index._info("format") == cls.FORMAT and \
+                        index.version == version:
+                    return index
+                index.close()
+            except sqlite3.DatabaseError:
+                pass
+        return cls.build(filename, version, source, progress_callback)
+
+    @classmethod
+    def build(cls, filename, version, source, progress_callback=None):
+        """
+        Build an index of annotations from the file `source` in
+        `filename` and return it.
+        """
+        f = _open_annotations(source)
+        tmpname = "%s.%i.tmp" % (filename, os.getpid())
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        con = sqlite3.connect(tmpname)
+        con.text_factory = str
+        header = []
+        try:
+            con.execute("PRAGMA journal_mode=OFF")
+            con.execute("PRAGMA synchronous=OFF")
+            con.execute("CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT)")
+            cls._create_tables(con)
+
+            def records():
+                for i, line in enumerate(f):
+                    if not isinstance(line, str):
+                        line = line.decode()
+                    if line.startswith("!"):
+                        header.append(line + "\n")
+                        continue
+                    yield AnnotationRecord.from_string(line)
+                    if progress_callback and i % 10000 == 0:
+                        progress_callback(i)
+
+            cls._insert(con, records())
+            con.execute("CREATE INDEX gene_index ON annotations (gene)")
+            con.execute("CREATE INDEX term_index ON annotations (term)")
+            con.executemany("INSERT INTO info VALUES (?, ?)",
+                            [("format", cls.FORMAT), ("version", version),
+                             ("header", "".join(header))])
+            con.commit()
+        finally:
+            con.close()
+            if isinstance(source, basestring):
+                f.close()
+
+        if os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmpname, filename)
+        return cls(filename)
+
+    @staticmethod
+    def _create_tables(con):
+        con.execute("CREATE TABLE annotations (id INTEGER PRIMARY KEY, "
+                    "gene TEXT, term TEXT, evidence TEXT, aspect TEXT, "
+                    "record TEXT)")
+        con.execute("CREATE TABLE aliases (alias TEXT, gene TEXT)")
+
+    @classmethod
+    def _insert(cls, con, records, annotations="annotations",
+                aliases="aliases"):
+        """ Insert records (skipping those :func:`Annotations.add_annotation`
+        would skip) and their gene aliases into tables `annotations` and
+        `aliases` in chunks of :obj:`INSERT_CHUNK` records.
+        """
+        rows, alias_rows = [], []
+
+        def flush():
+            con.executemany("INSERT INTO %s (gene, term, evidence, aspect, "
+                            "record) VALUES (?, ?, ?, ?, ?)" % annotations,
+                            rows)
+            con.executemany("INSERT INTO %s VALUES (?, ?)" % aliases,
+                            alias_rows)
+            del rows[:], alias_rows[:]
+
+        for a in records:
+            if not a.geneName or not a.GOId or a.Qualifier == "NOT":
+                continue
+            rows.append((a.geneName, a.GOId, a.Evidence_Code, a.Aspect,
+                         "\t".join(a)))
+            alias_rows.extend((alias, a.geneName) for alias in
+                              a.alias + [a.geneName, a.DB_Object_ID])
+            if len(rows) >= cls.INSERT_CHUNK:
+                flush()
+        flush()
+
+    def close(self):
+        self._con.close()
+
+    def _query(self, query, args=()):
+        with self._lock:
+            return self._con.execute(query, args).fetchall()
+
+    def _query_in(self, query, values, args=()):
+        """ Run `query` with an "IN (%s)" placeholder for each chunk of
+        `values` and return all rows.
+        """
+        values = list(values)
+        rows = []
+        with self._lock:
+            for start in range(0, len(values), self.MAX_VARIABLES):
+                chunk = values[start: start + self.MAX_VARIABLES]
+                rows.extend(self._con.execute(
+                    query % ", ".join(["?"] * len(chunk)),
+                    tuple(chunk) + tuple(args)))
+        return rows
+
+    def _create_overlay(self):
+        """ Create temporary tables for added records and a temporary
+        view, which shadows the annotations table in queries, of all
+        records.
+        """
+        con = self._con
+        last = con.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM main.annotations").fetchone()[0]
+        con.execute("CREATE TEMP TABLE added_annotations (id INTEGER "
+                    "PRIMARY KEY, gene TEXT, term TEXT, evidence TEXT, "
+                    "aspect TEXT, record TEXT)")
+        con.execute("CREATE TEMP TABLE added_aliases (alias TEXT, gene TEXT)")
+        con.execute("CREATE INDEX temp.added_gene_index "
+                    "ON added_annotations (gene)")
+        con.execute("CREATE INDEX temp.added_term_index "
+                    "ON added_annotations (term)")
+        # added records follow the indexed ones
+        con.execute("CREATE TEMP VIEW annotations AS "
+                    "SELECT * FROM main.annotations UNION ALL "
+                    "SELECT id + %i, gene, term, evidence, aspect, record "
+                    "FROM temp.added_annotations" % last)
+        self._overlay = True
+
+    def add(self, records):
+        """ Add annotation records to this instance (the index file is
+        not changed). """
+        with self._lock:
+            if not self._overlay:
+                self._create_overlay()
+            self._insert(self._con, records, "temp.added_annotations",
+                         "temp.added_aliases")
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM annotations")[0][0]
+
+    def record(self, index):
+        """ Return the `index`-th record. """
+        # records are never removed, so ids (of indexed and added records)
+        # are consecutive from 1
+        rows = self._query("SELECT record FROM annotations WHERE id = ?",
+                           (index + 1,))
+        if not rows:
+            raise IndexError(index)
+        return AnnotationRecord.from_string(rows[0][0])
+
+    def records(self, chunk_size=10000):
+        """ Iterate over all records (loaded in chunks). """
+        last = 0
+        while True:
+            rows = self._query("SELECT id, record FROM annotations "
+                               "WHERE id > ? ORDER BY id LIMIT ?",
+                               (last, chunk_size))
+            if not rows:
+                break
+            for _, record in rows:
+                yield AnnotationRecord.from_string(record)
+            last = rows[-1][0]
+
+    def keys(self, column):
+        """ Return a list of distinct values of "gene" or "term" column. """
+        return [key for key, in self._query(
+            "SELECT DISTINCT %s FROM annotations" % column)]
+
+    def contains(self, column, key):
+        return bool(self._query(
+            "SELECT 1 FROM annotations WHERE %s=? LIMIT 1" % column, (key,)))
+
+    def lookup(self, column, keys):
+        """ Return a dictionary of lists of records for `keys` of the
+        "gene" or "term" column.
+        """
+        found = defaultdict(list)
+        for key, record in self._query_in(
+                "SELECT %s, record FROM annotations WHERE %s IN (%%s) "
+                "ORDER BY id" % (column, column), set(keys)):
+            found[key].append(AnnotationRecord.from_string(record))
+        return found
+
+    def genes(self, terms, evidence_codes):
+        """ Return a set of genes annotated to `terms` with `evidence_codes`.
+        """
+        evidence_codes = sorted(evidence_codes)
+        return set(gene for gene, in self._query_in(
+            "SELECT DISTINCT gene FROM annotations WHERE term IN (%%s) "
+            "AND evidence IN (%s)" % ", ".join(["?"] * len(evidence_codes)),
+            sorted(terms), evidence_codes))
+
+    def gene_terms(self, evidence_codes, aspects):
+        """ Return a dictionary of lists of GO ids annotated to genes with
+        `evidence_codes` and `aspects`.
+        """
+        evidence_codes = sorted(evidence_codes)
+        found = defaultdict(list)
+        for gene, term in self._query_in(
+                "SELECT gene, term FROM annotations WHERE evidence IN (%%s) "
+                "AND aspect IN (%s)" % ", ".join(["?"] * len(aspects)),
+                evidence_codes, sorted(aspects)):
+            found[gene].append(term)
+        return found
+
+    def aliases(self):
+        """ Return a list of (alias, gene) pairs in insertion order. """
+        aliases = self._query("SELECT alias, gene FROM main.aliases "
+                              "ORDER BY rowid")
+        if self._overlay:
+            aliases.extend(self._query("SELECT alias, gene FROM "
+                                       "temp.added_aliases ORDER BY rowid"))
+        return aliases
+
+
+class _AnnotationMap(Mapping):
+    """ A read-only mapping of genes or term ids (`column`) to lists of
+    records in :class:`AnnotationIndex`, loaded and cached per key.
+    Missing keys map to an empty list.
+    """
+    def __init__(self, index, column):
+        self.index = index
+        self.column = column
+        self._cache = {}
+
+    def load(self, keys):
+        """ Load records for `keys` with a single query. """
+        keys = set(keys) - set(self._cache)
+        if keys:
+            found = self.index.lookup(self.column, keys)
+            self._cache.update((key, found.get(key, [])) for key in keys)
+
+    def __getitem__(self, key):
+        if key not in self._cache:
+            self.load([key])
+        return self._cache[key]
+
+    def __contains__(self, key):
+        return bool(self._cache.get(key)) or \
+            self.index.contains(self.column, key)
+
+    def __iter__(self):
+        return iter(self.index.keys(self.column))
+
+    def __len__(self):
+        return len(self.index.keys(self.column))
+
+
+class IndexedAnnotations(Annotations):
+    """
+    :class:`Annotations` backed by an on-disk :class:`AnnotationIndex`.
+    The index is built once from the annotations file and rebuilt when
+    the file (or the organism's annotations on the server) changes;
+    afterwards annotations are loaded lazily per gene or term.
+
+    :param str filename_or_organism:
+        A filename of a GAF formated annotations file or an organism
+        specifier.
+    :param str filename:
+        Index file name (by default the annotations file name with
+        an added ".sqlite" extension).
+    :param bool rebuild: Force rebuilding of the index.
+
+    Added (and remapped) annotations are kept with this instance only;
+    the index always matches the annotations file.
+
+    .. note:: :func:`get_enriched_terms` is computed with
+        :func:`get_enriched_terms_batch`, which counts annotations to
+        alternative GO ids under their primary ids. (The in-memory
+        :func:`Annotations.get_enriched_terms` reports them under the
+        alternative ids.)
+    """
+
+    def __init__(self, filename_or_organism, ontology=None, genematcher=None,
+                 progress_callback=None, filename=None, rebuild=False):
+        self.ontology = ontology
+        self._gene_names = None
+        self._gene_names_dict = None
+        self._alias_mapper = None
+        self.genematcher = genematcher
+        self.taxid = None
+
+        if os.path.exists(filename_or_organism):
+            source = filename_or_organism
+            stat = os.stat(source)
+            version = "v%i.%i.%i" % (self.version, stat.st_size,
+                                     int(stat.st_mtime))
+        else:
+            code = organism_name_search(filename_or_organism)
+            source = serverfiles.localpath_download(
+                "GO", "gene_association.%s.tar.gz" % code)
+            version = self.organism_version(code)
+            self.taxid = to_taxid(code).pop()
+
+        if filename is None:
+            filename = source + ".sqlite"
+        if rebuild:
+            self.index = AnnotationIndex.build(
+                filename, version, source, progress_callback)
+        else:
+            self.index = AnnotationIndex.open(
+                filename, version, source, progress_callback)
+        self.header = self.index.header
+        self._reset()
+
+        if not self.genematcher and self.taxid:
+            matchers = [obiGene.GMGO(self.taxid)]
+            if self.taxid == "352472":
+                matchers.extend(
+                    [obiGene.GMDicty(),
+                     [obiGene.GMGO(self.taxid), obiGene.GMDicty()]]
+                )
+            self.genematcher = obiGene.matcher(matchers)
+
+        if self.genematcher:
+            self.genematcher.set_targets(self.gene_names)
+
+    def _reset(self):
+        #: Lazy mapping of gene names to lists of their annotations.
+        self.gene_annotations = _AnnotationMap(self.index, "gene")
+        #: Lazy mapping of GO term ids to lists of annotations.
+        self.term_anotations = _AnnotationMap(self.index, "term")
+        self.all_annotations = defaultdict(list)
+        self._term_incidence_cache = {}
+        self._gene_names_dict = None
+        self._gene_names = None
+        self._alias_mapper = None
+
+    @property
+    def annotations(self):
+        """ A list of all annotation records (loaded on each access). """
+        return list(self.index.records())
+
+    def parse_file(self, file, progress_callback=None):
+        """ Parse the annotations from file (see
+        :func:`Annotations.parse_file`) and add them to this instance
+        (the index file is not changed).
+        """
+        f = _open_annotations(file)
+        lines = [line.decode() if not isinstance(line, str) else line for line in f.readlines()]
+
+        def records():
+            milestones = progress_bar_milestones(len(lines), 100)
+            for i, line in enumerate(lines):
+                if line.startswith("!"):
+                    self.header = self.header + line + "\n"
+                    continue
+                yield AnnotationRecord.from_string(line)
+
+                if progress_callback and i in milestones:
+                    progress_callback(100.0 * i / len(lines))
+
+        self.extend(records())
+
+    def add_annotation(self, a):
+        if not isinstance(a, AnnotationRecord):
+            a = AnnotationRecord(a)
+        self.index.add([a])
+        self._reset()
+
+    def extend(self, lines):
+        self.index.add(a if isinstance(a, AnnotationRecord)
+                       else AnnotationRecord(a) for a in lines)
+        self._reset()
+
+    @property
+    def gene_names(self):
+        if self._gene_names is None:
+            self._gene_names = set(self.index.keys("gene"))
+        return self._gene_names
+
+    @property
+    def alias_mapper(self):
+        if self._alias_mapper is None:
+            self._alias_mapper = dict(self.index.aliases())
+        return self._alias_mapper
+
+    def get_all_annotations(self, id):
+        self._ensure_ontology()
+        id = self.ontology.alias_mapper.get(id, id)
+        if id not in self.all_annotations:
+            found = self.index.lookup("term", self._sub_terms(id))
+            self.all_annotations[id] = \
+                set(ann for anns in found.values() for ann in anns)
+        return self.all_annotations[id]
+
+    def get_all_genes(self, id, evidence_codes=None):
+        evidence_codes = set(evidence_codes or evidenceDict.keys())
+        return list(self.index.genes(self._sub_terms(id), evidence_codes))
+
+    def get_enriched_terms(self, genes, reference=None, evidence_codes=None,
+                           slims_only=False, aspect=None,
+                           prob=stats.Binomial(), use_fdr=True,
+                           progress_callback=None):
+        """ Return a dictionary of enriched terms (see
+        :func:`Annotations.get_enriched_terms`), computed with
+        :func:`get_enriched_terms_batch`.
+        """
+        return self.get_enriched_terms_batch(
+            [genes], reference=reference, evidence_codes=evidence_codes,
+            slims_only=slims_only, aspect=aspect, prob=prob,
+            use_fdr=use_fdr, progress_callback=progress_callback)[0]
+
+    def get_annotated_terms(self, genes, direct_annotation_only=False,
+                            evidence_codes=None, progress_callback=None):
+        genes = [genes] if type(genes) == str else genes
+        self.gene_annotations.load(self.get_gene_names_translator(genes))
+        return Annotations.get_annotated_terms(
+            self, genes, direct_annotation_only=direct_annotation_only,
+            evidence_codes=evidence_codes,
+            progress_callback=progress_callback)
+
+    def _gene_terms(self, evidence_codes, aspects):
+        found = self.index.gene_terms(evidence_codes, aspects)
+        return [(gene, found.get(gene, [])) for gene in sorted(self.gene_names)]
+
+    def __contains__(self, item):
+        return item in self.gene_annotations[item.geneName]
+
+    def __iter__(self):
+        return self.index.records()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.index.record(i)
+                    for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return self.index.record(index)
+
+    def __getslice__(self, start, stop):
+        return self[max(start, 0):max(stop, 0)]
+
+    def remap_genes(self, map):
+        # as Annotations.remap_genes, with the remapped records added
+        # in one batch
+        found = self.index.lookup("gene", map)
+        self.extend(ann._replace(DB_Object_Symbol=name)
+                    for gene in map for ann in found.get(gene, [])
+                    for name in map[gene])
+        self.genematcher = obiGene.GMDirect()
+        self._gene_names = None
+        self.genematcher.set_targets(self.gene_names)
+
+
+def _p_values(prob, k, N, m, n):
+    """ Return an array of `prob.p_value(k[i], N, m[i], n[i])` for all i.
+    """
+    if hasattr(prob, "p_value_array"):
+        return prob.p_value_array(k, N, m, n)
+    # Evaluate each distinct (k, m, n) combination only once.
+    tests = numpy.column_stack([k, m, n]).astype(int)
+    if not len(tests):
+        return numpy.zeros(0)
+    unique, inverse = numpy.unique(tests, axis=0, return_inverse=True)
+    p_values = numpy.array([prob.p_value(int(k_), N, int(m_), int(n_))
+                            for k_, m_, n_ in unique], dtype=float)
+    return p_values[inverse.ravel()]
+
+
 from orangecontrib.bio.taxonomy import pickled_cache
 
 
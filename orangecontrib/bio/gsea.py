@@ -3,8 +3,10 @@ from __future__ import absolute_import
 from collections import defaultdict
 import random
 import time
+import multiprocessing
 
 import numpy
+import scipy.sparse
 
 import orange
 import Orange
@@ -38,6 +40,9 @@ def rankingFromOrangeMeas(meas):
     results in a list. Ranking function is build out of 
     orange.MeasureAttribute.
     """
+    if hasattr(meas, "scores"):
+        #scores all attributes at once (as MA_anova)
+        return meas.scores
     return lambda d: [ meas(i,d) for i in range(len(d.domain.attributes)) ]
 
 def orderedPointersCorr(lcor):
@@ -140,6 +145,226 @@ def enrichmentScoreRanked(subset, lcor, ordered, p=1.0, rev2=None):
     """
     return (maxSum if abs(maxSum) > abs(minSum) else minSum, [])
 
+def geneSetMembership(subsets, ngenes):
+    """
+    Return a sparse gene set membership matrix (scipy.sparse.csr_matrix)
+    with a row for each subset (a list of attribute indices) and
+    a column for each of ngenes attributes.
+    """
+    subsets = [ sorted(set(subset)) for subset in subsets ]
+    rows = [ i for i,subset in enumerate(subsets) for _ in subset ]
+    cols = [ a for subset in subsets for a in subset ]
+    membership = scipy.sparse.csr_matrix(
+        (numpy.ones(len(rows)), (rows, cols)), shape=(len(subsets), ngenes))
+    membership.sort_indices()
+    return membership
+
+def enrichmentScoresBatch(subsets, rankings, p=1.0, chunk_size=2**22, callback=None):
+    """
+    Return enrichment scores of all subsets for all rankings as an
+    array of shape (number of rankings, number of subsets). The results
+    match enrichmentScoreRanked for each ranking and subset.
+
+    subsets: a list of attribute index lists or a membership matrix
+        from geneSetMembership.
+    rankings: a 2-D array, each row contains correlations with
+        class for each attribute.
+    chunk_size: maximum number of elements in intermediate arrays (rankings
+        are processed in chunks of rows).
+    callback: called once for each processed ranking.
+    """
+    rankings = numpy.atleast_2d(numpy.asarray(rankings, dtype=float))
+    nrankings, ngenes = rankings.shape
+
+    if scipy.sparse.issparse(subsets):
+        membership = subsets
+    else:
+        membership = geneSetMembership(subsets, ngenes)
+
+    nsets = membership.shape[0]
+    sizes = numpy.diff(membership.indptr)
+    genes = membership.indices
+    setids = numpy.repeat(numpy.arange(nsets), sizes)
+    nonempty = sizes > 0
+    starts = membership.indptr[:-1][nonempty]
+    lasts = membership.indptr[1:][nonempty] - 1
+    #number of preceding hits of a hit within its set (hits are sorted by
+    #position within each set)
+    hitnum = numpy.arange(len(genes)) - membership.indptr[:-1][setids]
+
+    with numpy.errstate(divide="ignore"):
+        notInA = 1. / (ngenes - sizes) #subtract if gene is not in the subset
+
+    es = numpy.zeros((nrankings, nsets))
+    if not len(genes):
+        for _ in range(nrankings):
+            runOptCallbacks(callback)
+        return es
+
+    rows = max(1, chunk_size // max(ngenes, len(genes)))
+
+    for begin in range(0, nrankings, rows):
+        lcor = rankings[begin:begin+rows]
+
+        #positions of attributes in orderedPointersCorr
+        ordered = numpy.argsort(-lcor, axis=1, kind="mergesort")
+        rev2 = numpy.argsort(ordered, axis=1)
+
+        cors = numpy.abs(lcor)**p
+        sumcors = numpy.asarray(membership.dot(cors.T)).T
+
+        #hits sorted by ordered position within each set
+        hitpos = rev2[:, genes]
+        sort = numpy.argsort(setids*ngenes + hitpos, axis=1, kind="mergesort")
+        hitpos = numpy.take_along_axis(hitpos, sort, axis=1)
+        hitcors = numpy.take_along_axis(cors[:, genes], sort, axis=1)
+
+        #running sums of hit weights within each set (segmented cumsum)
+        csum = numpy.cumsum(hitcors, axis=1)
+        base = numpy.zeros(sumcors.shape)
+        base[:, nonempty] = csum[:, starts] - hitcors[:, starts]
+        after = csum - base[:, setids]
+        before = after - hitcors
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            inAb = 1. / sumcors
+            misses = (hitpos - hitnum) * notInA[setids]
+            after = after * inAb[:, setids] - misses
+            before = before * inAb[:, setids] - misses
+            #finish it: running sum after the last gene
+            finish = after[:, lasts] - \
+                (ngenes - 1 - hitpos[:, lasts]) * notInA[nonempty]
+
+        maxSum = numpy.maximum(numpy.maximum.reduceat(after, starts, axis=1), 0.0)
+        minSum = numpy.minimum(numpy.minimum.reduceat(before, starts, axis=1), 0.0)
+        minSum = numpy.minimum(minSum, finish)
+
+        chunk = numpy.where(numpy.abs(maxSum) > numpy.abs(minSum), maxSum, minSum)
+        chunk[sumcors[:, nonempty] == 0.0] = 0.0 #this should not happen
+        es[begin:begin+len(lcor), nonempty] = chunk
+
+        for _ in range(len(lcor)):
+            runOptCallbacks(callback)
+
+    return es
+
+def gseaBatch(lcor, subsets, n, permuted, callback=None, chunk_size=2**22):
+    """
+    Return enrichment scores and null distributions (n scores for each
+    subset) computed with enrichmentScoresBatch. Function permuted(i)
+    returns the ranking for i-th permutation.
+    """
+    membership = geneSetMembership(subsets, len(lcor))
+
+    enrichmentScores = list(enrichmentScoresBatch(membership, [lcor])[0])
+    runOptCallbacks(callback)
+
+    rows = max(1, chunk_size // max(len(lcor), membership.nnz))
+
+    nulls = [ numpy.zeros((0, len(subsets))) ]
+    for begin in range(0, n, rows):
+        r2 = [ permuted(i) for i in range(begin, min(n, begin+rows)) ]
+        nulls.append(enrichmentScoresBatch(membership, r2,
+            chunk_size=chunk_size, callback=callback))
+
+    enrichmentNulls = numpy.vstack(nulls).T.tolist()
+    return enrichmentScores, enrichmentNulls
+
+#state of gseaParallel worker processes
+_gseaShared = {}
+
+def _gseaInit(lcor, X, y, subsets, chunk_size):
+    """
+    Initialize a worker with shared arrays (see shared_array).
+    """
+    _gseaShared.clear()
+    _gseaShared["lcor"] = from_shared(lcor)
+    _gseaShared["X"] = from_shared(X) if X is not None else None
+    _gseaShared["y"] = from_shared(y) if y is not None else None
+    _gseaShared["membership"] = geneSetMembership(subsets,
+        len(_gseaShared["lcor"]))
+    _gseaShared["chunk_size"] = chunk_size
+
+def _gseaBlock(task):
+    """
+    Score permutations begin, ..., end-1. Rankings are either given or
+    computed from the shared data with fixed permutation seeds.
+    """
+    begin, end, rankings = task
+    if rankings is None:
+        lcor, X, y = _gseaShared["lcor"], _gseaShared["X"], _gseaShared["y"]
+        rankings = []
+        for i in range(begin, end):
+            locations = list(range(len(y) if X is not None else len(lcor)))
+            random.Random(2000+i).shuffle(locations)
+            if X is not None: #permute class values as shuffleClass
+                y2 = numpy.empty_like(y)
+                y2[locations] = y
+                rankings.append(signalToNoise(X, y2))
+            else: #as shuffleList
+                rankings.append(lcor[locations])
+    return begin, end, enrichmentScoresBatch(_gseaShared["membership"],
+        rankings, chunk_size=_gseaShared["chunk_size"])
+
+def gseaParallel(lcor, subsets, n, n_jobs, data=None, rankingf=None,
+        permutation="gene", callback=None, chunk_size=2**22):
+    """
+    Return enrichment scores and null distributions (as gseaBatch) with
+    blocks of permutations scored in n_jobs worker processes. Results
+    do not depend on the number of workers and callbacks are
+    called in order, once per permutation.
+
+    With permutation == "class" and no rankingf the expression matrix
+    of data is shared with the workers, which rank genes with
+    signalToNoise (which agrees with MA_signalToNoise, the ranking of
+    the observed data). A custom rankingf is not passed to the workers:
+    its permuted rankings are computed serially in this process (while
+    the workers score previous blocks) and only scored in parallel.
+    """
+    lcor = numpy.asarray(lcor, dtype=float)
+    membership = geneSetMembership(subsets, len(lcor))
+
+    enrichmentScores = list(enrichmentScoresBatch(membership, [lcor])[0])
+    runOptCallbacks(callback)
+
+    X = y = None
+    if permutation == "class" and not rankingf:
+        X, y = expression_matrix(data)
+        X, y = shared_array(X), shared_array(y)
+    initargs = (shared_array(lcor), X, y, subsets, chunk_size)
+
+    rows = max(1, chunk_size // max(len(lcor), membership.nnz))
+    def tasks():
+        for begin in range(0, n, rows):
+            end = min(n, begin+rows)
+            if permutation == "class" and rankingf:
+                yield begin, end, numpy.array([ rankingf(shuffleClass(data, 2000+i))
+                    for i in range(begin, end) ])
+            else:
+                yield begin, end, None
+
+    pool = None
+    if n_jobs == 1:
+        _gseaInit(*initargs)
+        results = map(_gseaBlock, tasks())
+    else:
+        pool = multiprocessing.Pool(n_jobs, _gseaInit, initargs)
+        results = pool.imap(_gseaBlock, tasks())
+
+    nulls = [ numpy.zeros((0, len(subsets))) ]
+    try:
+        for begin, end, es in results:
+            nulls.append(es)
+            for _ in range(end - begin):
+                runOptCallbacks(callback)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        _gseaShared.clear()
+
+    enrichmentNulls = numpy.vstack(nulls).T.tolist()
+    return enrichmentScores, enrichmentNulls
+
 #from mOrngData
 def shuffleAttribute(data, attribute, locations):
     """
@@ -217,7 +442,8 @@ def enrichmentScore(data, subset, rankingf):
     return es,l
 
 def gseaE(data, subsets, rankingf=None, \
-        n=100, permutation="class", callback=None):
+        n=100, permutation="class", callback=None, engine="python",
+        n_jobs=None):
     """
     Run GSEA algorithm on an example table.
 
@@ -228,9 +454,15 @@ def gseaE(data, subsets, rankingf=None, \
     n: number of random permutations to sample null distribution.
     permutation: "class" for permutating class, else permutate attribute 
         order.
+    engine: "python" scores each subset and permutation separately,
+        "numpy" scores all of them with enrichmentScoresBatch.
+    n_jobs: if given, score permutations with gseaParallel in n_jobs
+        processes (implies the "numpy" engine).
 
     """
 
+    customRanking = rankingf
+
     if not rankingf:
         rankingf=rankingFromOrangeMeas(MA_signalToNoise())
 
@@ -239,6 +471,23 @@ def gseaE(data, subsets, rankingf=None, \
     lcor = rankingf(data)
     #print lcor
 
+    if n_jobs is not None:
+        enrichmentScores, enrichmentNulls = gseaParallel(lcor, subsets, n,
+            n_jobs, data=data, rankingf=customRanking if iset(data) else rankingf,
+            permutation=permutation, callback=callback)
+        return gseaSignificance(enrichmentScores, enrichmentNulls)
+
+    if engine == "numpy":
+        def permuted(i):
+            if permutation == "class":
+                return rankingf(shuffleClass(data, 2000+i)) #fixed permutation
+            else:
+                return shuffleList(lcor, random.Random(2000+i))
+
+        enrichmentScores, enrichmentNulls = \
+            gseaBatch(lcor, subsets, n, permuted, callback=callback)
+        return gseaSignificance(enrichmentScores, enrichmentNulls)
+
     ordered = orderedPointersCorr(lcor)
 
     def rev(l):
@@ -282,9 +531,22 @@ def runOptCallbacks(callback):
         except:
             callback()            
 
-def gseaR(rankings, subsets, n, callback=None):
+def gseaR(rankings, subsets, n, callback=None, engine="python", n_jobs=None):
     """
     """
+    if n_jobs is not None:
+        enrichmentScores, enrichmentNulls = gseaParallel(rankings, subsets,
+            n, n_jobs, permutation="gene", callback=callback)
+        return gseaSignificance(enrichmentScores, enrichmentNulls)
+
+    if engine == "numpy":
+        def permuted(i):
+            return shuffleList(rankings, random.Random(2000+i))
+
+        enrichmentScores, enrichmentNulls = \
+            gseaBatch(rankings, subsets, n, permuted, callback=callback)
+        return gseaSignificance(enrichmentScores, enrichmentNulls)
+
     enrichmentScores = []
     ordered = orderedPointersCorr(rankings)
     
@@ -895,10 +1157,12 @@ class GSEA(object):
         to a self.genesets: key is genesetname, it's values are individual
         genes and match results.
         """
-        for g in obiGeneSets.GeneSets(genesets):
-            genes = g.genes
-            datamatch = filter(lambda x: x[1] != None, 
-                [ (gene, self.gm.umatch(gene)) for gene in genes])
+        genesets = list(obiGeneSets.GeneSets(genesets))
+        allgenes = list(set(gene for g in genesets for gene in g.genes))
+        matched = dict(zip(allgenes, self.gm.umatch_many(allgenes)))
+        for g in genesets:
+            datamatch = [ (gene, matched[gene]) for gene in g.genes
+                          if matched[gene] != None ]
             self.genesets[g] = datamatch
 
     def selectGenesets(self, minSize=3, maxSize=1000, minPart=0.1):
@@ -930,7 +1194,14 @@ class GSEA(object):
         """
         return dict( (gs, self.genesIndices(nth(self.genesets[gs],1))) for gs in gsets)
 
-    def compute(self, minSize=3, maxSize=1000, minPart=0.1, n=100, callback=None, rankingf=None, permutation="class"):
+    def compute(self, minSize=3, maxSize=1000, minPart=0.1, n=100, callback=None, rankingf=None, permutation="class", engine="python", n_jobs=None):
+        """
+        Compute enrichment of selected gene sets. Parameter engine selects
+        the permutation engine: "python" (default) or "numpy", which
+        scores all gene sets and permutations with shared rank matrices.
+        If n_jobs is given, permutations are scored in that many
+        processes (see gseaParallel).
+        """
 
         subsetsok = self.selectGenesets(minSize=minSize, maxSize=maxSize, minPart=minPart)
 
@@ -944,10 +1215,10 @@ class GSEA(object):
             return {} # quick return if no genesets
 
         if len(itOrFirst(self.data)) > 1:
-            gseal = gseaE(self.data, nth(gsetsnumit,1), n=n, callback=callback, permutation=permutation, rankingf=rankingf)
+            gseal = gseaE(self.data, nth(gsetsnumit,1), n=n, callback=callback, permutation=permutation, rankingf=rankingf, engine=engine, n_jobs=n_jobs)
         else:
             rankings = [ self.data[0][at].native() for at in self.data.domain.attributes ]
-            gseal = gseaR(rankings, nth(gsetsnumit,1), n, callback=None)
+            gseal = gseaR(rankings, nth(gsetsnumit,1), n, callback=None, engine=engine, n_jobs=n_jobs)
 
         res = {}
 
@@ -58,6 +58,10 @@ from itertools import chain
 from datetime import datetime
 from contextlib import contextmanager
 
+import numpy
+import scipy.sparse
+import six
+
 from orangecontrib.bio import utils, taxonomy
 from orangecontrib.bio.utils import progress_bar_milestones
 from orangecontrib.bio.kegg import databases
@@ -66,6 +70,7 @@ from orangecontrib.bio.kegg import entry
 from orangecontrib.bio.kegg.brite import BriteEntry, Brite
 
 from orangecontrib.bio.kegg import api
+from orangecontrib.bio.kegg import caching
 from orangecontrib.bio.kegg import conf
 from orangecontrib.bio.kegg import pathway
 
@@ -86,6 +91,155 @@ KEGGPathway = pathway.Pathway
 DEFAULT_CACHE_DIR = conf.params["cache.path"]
 
 
+class PathwayIndex(object):
+    """
+    An index of pathway membership of an organism's genes: a sparse
+    pathways x genes incidence `matrix` over the sorted `pathway_ids`
+    and `gene_ids`.
+
+    :param list links: (gene id, pathway id) tuples (as returned by
+        :func:`api.KeggApi.get_genes_pathway_organism`).
+
+    """
+    #: Format of the cached index. Increase on incompatible changes.
+    FORMAT = "1"
+
+    def __init__(self, links=None, gene_ids=None, pathway_ids=None,
+                 indptr=None, indices=None):
+        if links is not None:
+            links = set(map(tuple, links))
+            gene_ids = sorted(set(g for g, _ in links))
+            pathway_ids = sorted(set(p for _, p in links))
+        self.gene_ids = list(gene_ids)
+        self.pathway_ids = list(pathway_ids)
+        self.gene_index = dict((g, i) for i, g in enumerate(self.gene_ids))
+        self.pathway_index = dict((p, i)
+                                  for i, p in enumerate(self.pathway_ids))
+        shape = (len(self.pathway_ids), len(self.gene_ids))
+        if links is not None:
+            rows = [self.pathway_index[p] for _, p in links]
+            cols = [self.gene_index[g] for g, _ in links]
+            self.matrix = scipy.sparse.csr_matrix(
+                (numpy.ones(len(rows), dtype=numpy.int32), (rows, cols)),
+                shape=shape)
+        else:
+            self.matrix = scipy.sparse.csr_matrix(
+                (numpy.ones(len(indices), dtype=numpy.int32), indices,
+                 indptr), shape=shape)
+        self.matrix.sort_indices()
+
+    def genes(self, pathway_id):
+        """ Return a list of genes in `pathway_id`. """
+        i = self.pathway_index[pathway_id]
+        m = self.matrix
+        return [self.gene_ids[j]
+                for j in m.indices[m.indptr[i]:m.indptr[i + 1]]]
+
+    def pathways(self, gene_ids):
+        """
+        Return a sorted list of pathways including all `gene_ids` (an empty
+        list if `gene_ids` is empty).
+        """
+        cols = [self.gene_index.get(g) for g in set(gene_ids)]
+        if not cols or None in cols:
+            return []
+        counts = numpy.asarray(self.matrix[:, cols].sum(axis=1)).ravel()
+        return [self.pathway_ids[i]
+                for i in numpy.flatnonzero(counts == len(cols))]
+
+    def _incidence(self, gene_lists):
+        """
+        Return a sparse gene lists x genes matrix counting the occurrences
+        of the indexed genes in each of `gene_lists`.
+        """
+        rows, cols = [], []
+        for i, genes in enumerate(gene_lists):
+            for g in genes:
+                j = self.gene_index.get(g)
+                if j is not None:
+                    rows.append(i)
+                    cols.append(j)
+        return scipy.sparse.csr_matrix(
+            (numpy.ones(len(rows), dtype=numpy.int32), (rows, cols)),
+            shape=(len(gene_lists), len(self.gene_ids)))
+
+    def enrichment(self, gene_lists, reference, prob=utils.stats.Binomial(),
+                   callback=None):
+        """
+        Return a list of dictionaries (one for each of `gene_lists`) with
+        pathway ids as keys and (list_of_genes, p_value,
+        num_of_reference_genes) tuples as items for all pathways including
+        at least one gene of the list. The pathway counts of all lists
+        are computed at once and the p-values with a single
+        `prob.p_value_array` call (if available).
+
+        """
+        gene_lists = [list(genes) for genes in gene_lists]
+        reference = set(reference)
+        counts = self._incidence(gene_lists).dot(self.matrix.T).tocoo()
+        in_reference = numpy.array([g in reference for g in self.gene_ids],
+                                   dtype=numpy.int32)
+        ref_counts = self.matrix.dot(in_reference)
+
+        lists, paths, k = counts.row, counts.col, counts.data
+        N = len(reference)
+        m = ref_counts[paths]
+        n = numpy.array([len(genes) for genes in gene_lists])[lists]
+        if hasattr(prob, "p_value_array"):
+            p_values = prob.p_value_array(k, N, m, n) if len(k) else []
+        else:
+            p_values = [prob.p_value(*args) for args in
+                        zip(k, [N] * len(k), m, n)]
+
+        results = [{} for _ in gene_lists]
+        p_value = dict(zip(zip(lists, paths), p_values))
+        by_gene = self.matrix.T.tocsr()
+        for i, genes in enumerate(gene_lists):
+            members = defaultdict(list)
+            for g in genes:
+                j = self.gene_index.get(g)
+                if j is not None:
+                    for path in by_gene.indices[by_gene.indptr[j]:
+                                                by_gene.indptr[j + 1]]:
+                        members[path].append(g)
+            for path, path_genes in members.items():
+                results[i][self.pathway_ids[path]] = (
+                    path_genes, float(p_value[i, path]),
+                    int(ref_counts[path]))
+            if callback:
+                callback(100.0 * (i + 1) / len(gene_lists))
+        return results
+
+    @classmethod
+    def load(cls, filename, version):
+        """ Load a cached index for `version` or return None. """
+        try:
+            with numpy.load(filename) as f:
+                if str(f["version"]) != version:
+                    return None
+                return cls(gene_ids=list(f["gene_ids"]),
+                           pathway_ids=list(f["pathway_ids"]),
+                           indptr=f["indptr"], indices=f["indices"])
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+
+    def save(self, filename, version):
+        """ Cache the index in `filename` (failures are ignored). """
+        tmpname = "%s.%i.tmp.npz" % (filename, os.getpid())
+        try:
+            numpy.savez(
+                tmpname, version=numpy.array(version),
+                gene_ids=numpy.array(self.gene_ids, dtype=six.text_type),
+                pathway_ids=numpy.array(self.pathway_ids,
+                                        dtype=six.text_type),
+                indptr=self.matrix.indptr, indices=self.matrix.indices)
+            if os.path.exists(filename):
+                os.remove(filename)
+            os.rename(tmpname, filename)
+        except (IOError, OSError):
+            pass
+
+
 class Organism(object):
     """
     A convenience class for retrieving information regarding an
@@ -158,13 +312,36 @@ class Organism(object):
 
     def pathways(self, with_ids=None):
         """
-        Return a list of all pathways for this organism.
+        Return a list of all pathways for this organism (or, if `with_ids`
+        is not None, only of the pathways including all genes in
+        `with_ids`; none for an empty `with_ids`).
         """
         if with_ids is not None:
-            return self.api.get_pathways_by_genes(with_ids)
+            return self.pathway_index.pathways(with_ids)
         else:
             return [p.entry_id for p in self.api.list_pathways(self.org_code)]
 
+    @property
+    def pathway_index(self):
+        """
+        A :class:`PathwayIndex` of this organism's genes. It is built on
+        first use and cached for the current KEGG release.
+        """
+        if getattr(self, "_pathway_index", None) is None:
+            release = "%s %s" % (PathwayIndex.FORMAT,
+                                 self.api.info(self.org_code).release)
+            path = conf.params["cache.path"]
+            caching.touch_dir(path)
+            filename = os.path.join(path, "%s_pathway_index.npz" %
+                                    self.org_code)
+            index = PathwayIndex.load(filename, release)
+            if index is None:
+                index = PathwayIndex(
+                    self.api.get_genes_pathway_organism(self.org_code))
+                index.save(filename, release)
+            self._pathway_index = index
+        return self._pathway_index
+
     def list_pathways(self):
         """
         List all pathways for this organism.
@@ -189,40 +366,22 @@ class Organism(object):
         and (list_of_genes, p_value, num_of_reference_genes) tuples
         as items.
 
+        """
+        return self.get_enriched_pathways_batch(
+            [genes], reference, prob, callback)[0]
+
+    def get_enriched_pathways_batch(self, gene_lists, reference=None,
+                                    prob=utils.stats.Binomial(),
+                                    callback=None):
+        """
+        Return a list of :func:`get_enriched_pathways` results for each
+        of `gene_lists`, computed together from the :obj:`pathway_index`.
+
         """
         if reference is None:
             reference = self.genes.keys()
-        reference = set(reference)
-
-        allPathways = defaultdict(lambda: [[], 1.0, []])
-        milestones = progress_bar_milestones(len(genes), 100)
-        pathways_db = KEGGPathways()
-
-        pathways_for_gene = []
-        for i, gene in enumerate(genes):
-            pathways_for_gene.append(self.pathways([gene]))
-            if callback and i in milestones:
-                callback(i * 50.0 / len(genes))
-
-        # pre-cache for speed
-        pathways_db.pre_cache([pid for pfg in pathways_for_gene
-                               for pid in pfg])
-        for i, (gene, pathways) in enumerate(zip(genes, pathways_for_gene)):
-            for pathway in pathways:
-                if pathways_db.get_entry(pathway).gene:
-                    allPathways[pathway][0].append(gene)
-            if callback and i in milestones:
-                callback(50.0 + i * 50.0 / len(genes))
-
-        pItems = allPathways.items()
-
-        for i, (p_id, entry) in enumerate(pItems):
-            pathway = pathways_db.get_entry(p_id)
-            entry[2].extend(reference.intersection(pathway.gene or []))
-            entry[1] = prob.p_value(len(entry[0]), len(reference),
-                                    len(entry[2]), len(genes))
-        return dict([(pid, (genes, p, len(ref)))
-                     for pid, (genes, p, ref) in allPathways.items()])
+        return self.pathway_index.enrichment(
+            gene_lists, reference, prob, callback=callback)
 
     def get_genes_by_enzyme(self, enzyme):
         enzyme = KEGGEnzyme().get_entry(enzyme)
@@ -239,14 +398,7 @@ class Organism(object):
 
     def get_pathways_by_genes(self, gene_ids):
         """ Pathways that include all genes in gene_ids. """
-        l = self.api.get_genes_pathway_organism(self.org_code)
-        gene_ids = set(gene_ids)
-        gtp = defaultdict(set)
-        for a,b in l:
-            gtp[a].add(b)
-        pathways = [ gtp[g] for g in gene_ids ]
-        pathways = reduce(set.intersection, pathways)
-        return sorted(pathways)
+        return self.pathway_index.pathways(gene_ids)
 
     def get_pathways_by_enzymes(self, enzyme_ids):
         enzyme_ids = set(enzyme_ids)
@@ -6,11 +6,12 @@ from __future__ import absolute_import
 
 from datetime import datetime
 from contextlib import closing
+from collections import OrderedDict
 from operator import itemgetter
 import warnings
 import six
 
-from .service import web_service
+from .service import web_service, urllib_service
 from .types import OrganismSummary, Definition, BInfo, Link
 
 
@@ -336,6 +337,7 @@ KEGG api with caching
 """
 
 import os
+from multiprocessing.pool import ThreadPool
 
 from . import caching
 from .caching import cached_method, cache_entry, touch_dir
@@ -403,57 +405,127 @@ class CachedKeggApi(KeggApi):
         if len(ids) > 10:
             raise ValueError("Can batch at most 10 ids at a time.")
 
+        uncached = self._uncached_ids(ids)
+        if uncached:
+            self._store_entries(self._fetch_entries(uncached))
+
+        # Finally join all the results, but drop all None objects
+        entries = self.cached_entries(ids)
+        return "".join(e for e in entries if e is not None)
+
+    def _uncached_ids(self, ids):
+        """
+        Return a list of unique `ids` without a valid `get` cache entry.
+        """
         get = self.get
-        uncached = []
-        unmatched = set()
+        ids = list(OrderedDict.fromkeys(ids))
+        keys = [get.key_from_args((id,)) for id in ids]
+        with closing(get.cache_store()) as store:
+            entries = store.get_many(keys)
+        return [id for id, key in zip(ids, keys)
+                if key not in entries or
+                not get.is_entry_valid(entries[key], None)]
+
+    def _fetch_entries(self, ids, service=None):
+        """
+        Retrieve (at most 10) `ids` with a single `get` request (using
+        `service` if given) and return a list of (id, entry text) tuples.
+        The entry is None for ids unknown to KEGG.
+        """
+        if service is None:
+            rval = KeggApi.get(self, ids)
+        else:
+            rval = service.get("+".join(ids)).get()
+
+        if rval is not None:
+            entries = rval.split("///\n")
+        else:
+            entries = []
+
+        if entries and not entries[-1].strip():
+            # Delete the last single newline entry if present
+            del entries[-1]
 
+        if len(entries) != len(ids):
+            matched, entries = match_by_ids(ids, entries)
+            entries = dict(zip(matched, entries))
+            unmatched = [id for id in ids if id not in entries]
+            warnings.warn("Unable to match entries for keys: %s." %
+                          ", ".join(map(repr, unmatched)))
+            entries = [entries.get(id) for id in ids]
+
+        return [(id, entry + "///\n" if entry is not None else None)
+                for id, entry in zip(ids, entries)]
+
+    def _store_entries(self, entries):
+        """
+        Store the (id, entry text) `entries` in the `get` cache in
+        a single transaction.
+        """
+        get = self.get
+        now = datetime.now()
         with closing(get.cache_store()) as store:
-            # Which ids are already cached
-            # TODO: Invalidate entries by release string.
-            for id in ids:
-                key = get.key_from_args((id,))
-                if not get.key_has_valid_cache(key, store):
-                    uncached.append(id)
+            store.set_many((get.key_from_args((id,)),
+                            get.new_entry(entry, (id,), now))
+                           for id, entry in entries)
 
-        if uncached:
-            # in case there are duplicate ids
-            uncached = sorted(set(uncached))
-
-            rval = KeggApi.get(self, uncached)
-
-            if rval is not None:
-                entries = rval.split("///\n")
-            else:
-                entries = []
-
-            if entries and not entries[-1].strip():
-                # Delete the last single newline entry if present
-                del entries[-1]
-
-            if len(entries) != len(uncached):
-                new_uncached, entries = match_by_ids(uncached, entries)
-                unmatched = set(uncached) - set(new_uncached)
-                uncached = new_uncached
-                warnings.warn("Unable to match entries for keys: %s." %
-                              ", ".join(map(repr, unmatched)))
-
-            with closing(get.cache_store()) as store:
-                for id, entry in zip(uncached, entries):
-                    key = get.key_from_args((id,))
-                    if entry is not None:
-                        entry = entry + "///\n"
-                    store[key] = cache_entry(entry, mtime=datetime.now())
+    def cached_entries(self, ids):
+        """
+        Return a list of cached `get` entry texts for `ids` (None for
+        entries not in the cache or unknown to KEGG).
+        """
+        get = self.get
+        keys = [get.key_from_args((id,)) for id in ids]
+        with closing(get.cache_store()) as store:
+            entries = store.get_many(keys)
+        return [entries[key].value if key in entries else None
+                for key in keys]
 
-        # Finally join all the results, but drop all None objects
+    def prefetch(self, ids, batch_size=10, max_workers=4, commit_every=10,
+                 progress_callback=None, service=None):
+        """
+        Retrieve the entries for all `ids` and store them in the local
+        cache.
 
-        with closing(get.cache_store()):
-            keys = [get.key_from_args((id,)) for id in ids]
-            entries = [store[key].value for key in keys]
+        The entries are requested in batches of `batch_size` ids from
+        at most `max_workers` concurrent threads and written to the cache
+        in a single transaction for every `commit_every` batches. Ids
+        already in the cache are skipped, so an interrupted prefetch
+        continues where it stopped when called again.
 
-        entries = filter(lambda e: e is not None, entries)
+        The threads share `service`, which must be safe to use from
+        multiple threads (by default a new
+        :func:`~.service.urllib_service`).
 
-        rval = "".join(entries)
-        return rval
+        """
+        if batch_size > 10 or batch_size < 1:
+            raise ValueError("Invalid batch_size")
+        if service is None:
+            service = urllib_service()
+
+        ids = self._uncached_ids(ids)
+        batches = [ids[start: start + batch_size]
+                   for start in range(0, len(ids), batch_size)]
+        if not batches:
+            return
+
+        pool = ThreadPool(max(1, min(max_workers, len(batches))))
+        pending = []
+        try:
+            results = pool.imap_unordered(
+                lambda batch: self._fetch_entries(batch, service), batches)
+            for i, entries in enumerate(results):
+                pending.extend(entries)
+                if (i + 1) % commit_every == 0:
+                    self._store_entries(pending)
+                    pending = []
+                if progress_callback:
+                    progress_callback(100.0 * (i + 1) / len(batches))
+        finally:
+            pool.terminate()
+            pool.join()
+            # keep the already retrieved entries even on an error
+            self._store_entries(pending)
 
     @cached_method
     def conv(self, target_db, source):
@@ -4,6 +4,9 @@ Caching framework for cached kegg api calls.
 """
 import os
 import sqlite3
+import threading
+import time
+import zlib
 try:
     import cPickle as pickle
 except ImportError:
@@ -14,12 +17,14 @@ from contextlib import closing
 from datetime import datetime, date, timedelta
 from . import conf
 
-import six
 
 try:
     from UserDict import DictMixin
 except ImportError:
-    from collections import MutableMapping as DictMixin
+    try:
+        from collections.abc import MutableMapping as DictMixin
+    except ImportError:
+        from collections import MutableMapping as DictMixin
 
 class Store(object):
     def __init__(self):
@@ -28,6 +33,36 @@ class Store(object):
     def open(self):
         raise NotImplementedError
 
+    def get_many(self, keys):
+        """
+        Return a dictionary with the stored values for `keys` (keys not
+        in the store are omitted).
+        """
+        values = {}
+        for key in keys:
+            try:
+                values[key] = self[key]
+            except KeyError:
+                pass
+        return values
+
+    def set_many(self, items):
+        """
+        Store all (key, value) pairs in `items`.
+        """
+        for key, value in items:
+            self[key] = value
+
+    def delete_many(self, keys):
+        """
+        Remove all `keys` from the store.
+        """
+        for key in keys:
+            try:
+                del self[key]
+            except KeyError:
+                pass
+
     def __enter__(self):
         return self
 
@@ -35,101 +70,315 @@ class Store(object):
         pass
 
 
+class _PooledConnection(object):
+    def __init__(self, filename):
+        self.con = sqlite3.connect(filename, timeout=30,
+                                   check_same_thread=False)
+        self.lock = threading.RLock()
+        #: (approximate) total size of stored values; None if unknown
+        self.size = None
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def _pooled_connection(filename):
+    """
+    Return the shared :class:`_PooledConnection` for a sqlite `filename`
+    in the current process.
+    """
+    key = (os.getpid(), os.path.abspath(filename))
+    with _connections_lock:
+        pooled = _connections.get(key)
+        if pooled is None:
+            pooled = _PooledConnection(filename)
+            Sqlite3Store._init_schema(pooled.con)
+            _connections[key] = pooled
+    return pooled
+
+
+def close_connections():
+    """
+    Close all pooled sqlite connections of the current process.
+    """
+    with _connections_lock:
+        for key in list(_connections):
+            if key[0] == os.getpid():
+                pooled = _connections.pop(key)
+                with pooled.lock:
+                    pooled.con.close()
+
+
 class Sqlite3Store(Store, DictMixin):
+    """
+    A persistent store in a sqlite database `filename`.
 
-    def __init__(self, filename):
+    All stores for the same file in a process share one connection (in
+    the WAL journal mode). The values are pickled and compressed. When
+    the total size of the values exceeds `max_size` megabytes (by default
+    the ``cache.max_size`` configuration parameter) the least recently
+    used entries are removed.
+
+    """
+    FORMAT = 2
+    #: Maximum number of variables in a single query
+    MAX_VARIABLES = 500
+    #: Resolution (in seconds) of the recorded access times
+    ATIME_RESOLUTION = 60.0
+    #: Fraction of `max_size` kept after an eviction
+    EVICT_TO = 0.8
+
+    def __init__(self, filename, max_size=None):
+        Store.__init__(self)
         self.filename = filename
-        self.con = sqlite3.connect(filename)
-        self.con.execute("""
-            CREATE TABLE IF NOT EXISTS cache
-                (key TEXT UNIQUE,
-                 value TEXT
-                )
-        """)
-        self.con.execute("""
-            CREATE INDEX IF NOT EXISTS cache_index
-            ON cache (key)
-        """)
-        self.con.commit()
+        if max_size is None:
+            max_size = float(conf.params["cache.max_size"])
+        self.max_size = int(max_size * 2 ** 20)
+        self._pooled = _pooled_connection(filename)
+        self.con = self._pooled.con
+        self.lock = self._pooled.lock
+
+    @classmethod
+    def _init_schema(cls, con):
+        with con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            version = con.execute("PRAGMA user_version").fetchone()[0]
+            if version != cls.FORMAT:
+                # An old (or a new unknown) format; it is only a cache.
+                con.execute("DROP TABLE IF EXISTS cache")
+                con.execute("DROP TABLE IF EXISTS store")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS store
+                    (key TEXT PRIMARY KEY,
+                     value BLOB,
+                     size INTEGER,
+                     atime REAL)
+            """)
+            con.execute("""
+                CREATE INDEX IF NOT EXISTS store_atime
+                ON store (atime)
+            """)
+            con.execute("PRAGMA user_version=%i" % cls.FORMAT)
+
+    @staticmethod
+    def _dumps(value):
+        return zlib.compress(pickle.dumps(value, 2))
+
+    @staticmethod
+    def _loads(data):
+        return pickle.loads(zlib.decompress(bytes(data)))
+
+    def _chunks(self, keys):
+        keys = list(keys)
+        for start in range(0, len(keys), self.MAX_VARIABLES):
+            yield keys[start: start + self.MAX_VARIABLES]
+
+    def get_many(self, keys):
+        values = {}
+        now = time.time()
+        with self.lock:
+            for chunk in self._chunks(keys):
+                marks = ", ".join("?" * len(chunk))
+                rows = self.con.execute(
+                    "SELECT key, value FROM store WHERE key IN (%s)" % marks,
+                    chunk).fetchall()
+                for key, data in rows:
+                    try:
+                        values[key] = self._loads(data)
+                    except Exception:
+                        pass
+                if rows:
+                    with self.con:
+                        self.con.execute(
+                            "UPDATE store SET atime=? "
+                            "WHERE atime<? AND key IN (%s)" % marks,
+                            [now, now - self.ATIME_RESOLUTION] + chunk)
+        return values
+
+    def set_many(self, items):
+        now = time.time()
+        rows = []
+        for key, value in items:
+            data = self._dumps(value)
+            rows.append((key, sqlite3.Binary(data), len(data), now))
+        if not rows:
+            return
+        with self.lock:
+            with self.con:
+                self.con.executemany("""
+                    INSERT OR REPLACE INTO store
+                    VALUES (?, ?, ?, ?)
+                """, rows)
+            if self.max_size > 0:
+                if self._pooled.size is None:
+                    self._pooled.size = self._total_size()
+                else:
+                    self._pooled.size += sum(row[2] for row in rows)
+                if self._pooled.size > self.max_size:
+                    self.evict()
+
+    def delete_many(self, keys):
+        with self.lock:
+            with self.con:
+                for chunk in self._chunks(keys):
+                    self.con.execute(
+                        "DELETE FROM store WHERE key IN (%s)" %
+                        ", ".join("?" * len(chunk)), chunk)
+            self._pooled.size = None
+
+    def _total_size(self):
+        return self.con.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM store").fetchone()[0]
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the total size is
+        below `EVICT_TO` of `max_size`.
+        """
+        with self.lock:
+            size = self._total_size()
+            if size > self.max_size:
+                cur = self.con.execute(
+                    "SELECT key, size FROM store ORDER BY atime")
+                evicted = []
+                for key, entry_size in cur:
+                    if size <= self.max_size * self.EVICT_TO:
+                        break
+                    evicted.append(key)
+                    size -= entry_size
+                cur.close()
+                self.delete_many(evicted)
+            self._pooled.size = size
+
+    def update(self, other=(), **kwargs):
+        """
+        Update the store from a mapping or an iterable of (key, value)
+        pairs in a single transaction.
+        """
+        if hasattr(other, "keys"):
+            items = [(key, other[key]) for key in other.keys()]
+        else:
+            items = list(other)
+        items.extend(kwargs.items())
+        self.set_many(items)
 
     def __getitem__(self, key):
-        cur = self.con.execute("""
-            SELECT value
-            FROM cache
-            WHERE key=?
-        """, (key,))
-        r = cur.fetchall()
-        if not r:
+        values = self.get_many([key])
+        if key not in values:
             raise KeyError(key)
-        else:
-            pickle_str = r[0][0]
-            if not six.PY3:
-                pickle_str = str(pickle_str)
-            try:
-                return pickle.loads(pickle_str)
-            except Exception:
-                raise KeyError(key)
+        return values[key]
 
     def __setitem__(self, key, value):
-        value = pickle.dumps(value)
-        self.con.execute("""
-            INSERT OR REPLACE INTO cache
-            VALUES (?, ?)
-        """, (key, value))
-        self.con.commit()
+        self.set_many([(key, value)])
 
     def __delitem__(self, key):
-        self.con.execute("""
-            DELETE FROM cache
-            WHERE key=?
-        """, (key,))
-        self.con.commit()
+        self.delete_many([key])
+
+    def __contains__(self, key):
+        with self.lock:
+            cur = self.con.execute("SELECT 1 FROM store WHERE key=?", (key,))
+            return cur.fetchone() is not None
 
     def keys(self):
-        cur = self.con.execute("""
-            SELECT key
-            FROM cache
-        """)
-        return [str(r[0]) for r in cur.fetchall()]
+        with self.lock:
+            cur = self.con.execute("SELECT key FROM store")
+            return [str(r[0]) for r in cur.fetchall()]
 
     def close(self):
+        # The connection is shared (see `close_connections`)
         pass
 
     def __len__(self):
-        return None
+        with self.lock:
+            return self.con.execute("SELECT COUNT(*) FROM store").fetchone()[0]
 
     def __iter__(self):
-        return None
-
+        return iter(self.keys())
 
 
 class DictStore(Store, DictMixin):
     def __init__(self):
         Store.__init__(self)
+        self._data = {}
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def keys(self):
+        return list(self._data.keys())
 
     def close(self):
         pass
 
     def __len__(self):
-        return None
+        return len(self._data)
 
     def __iter__(self):
-        return None
-
+        return iter(self._data)
 
 
 class cache_entry(object):
-    def __init__(self, value, mtime=None, expires=None):
+    def __init__(self, value, mtime=None, expires=None, release=None):
         self.value = value
         self.mtime = mtime
         self.expires = expires
+        self.release = release
 
 _SESSION_START = datetime.now()
 
 
+def invalidate_before(policy=None):
+    """
+    Return the datetime before which cache entries are invalid according
+    to the ``cache.invalidate`` configuration `policy`:
+
+    * 'always' - entries are never valid
+    * 'session' - entries stored before this session are invalid
+    * 'daily', 'weekly' - entries stored before today or more than 7 days
+      ago are invalid
+    * a number - entries older then this many days are invalid
+    * 'release' or 'never' - entries do not expire (but still are invalid
+      when made for a different KEGG release)
+
+    """
+    if policy is None:
+        policy = conf.params["cache.invalidate"]
+    now = datetime.now()
+    if policy == "always":
+        return datetime.max
+    elif policy == "session":
+        return _SESSION_START
+    elif policy == "daily":
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    elif policy == "weekly":
+        return now - timedelta(7)
+    elif policy in ("release", "never"):
+        return datetime.min
+    else:
+        try:
+            return now - timedelta(float(policy))
+        except (ValueError, OverflowError):
+            raise ValueError("Invalid cache.invalidate value %r" % policy)
+
+
 class cached_wrapper(object):
     """
-    TODO: needs documentation
+    A method bound to an `instance` with its results cached in a store
+    returned by `cache_store`.
+
+    An entry is invalid when stored for a different release than the
+    current ``instance.last_modified(args)`` (if any) or when it expires
+    according to the ``cache.invalidate`` configuration parameter (see
+    :func:`invalidate_before`).
+
     """
     def __init__(self, function, instance, class_, cache_store,
                  last_modified=None):
@@ -162,41 +411,44 @@ class cached_wrapper(object):
 
     def invalidate_all(self):
         prefix = self.key_from_args(()).rstrip(",)")
-        with self.cache_store() as store:
-            for key in store:
-                if key.startswith(prefix):
-                    del store[key]
+        with closing(self.cache_store()) as store:
+            store.delete_many([key for key in store.keys()
+                               if key.startswith(prefix)])
 
-    def memoize(self, args, kwargs, value, timestamp=None):
-        key = self.key_from_args(args, kwargs)
+    def new_entry(self, value, args=(), timestamp=None):
+        """
+        Return a :class:`cache_entry` for a `value` computed for `args`.
+        """
         if timestamp is None:
             timestamp = datetime.now()
+        return cache_entry(value, mtime=timestamp,
+                           release=self.last_modified_from_args(args) or None)
 
+    def memoize(self, args, kwargs, value, timestamp=None):
+        key = self.key_from_args(args, kwargs)
         with closing(self.cache_store()) as store:
-            store[key] = cache_entry(value, mtime=timestamp)
+            store[key] = self.new_entry(value, args, timestamp)
 
     def __call__(self, *args):
         key = self.key_from_args(args)
         with closing(self.cache_store()) as store:
-            if self.key_has_valid_cache(key, store):
-                rval = store[key].value
-            else:
-                rval = self.function(self.instance, *args)
-                store[key] = cache_entry(rval, datetime.now(), None)
+            entry = store.get(key)
+            if entry is not None and self.is_entry_valid(entry, args):
+                return entry.value
+
+            rval = self.function(self.instance, *args)
+            store[key] = self.new_entry(rval, args)
 
         return rval
 
     def key_has_valid_cache(self, key, store):
-        if key not in store:
-            return False
-        else:
-            entry = store[key]
-            return self.is_entry_valid(entry, None)
+        entry = store.get(key)
+        return entry is not None and self.is_entry_valid(entry, None)
 
     def is_entry_valid(self, entry, args):
-        # For now always return True, the caching architecture needs to be
-        # completely reworked
-        return True
+        release = self.last_modified_from_args(args)
+        if release and getattr(entry, "release", None) != release:
+            return False
 
         # Need to check datetime first (it subclasses date)
         if isinstance(entry.mtime, datetime):
@@ -207,28 +459,7 @@ class cached_wrapper(object):
         else:
             return False
 
-        last_modified = self.last_modified_from_args(args)
-
-        if isinstance(last_modified, date):
-            last_modified = datetime(last_modified.year, last_modified.month,
-                                     last_modified.day, 1, 1, 1)
-        elif isinstance(last_modified, str):
-            # Could have different format
-            mtime = mtime.strftime("%Y %m %d %H %M %S")
-
-        elif last_modified is None:
-            if conf.params["cache.invalidate"] == "always":
-                return False
-            elif conf.params["cache.invalidate"] == "session":
-                last_modified = _SESSION_START
-            elif conf.params["cache.invalidate"] == "daily":
-                last_modified = datetime.now().replace(hour=0, minute=0,
-                                                       second=0, microsecond=0)
-            elif conf.params["cache.invalidate"] == "weekly":
-                last_modified = datetime.now() - timedelta(7)
-            else:  # ???
-                pass
-        return last_modified <= mtime
+        return mtime >= invalidate_before()
 
 
 class cached_method(object):
@@ -244,9 +475,9 @@ class cached_method(object):
     def get_cache_store(self, instance, owner):
         if hasattr(instance, "cache_store"):
             return instance.cache_store
-        elif not hasattr("_cached_method_cache"):
+        elif not hasattr(instance, "_cached_method_cache"):
             instance._cached_method_cache = DictStore()
-        return instance._cached_method_cache
+        return lambda: instance._cached_method_cache
 
 
 class bget_cached_method(cached_method):
@@ -277,8 +508,10 @@ def clear_cache():
         raise Exception("Non default cache path. Please remove the contents "
                         "of %r manually." % path)
 
-    for cache_filename in glob.glob(os.path.join(path, "*.sqlite3")):
-        os.remove(cache_filename)
+    close_connections()
+    for pattern in ["*.sqlite3", "*.sqlite3-wal", "*.sqlite3-shm"]:
+        for cache_filename in glob.glob(os.path.join(path, pattern)):
+            os.remove(cache_filename)
 
     for ko_filename in glob.glob(os.path.join(path, "*.keg")):
         os.remove(ko_filename)
@@ -22,7 +22,10 @@ default = """
 # path = %(home)s/.obiKEGG/
 path = %(kegg_dir)s/
 store = sqlite3
+# always, session, daily, weekly, release, never or a number of days
 invalidate = weekly
+# maximum size (in MB) of a cache file
+max_size = 1024
 
 [service]
 transport = urllib2
@@ -49,6 +52,7 @@ _ALL_PARAMS = [
     "cache.path",
     "cache.store",
     "cache.invalidate",
+    "cache.max_size",
     "service.transport"
 ]
 
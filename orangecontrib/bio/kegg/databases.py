@@ -7,11 +7,11 @@ from __future__ import absolute_import
 
 import sys
 import re
-from contextlib import closing
 
 from . import entry
 from .entry import fields
 from . import api
+from . import conf
 
 
 def iter_take(source_iter, n):
@@ -74,8 +74,8 @@ class DBDataBase(object):
 
         self.api = api.CachedKeggApi()
         self._info = None
-        #TODO invalidate cache by KEGG release
-        #self.api.set_default_release(self.info.release)
+        if conf.params["cache.invalidate"] == "release":
+            self.api.set_default_release(self.info.release)
         self._keys = []
 
     @property
@@ -204,12 +204,18 @@ class DBDataBase(object):
         res = self.api.find(self.DB, name).splitlines()
         return [r.split(" ", 1)[0] for r in res]
 
-    def pre_cache(self, keys=None, batch_size=10, progress_callback=None):
+    def pre_cache(self, keys=None, batch_size=10, progress_callback=None,
+                  max_workers=4):
         """
         Retrieve all the entries for `keys` and cache them locally for faster
         subsequent retrieval. If `keys` is ``None`` then all entries will be
         retrieved.
 
+        The entries are requested in batches of `batch_size` keys from
+        at most `max_workers` threads (see :func:`api.CachedKeggApi.prefetch`).
+        Already cached entries are skipped, so an interrupted call can be
+        resumed by calling it again.
+
         """
         if not isinstance(self.api, api.CachedKeggApi):
             raise TypeError("Not an instance of api.CachedKeggApi")
@@ -220,28 +226,9 @@ class DBDataBase(object):
         if keys is None:
             keys = self.keys()
 
-        keys = map(self._add_db, keys)
-
-        get = self.api.get
-
-        # drop all keys with a valid cache entry to minimize the number
-        # of 'get' requests.
-        with closing(get.cache_store()) as store:
-            def is_uncached(key):
-                cache_key = get.key_from_args((key,))
-                return not get.key_has_valid_cache(cache_key, store)
-            keys = [key for key in keys if is_uncached(key)]
-
-        start = 0
-
-        while start < len(keys):
-            batch = keys[start: start + batch_size]
-            self.api.get(batch)
-
-            if progress_callback:
-                progress_callback(100.0 * start / len(keys))
-
-            start += batch_size
+        self.api.prefetch(list(map(self._add_db, keys)),
+                          batch_size=batch_size, max_workers=max_workers,
+                          progress_callback=progress_callback)
 
     def batch_get(self, keys):
         """
@@ -250,25 +237,13 @@ class DBDataBase(object):
         are not yet cached.
 
         """
-        entries = []
-        batch_size = 10
         keys = list(map(self._add_db, keys))
 
         # Precache the entries first
         self.pre_cache(keys)
 
-        start = 0
-        while start < len(keys):
-            batch = keys[start: start + batch_size]
-            batch_entries = self.api.get(batch)
-            if batch_entries is not None:
-                batch_entries = batch_entries.split("///\n")
-                # Remove possible empty last line
-                batch_entries = [e for e in batch_entries if e.strip()]
-                entries.extend(map(self.ENTRY_TYPE, batch_entries))
-            start += batch_size
-
-        return entries
+        return [self.ENTRY_TYPE(text) for text in self.api.cached_entries(keys)
+                if text and text.strip()]
 
     def _add_db(self, key):
         """
@@ -3,8 +3,17 @@
 """
 from __future__ import absolute_import
 
+from contextlib import closing
+
+import six
+from six.moves.urllib.parse import quote
+from six.moves.urllib.request import urlopen
+
 REST_API = "http://rest.kegg.jp/"
 
+#: Timeout (in seconds) for a single urllib request.
+TIMEOUT = 60
+
 
 def slumber_service():
     """
@@ -27,7 +36,52 @@ def slumber_service():
     return slumber_service._cached
 
 
-from . import conf
+class UrllibResource(object):
+    """
+    A rest resource at `url` with the same call interface as a `slumber`
+    resource (``service.get("hsa:1").get()``) using only the standard
+    library.
+    """
+    def __init__(self, url):
+        self._url = url
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return UrllibResource(self._url + "/" + name)
+
+    def __call__(self, part):
+        return UrllibResource(self._url + "/" + quote(part, safe=":+"))
+
+    def get(self):
+        with closing(urlopen(self._url, timeout=TIMEOUT)) as stream:
+            data = stream.read()
+        if six.PY3:
+            data = data.decode("utf-8")
+        return data
+
+
+class UrllibService(object):
+    """
+    The root of a rest service at `url`, using :class:`UrllibResource`.
+    Unlike `slumber` it does not share a connection between calls and
+    can be used from multiple threads at once.
+    """
+    def __init__(self, url):
+        self._url = url.rstrip("/")
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return UrllibResource(self._url + "/" + name)
+
+
+def urllib_service(url=REST_API):
+    """
+    Return a rest based service using `urllib` for the KEGG api at `url`.
+    """
+    return UrllibService(url)
+
 
 default_service = slumber_service
 
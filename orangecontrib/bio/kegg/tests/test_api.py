@@ -1,6 +1,10 @@
 import unittest
 import tempfile
 import shutil
+import threading
+import warnings
+
+from six.moves import BaseHTTPServer, socketserver
 
 try:
     from unittest import mock
@@ -24,6 +28,7 @@ import doctest
 from orangecontrib.bio import kegg
 from orangecontrib.bio.kegg import api as keggapi
 from orangecontrib.bio.kegg import conf as keggconf
+from orangecontrib.bio.kegg import service as keggservice
 
 
 list_organism = """\
@@ -87,6 +92,111 @@ def mock_kegg_api():
     return api
 
 
+class StandInKegg(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A local stand-in for the KEGG rest `get` api serving gene entries
+    for ids 'hsa:<number>'. Requests including an id in `failing` fail.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0),
+                                           StandInHandler)
+        self.requests = []
+        self.failing = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%i/" % self.server_address[1]
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        _, op, ids = self.path.split("/", 2)
+        ids = ids.split("+")
+        with self.server.lock:
+            self.server.requests.append(ids)
+        if op != "get" or self.server.failing.intersection(ids):
+            self.send_error(500)
+            return
+        body = "".join(
+            "ENTRY       %s            CDS       T01001\n"
+            "NAME        GENE%s\n///\n" % (id.split(":")[1], id)
+            for id in ids if id.split(":")[1].isdigit())
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="kegg-tests")
+        self.old_cache_path = keggconf.params["cache.path"]
+        keggconf.params["cache.path"] = self.tmpdir
+        self.server = StandInKegg()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        with mock.patch("orangecontrib.bio.kegg.api.web_service",
+                        mock_service):
+            self.api = keggapi.CachedKeggApi()
+        self.service = keggservice.urllib_service(self.server.url)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        keggconf.params["cache.path"] = self.old_cache_path
+        shutil.rmtree(self.tmpdir)
+
+    def test_prefetch(self):
+        ids = ["hsa:%i" % i for i in range(45)]
+        progress = []
+        self.api.prefetch(ids, max_workers=3, commit_every=2,
+                          progress_callback=progress.append,
+                          service=self.service)
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(progress[-1], 100.0)
+        entries = self.api.cached_entries(ids)
+        self.assertTrue(all(e.startswith("ENTRY       %s " % id[4:])
+                            for id, e in zip(ids, entries)))
+        self.assertEqual(self.api.get(["hsa:3", "hsa:1"]),
+                         entries[3] + entries[1])
+        self.assertEqual(len(self.server.requests), 5)
+
+        # cached entries are not requested again
+        self.api.prefetch(ids + ["hsa:45"], service=self.service)
+        self.assertEqual(self.server.requests[-1], ["hsa:45"])
+
+        # unknown ids are cached as missing
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter("always")
+            self.api.prefetch(["hsa:46", "hsa:x"], service=self.service)
+        self.assertEqual(self.api.cached_entries(["hsa:x"]), [None])
+
+    def test_resume(self):
+        ids = ["hsa:%i" % i for i in range(100)]
+        self.server.failing.add("hsa:95")
+        with self.assertRaises(Exception):
+            self.api.prefetch(ids, max_workers=1, commit_every=3,
+                              service=self.service)
+        retrieved = [id for id, e in zip(ids, self.api.cached_entries(ids))
+                     if e is not None]
+        self.assertEqual(retrieved, ids[:90])
+
+        self.server.failing.clear()
+        del self.server.requests[:]
+        self.api.prefetch(ids, service=self.service)
+        self.assertEqual(self.server.requests, [ids[90:]])
+        self.assertNotIn(None, self.api.cached_entries(ids))
+
+
 def load_tests(loader, tests, ignore):
     def setUp(testcase):
         # testcase._tmpdir = tempfile.TemporaryDirectory(prefix="kegg-tests")
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from orangecontrib.bio.kegg import caching
+from orangecontrib.bio.kegg import conf as keggconf
+
+
+class Counter(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.calls = 0
+        self.release = ""
+
+    def cache_store(self):
+        return caching.Sqlite3Store(self.filename)
+
+    def last_modified(self, args):
+        return self.release
+
+    @caching.cached_method
+    def square(self, x):
+        self.calls += 1
+        return x * x
+
+
+class TestSqlite3Store(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "test.sqlite3")
+        self.old_invalidate = keggconf.params["cache.invalidate"]
+
+    def tearDown(self):
+        keggconf.params["cache.invalidate"] = self.old_invalidate
+        caching.close_connections()
+        shutil.rmtree(self.path)
+
+    def test_store(self):
+        store = caching.Sqlite3Store(self.filename)
+        store["a"] = [1, 2]
+        store.set_many([("b", None), ("c", "x" * 1000)])
+        self.assertIs(caching.Sqlite3Store(self.filename).con, store.con)
+        self.assertEqual(store.con.execute("PRAGMA journal_mode").fetchone(),
+                         ("wal",))
+        self.assertEqual(len(store), 3)
+        self.assertEqual(sorted(store), ["a", "b", "c"])
+        self.assertEqual(store.get_many(["a", "b", "d"]),
+                         {"a": [1, 2], "b": None})
+        self.assertEqual(store["c"], "x" * 1000)
+        self.assertIn("c", store)
+        self.assertRaises(KeyError, lambda: store["d"])
+        store.delete_many(["a", "b"])
+        self.assertEqual(list(store), ["c"])
+
+    def test_evict(self):
+        store = caching.Sqlite3Store(self.filename)
+        store.ATIME_RESOLUTION = 0
+        size = len(store._dumps(os.urandom(1000)))
+        store.max_size = int(size * 8.5)
+        for i in range(8):
+            store.con.execute("UPDATE store SET atime=atime-1")
+            store[str(i)] = os.urandom(1000)
+        # use the first entry
+        store["0"]
+        store["8"] = os.urandom(1000)
+        self.assertLessEqual(store._total_size(), store.max_size)
+        self.assertLessEqual(len(store), int(store.max_size / size))
+        self.assertIn("0", store)
+        self.assertNotIn("1", store)
+        self.assertIn("8", store)
+
+    def test_invalidate(self):
+        counter = Counter(self.filename)
+        keggconf.params["cache.invalidate"] = "weekly"
+        self.assertEqual(counter.square(3), 9)
+        self.assertEqual(counter.square(3), 9)
+        self.assertEqual(counter.calls, 1)
+
+        # expired entries
+        counter.square.memoize((3,), None, 9,
+                               datetime.now() - timedelta(8))
+        counter.square(3)
+        self.assertEqual(counter.calls, 2)
+        keggconf.params["cache.invalidate"] = "10"
+        counter.square.memoize((3,), None, 9,
+                               datetime.now() - timedelta(8))
+        counter.square(3)
+        self.assertEqual(counter.calls, 2)
+        keggconf.params["cache.invalidate"] = "always"
+        counter.square(3)
+        self.assertEqual(counter.calls, 3)
+
+        # entries for a different release
+        keggconf.params["cache.invalidate"] = "release"
+        counter.release = "81.0"
+        counter.square(3)
+        self.assertEqual(counter.calls, 4)
+        counter.square(3)
+        self.assertEqual(counter.calls, 4)
+        counter.release = "82.0"
+        counter.square(3)
+        self.assertEqual(counter.calls, 5)
+
+        counter.square(4)
+        counter.square.invalidate_all()
+        self.assertEqual(len(counter.cache_store()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
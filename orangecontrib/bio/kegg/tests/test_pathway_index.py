@@ -0,0 +1,73 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from orangecontrib.bio import kegg
+from orangecontrib.bio.utils import stats
+
+
+class TestPathwayIndex(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.genes = ["hsa:%i" % i for i in range(60)]
+        self.pathways = ["path:hsa%05i" % i for i in range(8)]
+        self.links = [(g, p) for g in self.genes[:50] for p in self.pathways
+                      if rng.random() < 0.3]
+        self.index = kegg.PathwayIndex(self.links)
+
+    def members(self, pathway):
+        return [g for g, p in self.links if p == pathway]
+
+    def test_index(self):
+        for p in self.pathways:
+            self.assertEqual(sorted(self.index.genes(p)),
+                             sorted(self.members(p)))
+        genes = ["hsa:1", "hsa:2"]
+        self.assertEqual(
+            self.index.pathways(genes),
+            sorted(p for p in self.pathways
+                   if set(genes) <= set(self.members(p))))
+        self.assertEqual(self.index.pathways(["hsa:55"]), [])
+        self.assertEqual(self.index.pathways([]), [])
+
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, "index.npz")
+            self.index.save(filename, "1")
+            self.assertIsNone(kegg.PathwayIndex.load(filename, "2"))
+            loaded = kegg.PathwayIndex.load(filename, "1")
+            self.assertEqual(loaded.gene_ids, self.index.gene_ids)
+            self.assertEqual(loaded.pathway_ids, self.index.pathway_ids)
+            self.assertEqual((loaded.matrix != self.index.matrix).nnz, 0)
+        finally:
+            shutil.rmtree(path)
+
+    def test_enrichment(self):
+        rng = random.Random(1)
+        gene_lists = [rng.sample(self.genes, rng.randint(1, 20))
+                      for _ in range(10)]
+        gene_lists.append(["hsa:1", "hsa:1", "unknown"])
+        reference = self.genes[5:]
+        for prob in [stats.Binomial(), stats.Hypergeometric()]:
+            results = self.index.enrichment(gene_lists, reference, prob)
+            self.assertEqual(len(results), len(gene_lists))
+            for genes, result in zip(gene_lists, results):
+                expected = {}
+                for p in self.pathways:
+                    members = set(self.members(p))
+                    found = [g for g in genes if g in members]
+                    if found:
+                        m = len(members.intersection(reference))
+                        expected[p] = (found, prob.p_value(
+                            len(found), len(reference), m, len(genes)), m)
+                self.assertEqual(set(result), set(expected))
+                for p, (found, p_value, m) in expected.items():
+                    self.assertEqual(result[p][0], found)
+                    self.assertAlmostEqual(result[p][1], p_value)
+                    self.assertEqual(result[p][2], m)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -543,8 +543,10 @@ class obiMeSH(object):
                         self.statistics[k][1] += 1  # increased noCluster
         self.ratio = float(cln) / float(n)
         # enrichment
-        for i in self.statistics.iterkeys():
-            self.statistics[i][2] = HYPERG.p_value(int(self.statistics[i][1]), int(n), int(cln), int(self.statistics[i][0]))
+        ids = self.statistics.keys()
+        p_values = HYPERG.p_value_array([int(self.statistics[i][1]) for i in ids], int(n), int(cln), [int(self.statistics[i][0]) for i in ids])
+        for i, p_value in zip(ids, p_values):
+            self.statistics[i][2] = float(p_value)
             self.statistics[i][3] = float(self.statistics[i][1]) / float(self.statistics[i][0]) / self.ratio   # fold enrichment
         self.calculated = True
 
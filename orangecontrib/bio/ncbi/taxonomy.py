@@ -3,17 +3,22 @@ import sqlite3
 import tarfile
 import shutil
 import tempfile
-import collections
 import textwrap
 
 from collections import namedtuple
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 try:
     from urllib2 import urlopen
 except ImportError:
     from urllib.request import urlopen
 
 import six
+import numpy
 
 __all__ = ["Taxonomy"]
 
@@ -45,26 +50,186 @@ class taxon(_taxon):
     _repr_pretty_ = namedtuple_repr_pretty
 
 
-class Taxonomy(collections.Mapping):
+class TaxonomyIndex(object):
+    """
+    The taxonomy tree in arrays: sorted integer `tax_ids`, the index of
+    each node's parent (-1 for the root), rank ids (into `ranks`) and the
+    children of each node as CSR arrays.
+    """
+    #: Format of the cached index. Increase on incompatible changes.
+    FORMAT = "1"
+
+    _ARRAYS = ["tax_ids", "parents", "rank_ids",
+               "children_indptr", "children_indices"]
+
+    def __init__(self, ranks, arrays):
+        self.ranks = list(ranks)
+        for name in self._ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def from_nodes(cls, tax_ids, parent_tax_ids, rank_ids, ranks):
+        """
+        Build the index from the nodes' `tax_ids`, `parent_tax_ids` and
+        `rank_ids` (into `ranks`). Nodes that are their own parent (or
+        have an unknown parent) are roots.
+        """
+        tax_ids = numpy.asarray(tax_ids, dtype=numpy.int64)
+        order = numpy.argsort(tax_ids, kind="mergesort")
+        tax_ids = tax_ids[order]
+        parent_tax_ids = numpy.asarray(parent_tax_ids,
+                                       dtype=numpy.int64)[order]
+        n = len(tax_ids)
+        parents = numpy.searchsorted(tax_ids, parent_tax_ids)
+        parents[parents == n] = 0
+        known = (tax_ids[parents] == parent_tax_ids) if n else \
+            numpy.zeros(0, dtype=bool)
+        parents[~known | (parents == numpy.arange(n))] = -1
+
+        has_parent = numpy.flatnonzero(parents >= 0)
+        children = has_parent[numpy.argsort(parents[has_parent],
+                                            kind="mergesort")]
+        indptr = numpy.zeros(n + 1, dtype=numpy.int64)
+        indptr[1:] = numpy.cumsum(
+            numpy.bincount(parents[has_parent], minlength=n))
+        arrays = {"tax_ids": tax_ids,
+                  "parents": parents.astype(numpy.int32),
+                  "rank_ids": numpy.asarray(rank_ids,
+                                            dtype=numpy.int16)[order],
+                  "children_indptr": indptr,
+                  "children_indices": children.astype(numpy.int32)}
+        return cls(ranks, arrays)
+
+    @classmethod
+    def from_db(cls, con):
+        """ Build the index from the nodes table of a taxonomy database. """
+        nodes = numpy.array(
+            con.execute("SELECT tax_id, parent_tax_id, rank_id FROM nodes")
+            .fetchall(), dtype=numpy.int64).reshape(-1, 3)
+        ranks = dict(con.execute("SELECT rank_id, rank FROM ranks"))
+        rank_ids = sorted(ranks)
+        rank_index = numpy.zeros(max(rank_ids or [0]) + 1, dtype=numpy.int64)
+        rank_index[rank_ids] = numpy.arange(len(rank_ids))
+        return cls.from_nodes(nodes[:, 0], nodes[:, 1],
+                              rank_index[nodes[:, 2]],
+                              [ranks[r] for r in rank_ids])
+
+    def __len__(self):
+        return len(self.tax_ids)
+
+    def index(self, tax_id):
+        """ Return the index of `tax_id` (raise KeyError if unknown). """
+        try:
+            value = int(tax_id)
+        except ValueError:
+            raise KeyError(tax_id)
+        i = self.tax_ids.searchsorted(value)
+        if i == len(self.tax_ids) or self.tax_ids[i] != value:
+            raise KeyError(tax_id)
+        return int(i)
+
+    def lineage(self, i):
+        """ Return a list of indices of the ancestors of the `i`-th node
+        from the root down. """
+        parents = self.parents
+        lineage = []
+        i = parents[i]
+        while i >= 0:
+            lineage.append(int(i))
+            i = parents[i]
+        return lineage[::-1]
+
+    def children(self, i):
+        """ Return an array of indices of the children of the `i`-th node.
+        """
+        return self.children_indices[
+            self.children_indptr[i]:self.children_indptr[i + 1]]
+
+    def descendants(self, indices, levels=None):
+        """
+        Return an array of indices of descendants of nodes in `indices`
+        at most `levels` (all if None) below them, level by level.
+        """
+        indptr, children = self.children_indptr, self.children_indices
+        frontier = numpy.asarray(indices, dtype=numpy.int64)
+        result = []
+        level = 0
+        while len(frontier) and (levels is None or level < levels):
+            starts, ends = indptr[frontier], indptr[frontier + 1]
+            counts = ends - starts
+            # concatenated children[starts[k]:ends[k]] ranges
+            offsets = numpy.repeat(starts - numpy.cumsum(counts) + counts,
+                                   counts)
+            frontier = children[offsets + numpy.arange(counts.sum())]
+            result.append(frontier)
+            level += 1
+        if not result:
+            return numpy.zeros(0, dtype=numpy.int32)
+        return numpy.concatenate(result)
+
+    @classmethod
+    def load(cls, filename, version):
+        """ Load a cached index for `version` or return None. """
+        try:
+            with numpy.load(filename) as f:
+                if str(f["version"]) != version:
+                    return None
+                arrays = dict((name, f[name]) for name in cls._ARRAYS)
+                ranks = list(f["ranks"])
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+        return cls(ranks, arrays)
+
+    def save(self, filename, version):
+        """ Cache the index in `filename` (failures are ignored). """
+        tmpname = "%s.%i.tmp.npz" % (filename, os.getpid())
+        arrays = dict((name, getattr(self, name)) for name in self._ARRAYS)
+        try:
+            numpy.savez(tmpname, version=numpy.array(version),
+                        ranks=numpy.array(self.ranks, dtype=six.text_type),
+                        **arrays)
+            if os.path.exists(filename):
+                os.remove(filename)
+            os.rename(tmpname, filename)
+        except (IOError, OSError):
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+
+
+class Taxonomy(Mapping):
     SCHEMA_VERSION = (0, 0, 1)
 
     def __init__(self, taxdb):
+        self._filename = taxdb
+        self._index = None
         self._con = sqlite3.connect(taxdb, timeout=15)
         self._con.execute("""
             CREATE INDEX IF NOT EXISTS
                 index_names_tax_id ON names(tax_id)
         """)
 
-    def __node_query(self, tax_id):
-        c = self._con.execute("""
-            SELECT nodes.tax_id, nodes.parent_tax_id, ranks.rank
-            FROM nodes INNER JOIN ranks USING(rank_id)
-            WHERE tax_id = ?
-        """, (tax_id,))
-        if not c:
-            raise KeyError(tax_id)
-        else:
-            return next(c)
+    @property
+    def index(self):
+        """
+        The :class:`TaxonomyIndex` of the nodes. It is built on first use
+        and cached next to the database file.
+        """
+        if self._index is None:
+            filename = self._filename + ".index.npz"
+            version = "%s %i %r" % (TaxonomyIndex.FORMAT,
+                                    os.path.getsize(self._filename),
+                                    os.path.getmtime(self._filename))
+            self._index = TaxonomyIndex.load(filename, version)
+            if self._index is None:
+                self._index = TaxonomyIndex.from_db(self._con)
+                self._index.save(filename, version)
+        return self._index
+
+    def __node(self, tax_id):
+        """ Return the index of `tax_id` in :attr:`index`. """
+        if not isinstance(tax_id, six.string_types):
+            raise TypeError("Expected a string")
+        return self.index.index(tax_id)
 
     def __getitem__(self, tax_id):
         if not isinstance(tax_id, six.string_types):
@@ -85,17 +250,18 @@ class Taxonomy(collections.Mapping):
         for name, name_class in names:
             if name_class == "scientific name":
                 scientific_name = name
-        node = self.__node_query(tax_id)
-        _, parent, rank = node
+        index = self.index
+        i = index.index(tax_id)
+        parent = index.parents[i]
+        parent = index.tax_ids[parent] if parent >= 0 else index.tax_ids[i]
+        rank = index.ranks[index.rank_ids[i]]
         return taxon(str(tax_id), str(parent), scientific_name, names, rank)
 
     def __iter__(self):
-        c = self._con.execute("SELECT tax_id FROM nodes")
-        return (str(r[0]) for r in c)
+        return (str(tax_id) for tax_id in self.index.tax_ids)
 
     def __len__(self):
-        c = self._con.execute("SELECT COUNT(*) FROM nodes")
-        return next(c)[0]
+        return len(self.index)
 
     def search(self, name, exact=True):
         # First ensure the name column is indexed.
@@ -117,39 +283,28 @@ class Taxonomy(collections.Mapping):
         return (str(r[0]) for r in c)
 
     def lineage(self, tax_id):
-        lineage = []
-        while True:
-            parent = self.parent_tax_id(tax_id)
-            if parent is not None:
-                lineage.append(parent)
-                tax_id = parent
-            else:
-                break
-        return list(reversed(lineage))
+        tax_ids = self.index.tax_ids
+        return [str(tax_ids[i])
+                for i in self.index.lineage(self.__node(tax_id))]
 
     def parent_tax_id(self, tax_id):
-        if not isinstance(tax_id, six.string_types):
-            raise TypeError("Expected a string")
-
-        node = self.__node_query(tax_id)
-        _, parent, _ = node
-        if parent == int(tax_id):
-            # The root (with tax_id 1) has itself as a parent
-            return None
-        else:
-            return str(parent)
+        parent = self.index.parents[self.__node(tax_id)]
+        # The root (with tax_id 1) has itself as a parent
+        return str(self.index.tax_ids[parent]) if parent >= 0 else None
 
     def child_tax_ids(self, tax_id):
-        if not isinstance(tax_id, six.string_types):
-            raise TypeError("Expected a string")
+        tax_ids = self.index.tax_ids
+        return [str(tax_ids[i])
+                for i in self.index.children(self.__node(tax_id))]
 
-        c = self._con.execute("""
-            SELECT tax_id
-            FROM nodes
-            WHERE parent_tax_id = ?
-        """, (tax_id,))
-        children = list(str(r[0]) for r in c if r[0] != 1)
-        return children
+    def subtree_tax_ids(self, tax_id, levels=None):
+        """
+        Return a list of all tax ids in the subtree of `tax_id` (without
+        it) at most `levels` (all if None) below it, level by level.
+        """
+        tax_ids = self.index.tax_ids
+        return [str(tax_ids[i]) for i in
+                self.index.descendants([self.__node(tax_id)], levels)]
 
     def name(self, tax_id):
         return self[tax_id].name
@@ -44,6 +44,8 @@ See the definition of the `.obo file format
 
 """
 from __future__ import print_function
+import gc
+import os
 import sys
 import re
 import warnings
@@ -56,6 +58,7 @@ from collections import defaultdict
 import six
 
 from six import StringIO
+from six.moves import cPickle as pickle
 
 try:
     from urllib2 import urlopen
@@ -200,6 +203,36 @@ def parse_tag_value(tag_value_string):
 
     return tag, value, modifiers, comment
 
+
+def _parse_tag_value_fast(tag_value_string):
+    """
+    Same as :func:`parse_tag_value` but faster for the (common) tag value
+    strings without escape characters.
+
+    >>> _parse_tag_value_fast("foo: bar [baz:0] { fizz=buzz } ! Comment")
+    ('foo', 'bar [baz:0]', 'fizz=buzz', 'Comment')
+
+    """
+    if "\\" in tag_value_string:
+        return parse_tag_value(tag_value_string)
+
+    comment = modifiers = None
+    i = tag_value_string.rfind("!")
+    if i != -1:
+        comment = tag_value_string[i + 1:].lstrip(" ")
+        tag_value_string = tag_value_string[:i].rstrip(" ")
+
+    tag, _, value = tag_value_string.partition(":")
+    tag, value = tag.rstrip(" "), value.lstrip(" ").rstrip()
+
+    if value.endswith("}"):
+        i = value.rfind("{")
+        if i != -1:
+            value, modifiers = value[:i].rstrip(" "), value[i + 1:]
+            modifiers = modifiers.lstrip(" ")[: -1].rstrip()
+
+    return tag, value, modifiers, comment
+
 _quotedstr_re = re.compile(r'"(.*?(?<!\\))"')
 
 
@@ -552,7 +585,7 @@ class OBOParser(object):
         #  For speed make these functions local
         startswith = str.startswith
         endswith = str.endswith
-        parse_tag_value_ = parse_tag_value
+        parse_tag_value_ = _parse_tag_value_fast
 
         for line in body.splitlines():
             if startswith(line, "[") and endswith(line, "]"):
@@ -586,6 +619,9 @@ class OBOOntology(object):
 
     BUILTINS = BUILTIN_OBO_OBJECTS
 
+    #: Format of the binary snapshots. Increase on incompatible changes.
+    SNAPSHOT_FORMAT = 1
+
     def __init__(self, file=None):
         self.objects = []
         self.header_tags = []
@@ -618,7 +654,7 @@ class OBOOntology(object):
         """
         self.header_tags.append((tag, value))
 
-    def load(self, file, progress_callback=None):
+    def load(self, file, progress_callback=None, snapshot=True):
         """
         Load terms from a file.
 
@@ -626,45 +662,119 @@ class OBOOntology(object):
             A file-like like object describing the ontology in obo format.
         :param function progress_callback:
             An optional function callback to report on the progress.
+        :param bool snapshot:
+            If `file` is a file name, save the parsed contents to a binary
+            snapshot file (`file` + ".snapshot") and load them from it
+            instead of parsing `file` until the file changes.
 
         """
+        # Garbage collection passes triggered by the many small tuples
+        # and lists would otherwise dominate the loading time.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._load(file, progress_callback, snapshot)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _load(self, file, progress_callback=None, snapshot=True):
+        header_tags = stanzas = None
+        snapshot_filename = key = None
         if isinstance(file, six.string_types):
-            if six.PY3:
-                file = open(file, "r", encoding="utf-8")
-            else:
-                file = open(file, "rb")
+            if snapshot and os.path.isfile(file):
+                stat = os.stat(file)
+                key = (self.SNAPSHOT_FORMAT, stat.st_size, stat.st_mtime)
+                snapshot_filename = file + ".snapshot"
+                header_tags, stanzas = \
+                    self._load_snapshot(snapshot_filename, key)
+            if stanzas is None:
+                if six.PY3:
+                    f = open(file, "r", encoding="utf-8")
+                else:
+                    f = open(file, "rb")
+                with f:
+                    header_tags, stanzas = self._parse(f, progress_callback)
+                if snapshot_filename is not None:
+                    self._save_snapshot(snapshot_filename, key,
+                                        header_tags, stanzas)
+        else:
+            header_tags, stanzas = self._parse(file, progress_callback)
+
+        for tag, value in header_tags:
+            self.add_header_tag(tag, value)
+        for stanza_type, tag_values in stanzas:
+            obj = OBOObject.Dispatch[stanza_type]()
+            obj.add_tags(tag_values)
+            self.add_object(obj)
+
+        imports = [value for tag, value in self.header_tags
+                   if tag == "import"]
+
+        if imports:
+            warnings.warn("Import header tags are not supported")
 
+#        while imports:
+#            url = imports.pop(0)
+#            if uri not in self._resolved_imports:
+#                imported = self.parse_file(open(url, "rb"))
+#                ontology.update(imported)
+#                self._resolved_imports.append(uri)
+
+    @staticmethod
+    def _parse(file, progress_callback=None):
+        """
+        Parse a file and return a list of header (tag, value) pairs and
+        a list of (stanza type, list of tag value tuples) pairs.
+        """
         parser = OBOParser(file)
+        header_tags, stanzas = [], []
         current = None
         tag_values = []
         for event, value in parser.parse(progress_callback=progress_callback):
             if event == "TAG_VALUE":
                 tag_values.append(value)
             elif event == "START_STANZA":
-                current = OBOObject.Dispatch[value]()
+                current = value
             elif event == "CLOSE_STANZA":
-                current.add_tags(tag_values)
-                self.add_object(current)
+                if current is not None:
+                    stanzas.append((current, tag_values))
                 current = None
                 tag_values = []
             elif event == "HEADER_TAG":
-                self.add_header_tag(*value)
+                header_tags.append(tuple(value))
             elif event != "COMMENT":
                 raise Exception("Parse Error! Unknown parse "
                                 "event {0}".format(event))
+        return header_tags, stanzas
 
-        imports = [value for tag, value in self.header_tags
-                   if tag == "import"]
-
-        if imports:
-            warnings.warn("Import header tags are not supported")
-
-#        while imports:
-#            url = imports.pop(0)
-#            if uri not in self._resolved_imports:
-#                imported = self.parse_file(open(url, "rb"))
-#                ontology.update(imported)
-#                self._resolved_imports.append(uri)
+    @staticmethod
+    def _load_snapshot(filename, key):
+        """
+        Return parsed contents from a snapshot file if it was saved
+        with `key` or (None, None).
+        """
+        try:
+            with open(filename, "rb") as f:
+                if pickle.load(f) == key:
+                    return pickle.load(f)
+        except Exception:
+            pass
+        return None, None
+
+    @staticmethod
+    def _save_snapshot(filename, key, header_tags, stanzas):
+        tmpname = "%s.%i.tmp" % (filename, os.getpid())
+        try:
+            with open(tmpname, "wb") as f:
+                pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump((header_tags, stanzas), f,
+                            pickle.HIGHEST_PROTOCOL)
+            if os.path.exists(filename):
+                os.remove(filename)
+            os.rename(tmpname, filename)
+        except (IOError, OSError):
+            pass
 
     def dump(self, file):
         # deprecated use write
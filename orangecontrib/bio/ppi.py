@@ -14,10 +14,16 @@ import sqlite3
 import errno
 import posixpath
 import textwrap
+import io
+import multiprocessing
+from contextlib import contextmanager
+
+import numpy
+from six.moves import cPickle as pickle
 
 
 from io import StringIO, BytesIO
-from collections import defaultdict, namedtuple
+from collections import defaultdict, namedtuple, OrderedDict
 from operator import itemgetter
 
 from .utils import serverfiles
@@ -55,6 +61,268 @@ def mkdir_p(path, mode=0o777):
             raise
 
 
+def _read_table(filename, sep, title=None, chunk_size=2 ** 22):
+    """
+    Read a gzipped `sep` separated table (skipping the header line) in
+    chunks of about `chunk_size` bytes and yield an iterator over the
+    rows of each chunk.
+    """
+    size = os.stat(filename).st_size
+    progress = ConsoleProgressBar(title or "Processing {}:".format(
+        os.path.basename(filename)))
+    progress(0.0)
+    with open(filename, "rb") as raw:
+        stream = io.TextIOWrapper(gzip.GzipFile(fileobj=raw),
+                                  encoding="utf-8")
+        stream.readline()  # skip the header line
+        while True:
+            lines = stream.readlines(chunk_size)
+            if not lines:
+                break
+            yield csv.reader(lines, delimiter=sep)
+            progress(100.0 * raw.tell() / max(size, 1))
+    progress.finish()
+
+
+#: sqlite page cache size (in KiB) for a bulk load, so the indices are
+#: created mostly in memory.
+_BULK_CACHE_SIZE = 2 ** 18
+
+
+@contextmanager
+def _bulk_build(dbfilename):
+    """
+    Return a context with a connection to a new sqlite database tuned for
+    a bulk load (no journal, no sync, a large page cache). The database
+    replaces `dbfilename` only when the context exits without errors.
+    """
+    tmpname = "%s.%i.tmp" % (dbfilename, os.getpid())
+    if os.path.exists(tmpname):
+        os.remove(tmpname)
+    con = sqlite3.connect(tmpname)
+    try:
+        con.execute("PRAGMA journal_mode=OFF")
+        con.execute("PRAGMA synchronous=OFF")
+        con.execute("PRAGMA cache_size=-%i" % _BULK_CACHE_SIZE)
+        with con:
+            yield con
+        con.close()
+        if os.path.exists(dbfilename):
+            os.remove(dbfilename)
+        os.rename(tmpname, dbfilename)
+    except BaseException:
+        con.close()
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+
+
+def _init_db_task(args):
+    cls, version, taxid = args
+    cls.init_db(version, taxid)
+    return taxid
+
+
+class NetworkSnapshot(object):
+    """
+    A compressed (CSR) adjacency of a protein interaction network.
+
+    Proteins are numbered by their position in the sorted `ids`. The
+    interactions of the `i`-th protein are the edges
+    ``indptr[i]:indptr[i + 1]`` with the target proteins in `targets`.
+    Edge attributes (e.g. 'score') are arrays in `columns`, aligned with
+    `targets`. An 'actions' column (if present) is a bit mask of the
+    `action_types` of an edge.
+
+    """
+    #: Format of the cached snapshot. Increase on incompatible changes.
+    FORMAT = 1
+
+    def __init__(self, ids, indptr, targets, columns=None, action_types=()):
+        self.ids = list(ids)
+        self.id_index = dict((id, i) for i, id in enumerate(self.ids))
+        self.indptr = indptr
+        self.targets = targets
+        self.columns = dict(columns or {})
+        self.action_types = list(action_types)
+
+    @classmethod
+    def from_edges(cls, ids, id1, id2, columns=None, symmetric=False,
+                   actions=None):
+        """
+        Build a snapshot from edges (`id1[i]`, `id2[i]`) between the
+        proteins in `ids`. Duplicated edges are merged (keeping the
+        largest value of each column). With `symmetric` every edge is
+        also added in the reverse direction. `actions` is an optional
+        (id1, id2, action_type) sequence.
+
+        """
+        ids = sorted(set(ids).union(id1, id2))
+        index = dict((id, i) for i, id in enumerate(ids))
+        n = len(ids)
+        src = numpy.array([index[id] for id in id1], dtype=numpy.int64)
+        dst = numpy.array([index[id] for id in id2], dtype=numpy.int64)
+        columns = dict((name, numpy.asarray(values, dtype=float))
+                       for name, values in (columns or {}).items())
+        if symmetric:
+            src, dst = (numpy.concatenate([src, dst]),
+                        numpy.concatenate([dst, src]))
+            columns = dict((name, numpy.concatenate([values, values]))
+                           for name, values in columns.items())
+
+        keys = src * n + dst
+        order = numpy.argsort(keys, kind="mergesort")
+        keys = keys[order]
+        first = numpy.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        starts = numpy.flatnonzero(first)
+        keys = keys[starts]
+        for name, values in list(columns.items()):
+            values = values[order]
+            if len(values):
+                values = numpy.where(numpy.isnan(values), -numpy.inf, values)
+                values = numpy.maximum.reduceat(values, starts)
+                values[numpy.isneginf(values)] = numpy.nan
+            columns[name] = values.astype(numpy.float32)
+
+        indptr = numpy.zeros(n + 1, dtype=numpy.int64)
+        indptr[1:] = numpy.cumsum(numpy.bincount(keys // n, minlength=n))
+        targets = (keys % n).astype(numpy.int32)
+
+        action_types = []
+        if actions is not None:
+            actions = list(actions)
+            action_types = sorted(set(a for _, _, a in actions))
+            bits = dict((a, 1 << i) for i, a in enumerate(action_types))
+            mask = numpy.zeros(len(keys), dtype=numpy.uint32)
+            found = [(index.get(a1), index.get(a2), bits[a])
+                     for a1, a2, a in actions]
+            found = [f for f in found if f[0] is not None and f[1] is not None]
+            if found:
+                akeys = numpy.array([a1 * n + a2 for a1, a2, _ in found],
+                                    dtype=numpy.int64)
+                abits = numpy.array([b for _, _, b in found],
+                                    dtype=numpy.uint32)
+                pos = numpy.searchsorted(keys, akeys)
+                valid = pos < len(keys)
+                valid[valid] = keys[pos[valid]] == akeys[valid]
+                numpy.bitwise_or.at(mask, pos[valid], abits[valid])
+            columns["actions"] = mask
+        return cls(ids, indptr, targets, columns, action_types)
+
+    def indices(self, ids):
+        """ Return an array of protein indices for `ids` (unknown ids
+        are skipped). """
+        return numpy.array([self.id_index[id] for id in ids
+                            if id in self.id_index], dtype=numpy.int64)
+
+    def edges(self, nodes):
+        """
+        Return (sources, edges) arrays of all edges (their positions in
+        `targets`) of protein indices `nodes`.
+        """
+        nodes = numpy.asarray(nodes, dtype=numpy.int64)
+        starts = self.indptr[nodes]
+        lengths = self.indptr[nodes + 1] - starts
+        offsets = numpy.repeat(starts - numpy.cumsum(lengths) + lengths,
+                               lengths)
+        edges = offsets + numpy.arange(lengths.sum())
+        return numpy.repeat(nodes, lengths), edges
+
+    def _filter(self, edges, min_score):
+        if min_score is None:
+            return edges
+        return edges[self.columns["score"][edges] >= min_score]
+
+    def neighbors(self, nodes, min_score=None, hops=1):
+        """
+        Return a sorted array of protein indices within `hops` edges
+        (with a score of at least `min_score`) of `nodes` (including
+        `nodes` themselves).
+        """
+        visited = numpy.zeros(len(self.ids), dtype=bool)
+        frontier = numpy.unique(numpy.asarray(nodes, dtype=numpy.int64))
+        visited[frontier] = True
+        for _ in range(hops):
+            if not len(frontier):
+                break
+            _, edges = self.edges(frontier)
+            reached = self.targets[self._filter(edges, min_score)]
+            frontier = numpy.unique(reached[~visited[reached]])
+            visited[frontier] = True
+        return numpy.flatnonzero(visited)
+
+    def subgraph(self, nodes, min_score=None):
+        """
+        Return (sources, targets, edges) arrays for all edges between
+        protein indices in `nodes` (with a score of at least `min_score`).
+        """
+        nodes = numpy.unique(numpy.asarray(nodes, dtype=numpy.int64))
+        member = numpy.zeros(len(self.ids), dtype=bool)
+        member[nodes] = True
+        sources, edges = self.edges(nodes)
+        keep = member[self.targets[edges]]
+        if min_score is not None:
+            keep &= self.columns["score"][edges] >= min_score
+        edges = edges[keep]
+        return sources[keep], self.targets[edges], edges
+
+    @classmethod
+    def load(cls, path, version):
+        """ Load a snapshot (memory-mapped) from the `path` directory or
+        return None if it is not for `version`. """
+        try:
+            with open(os.path.join(path, "info.pickle"), "rb") as f:
+                info = pickle.load(f)
+            if info["version"] != version:
+                return None
+
+            def array(name):
+                return numpy.load(os.path.join(path, name + ".npy"),
+                                  mmap_mode="r")
+            columns = dict((name, array("column." + name))
+                           for name in info["columns"])
+            return cls(info["ids"], array("indptr"), array("targets"),
+                       columns, info["action_types"])
+        except (IOError, OSError, KeyError, ValueError, EOFError,
+                pickle.UnpicklingError):
+            return None
+
+    def save(self, path, version):
+        """ Save the snapshot in the `path` directory (failures are
+        ignored). """
+        tmppath = "%s.%i.tmp" % (path, os.getpid())
+        try:
+            mkdir_p(tmppath)
+            numpy.save(os.path.join(tmppath, "indptr.npy"), self.indptr)
+            numpy.save(os.path.join(tmppath, "targets.npy"), self.targets)
+            for name, values in self.columns.items():
+                numpy.save(os.path.join(tmppath, "column." + name + ".npy"),
+                           values)
+            info = {"version": version, "ids": self.ids,
+                    "columns": sorted(self.columns),
+                    "action_types": self.action_types}
+            with open(os.path.join(tmppath, "info.pickle"), "wb") as f:
+                pickle.dump(info, f, protocol=2)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.rename(tmppath, path)
+        except (IOError, OSError):
+            shutil.rmtree(tmppath, ignore_errors=True)
+
+
+#: The result of :func:`PPIDatabase.search_ids`. `ids` is a list with the
+#: primary id of each searched name (``None`` if the name is ambiguous or
+#: unmatched), `ambiguous` maps ambiguous names to all their ids and
+#: `unmatched` lists the names with no match.
+IdMapping = namedtuple("IdMapping", ["ids", "ambiguous", "unmatched"])
+
+#: Number of alias indices (one per database and taxid) kept in memory
+ALIAS_INDEX_CACHE_SIZE = 4
+
+_alias_indices = OrderedDict()
+
+
 class PPIDatabase(object):
     """
     A general interface for protein-protein interaction database access.
@@ -138,19 +406,161 @@ class PPIDatabase(object):
         """
         raise NotImplementedError
 
+    def synonyms_batch(self, ids):
+        """
+        Return a dictionary with a list of synonyms (as returned by
+        `synonyms`) for each of the primary `ids`.
+        """
+        return {id: self.synonyms(id) for id in ids}
+
+    def _alias_pairs(self, taxid=None):
+        """
+        Return an iterable of (name, primary id) pairs the database can be
+        searched with.
+        """
+        for id in self.ids(taxid):
+            for name in self.synonyms(id):
+                yield name, id
+
+    def alias_index(self, taxid=None):
+        """
+        Return a dictionary mapping names to primary ids (a tuple of
+        ids for ambiguous names). The index is built on first use and
+        the last :data:`ALIAS_INDEX_CACHE_SIZE` are kept in memory.
+
+        """
+        filename = getattr(self, "filename", None)
+        if filename is not None:
+            key = (type(self).__name__, os.path.abspath(filename),
+                   os.path.getsize(filename), os.path.getmtime(filename),
+                   taxid)
+            cache = _alias_indices
+        else:
+            key = taxid
+            cache = self.__dict__.setdefault("_alias_indices", {})
+
+        index = cache.pop(key, None)
+        if index is None:
+            index = {}
+            for name, id in self._alias_pairs(taxid):
+                current = index.setdefault(name, id)
+                if current == id:
+                    continue
+                elif not isinstance(current, tuple):
+                    index[name] = (current, id)
+                elif id not in current:
+                    index[name] = current + (id,)
+        cache[key] = index
+        if cache is _alias_indices:
+            while len(cache) > ALIAS_INDEX_CACHE_SIZE:
+                cache.popitem(last=False)
+        return index
+
+    def search_ids(self, names, taxid=None):
+        """
+        Search the database for a list of protein names at once. Return
+        an :class:`IdMapping` with the primary id of each name and the
+        ambiguous and unmatched names. Use `taxid` to limit the results
+        to a single organism.
+
+        """
+        index = self.alias_index(taxid)
+        ids, ambiguous, unmatched = [], {}, []
+        for name in names:
+            id = index.get(name)
+            if isinstance(id, tuple):
+                ambiguous[name] = sorted(id)
+                id = None
+            elif id is None:
+                unmatched.append(name)
+            ids.append(id)
+        return IdMapping(ids, ambiguous, unmatched)
+
+    #: Suffix of the network snapshot directory (next to the database).
+    SNAPSHOT_SUFFIX = ".network"
+
+    def _snapshot_files(self):
+        """
+        Return a list of database files the network snapshot is made from.
+        """
+        filename = getattr(self, "filename", None)
+        return [filename] if filename is not None else []
+
+    def _snapshot_data(self):
+        """
+        Return (ids, id1, id2, columns, actions) for
+        :func:`NetworkSnapshot.from_edges`.
+        """
+        raise NotImplementedError
+
+    #: Are the database links undirected
+    SYMMETRIC = False
+
+    #: Maximum number of ids bound in a single query
+    MAX_VARIABLES = 500
+
+    def network_snapshot(self):
+        """
+        Return a :class:`NetworkSnapshot` of the database. It is built
+        on first use and cached next to the database file.
+        """
+        if getattr(self, "_snapshot", None) is None:
+            files = self._snapshot_files()
+            path = version = None
+            if files:
+                path = files[0] + self.SNAPSHOT_SUFFIX
+                version = (NetworkSnapshot.FORMAT,) + tuple(
+                    (os.path.getsize(f), os.path.getmtime(f)) for f in files)
+                self._snapshot = NetworkSnapshot.load(path, version)
+            if getattr(self, "_snapshot", None) is None:
+                ids, id1, id2, columns, actions = self._snapshot_data()
+                self._snapshot = NetworkSnapshot.from_edges(
+                    ids, id1, id2, columns, symmetric=self.SYMMETRIC,
+                    actions=actions)
+                if path is not None:
+                    self._snapshot.save(path, version)
+        return self._snapshot
+
+    def neighbors(self, ids, min_score=None, hops=1):
+        """
+        Return a sorted list of protein ids within `hops` interactions
+        (with a score of at least `min_score`) of any of `ids`. The `ids`
+        in the database are included.
+
+        """
+        snapshot = self.network_snapshot()
+        nodes = snapshot.neighbors(snapshot.indices(ids), min_score, hops)
+        return [snapshot.ids[i] for i in nodes]
+
+    def subgraph(self, ids, min_score=None):
+        """
+        Return a list of all edges (3-tuples (id1, id2, score)) between
+        proteins in `ids` (with a score of at least `min_score`).
+        """
+        snapshot = self.network_snapshot()
+        sources, targets, edges = snapshot.subgraph(snapshot.indices(ids),
+                                                    min_score)
+        scores = snapshot.columns["score"][edges]
+        ids = snapshot.ids
+        return [(ids[i], ids[j], None if score != score else float(score))
+                for i, j, score in zip(sources, targets, scores)]
+
     def extract_network(self, ids):
         """
         """
         from Orange import network
 
         graph = network.Graph()
+        synonyms = self.synonyms_batch(ids)
         for id in ids:
-            graph.add_node(id, synonyms=",".join(self.synonyms(id)))
-
-        for id in ids:
-            edges = self.edges(id)
-
-            for id1, id2, score in edges:
+            graph.add_node(id, synonyms=",".join(synonyms[id]))
+
+        # all interactions of ids, including those with their (first)
+        # neighbors outside of ids
+        members = set(ids)
+        nodes = members.union(self.neighbors(ids))
+        for id1, id2, score in self.subgraph(nodes):
+            if id1 in members:
                 graph.add_edge(id1, id2, weight=score)
 
         return graph
@@ -254,6 +664,8 @@ class BioGRID(PPIDatabase):
         "31033": None
     }
 
+    SYMMETRIC = True
+
     def __init__(self):
         self.filename = serverfiles.localpath_download(
             self.DOMAIN, self.SERVER_FILE)
@@ -301,12 +713,59 @@ class BioGRID(PPIDatabase):
             (id,))
         rec = cur.fetchone()
         if rec:
-            synonyms = list(rec[:-1]) + \
-                       (rec[-1].split("|") if rec[-1] is not None else [])
-            return [s for s in synonyms if s is not None]
+            return self._synonyms_list(rec)
         else:
             return []
 
+    @staticmethod
+    def _synonyms_list(rec):
+        synonyms = list(rec[:-1]) + \
+                   (rec[-1].split("|") if rec[-1] is not None else [])
+        return [s for s in synonyms if s is not None]
+
+    def synonyms_batch(self, ids):
+        """
+        Return a dictionary with a list of synonyms for each of the
+        primary `ids`.
+        """
+        res = {id: [] for id in ids}
+        ids = list(res)  # unique
+        for start in range(0, len(ids), self.MAX_VARIABLES):
+            chunk = ids[start: start + self.MAX_VARIABLES]
+            cur = self.db.execute("""\
+                select biogrid_id_interactor,
+                       entrez_gene_interactor,
+                       systematic_name_interactor,
+                       official_symbol_interactor,
+                       synonyms_interactor
+                from proteins
+                where biogrid_id_interactor in (%s)""" %
+                ", ".join("?" * len(chunk)), chunk)
+            for rec in cur:
+                if not res[rec[0]]:
+                    res[rec[0]] = self._synonyms_list(rec[1:])
+        return res
+
+    def _alias_pairs(self, taxid=None):
+        # Unlike `search_id` this also matches the individual synonyms
+        # in synonyms_interactor.
+        query = """\
+            select biogrid_id_interactor,
+                   entrez_gene_interactor,
+                   systematic_name_interactor,
+                   official_symbol_interactor,
+                   synonyms_interactor
+            from proteins"""
+        if taxid is None:
+            cur = self.db.execute(query)
+        else:
+            cur = self.db.execute(query + """
+            where organism_interactor=?""", (taxid,))
+        for rec in cur:
+            yield rec[0], rec[0]
+            for name in self._synonyms_list(rec[1:]):
+                yield name, rec[0]
+
     def all_edges(self, taxid=None):
         """
         Return a list of all edges. If taxid is not None return the
@@ -315,7 +774,7 @@ class BioGRID(PPIDatabase):
         """
         if taxid is not None:
             cur = self.db.execute("""\
-                select biogrid_id_interactor_a, biogrid_id_interactor_a, score
+                select biogrid_id_interactor_a, biogrid_id_interactor_b, score
                 from links left join proteins on
                     biogrid_id_interactor_a=biogrid_id_interactor or
                     biogrid_id_interactor_b=biogrid_id_interactor
@@ -323,12 +782,21 @@ class BioGRID(PPIDatabase):
             """, (taxid,))
         else:
             cur = self.db.execute("""\
-                select biogrid_id_interactor_a, biogrid_id_interactor_a, score
+                select biogrid_id_interactor_a, biogrid_id_interactor_b, score
                 from links
             """)
         edges = cur.fetchall()
         return edges
 
+    def _snapshot_data(self):
+        links = self.db.execute("""\
+            select biogrid_id_interactor_a, biogrid_id_interactor_b, score
+            from links
+        """).fetchall()
+        id1, id2, score = zip(*links) if links else ((), (), ())
+        score = [numpy.nan if s is None else s for s in score]
+        return self.ids(), id1, id2, {"score": score}, None
+
     def edges(self, id):
         """
         Return a list of all interactions where id is a participant
@@ -654,6 +1122,38 @@ class STRING(PPIDatabase):
         res = cur.fetchall()
         return [r[0] for r in res]
 
+    def synonyms_batch(self, ids):
+        """
+        Return a dictionary with a list of synonyms for each of the
+        primary `ids`.
+        """
+        res = {id: [] for id in ids}
+        ids = list(res)  # unique
+        for start in range(0, len(ids), self.MAX_VARIABLES):
+            chunk = ids[start: start + self.MAX_VARIABLES]
+            cur = self.db.execute("""\
+                select protein_id, alias
+                from aliases
+                where protein_id in (%s)
+                """ % ", ".join("?" * len(chunk)), chunk)
+            for id, alias in cur:
+                res[id].append(alias)
+        return res
+
+    def _alias_pairs(self, taxid=None):
+        if taxid is None:
+            cur = self.db.execute("""\
+                select aliases.alias, proteins.protein_id
+                from proteins natural join aliases
+            """)
+        else:
+            cur = self.db.execute("""\
+                select aliases.alias, proteins.protein_id
+                from proteins natural join aliases
+                where proteins.taxid=?
+            """, (taxid,))
+        return cur
+
     def synonyms_with_source(self, id):
         """
         Return a list of synonyms for primary `id` along with its
@@ -686,7 +1186,7 @@ class STRING(PPIDatabase):
                 """, (taxid,))
         else:
             cur = self.db.execute("""\
-                select protein_id1, protein_id1, score
+                select protein_id1, protein_id2, score
                 from links
                 """)
         return cur.fetchall()
@@ -702,16 +1202,39 @@ class STRING(PPIDatabase):
             """, (id,))
         return cur.fetchall()
 
+    def _snapshot_data(self):
+        links = self.db.execute("""\
+            select protein_id1, protein_id2, score
+            from links
+            """).fetchall()
+        id1, id2, score = zip(*links) if links else ((), (), ())
+        actions = self.db.execute("""\
+            select protein_id1, protein_id2, mode
+            from actions
+            """).fetchall()
+        return self.ids(), id1, id2, {"score": score}, actions
+
     def all_edges_annotated(self, taxid=None):
-        res = []
-        for id in self.ids(taxid):
-            res.extend(self.edges_annotated(id))
-        return res
+        query = """\
+            select links.protein_id1, links.protein_id2, links.score,
+                   actions.mode, actions.action, actions.score
+            from links left join actions on
+                   links.protein_id1=actions.protein_id1 and
+                   links.protein_id2=actions.protein_id2
+            """
+        if taxid is not None:
+            cur = self.db.execute(query + """\
+                join proteins on links.protein_id1=proteins.protein_id
+                where proteins.taxid=?
+                """, (taxid,))
+        else:
+            cur = self.db.execute(query)
+        return list(map(STRINGInteraction._make, cur.fetchall()))
 
     def edges_annotated(self, id):
         cur = self.db.execute("""\
             select links.protein_id1, links.protein_id2, links.score,
-                   actions.action, actions.mode, actions.score
+                   actions.mode, actions.action, actions.score
             from links left join actions on
                    links.protein_id1=actions.protein_id1 and
                    links.protein_id2=actions.protein_id2
@@ -735,16 +1258,28 @@ class STRING(PPIDatabase):
         return map(itemgetter(0), cur)
 
     @classmethod
-    def download_data(cls, version, taxids=None):
+    def download_data(cls, version, taxids=None, processes=1):
         """
         Download the  PPI data for local work (this may take some time).
-        Pass the version of the  STRING release e.g. v9.1.
+        Pass the version of the  STRING release e.g. v9.1. With
+        `processes` > 1 the databases for several taxids are built in
+        parallel processes.
         """
         if taxids is None:
             taxids = cls.common_taxids()
-
-        for taxid in taxids:
-            cls.init_db(version, taxid)
+        taxids = list(taxids)
+
+        if processes > 1 and len(taxids) > 1:
+            pool = multiprocessing.Pool(min(processes, len(taxids)))
+            try:
+                pool.map(_init_db_task,
+                         [(cls, version, taxid) for taxid in taxids])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for taxid in taxids:
+                cls.init_db(version, taxid)
 
     @classmethod
     def init_db(cls, version, taxid, cache_dir=None, dbfilename=None):
@@ -763,9 +1298,6 @@ class STRING(PPIDatabase):
             url = url.format(flatfile=flatfile, version=version, taxid=taxid)
             return posixpath.basename(url), base_url + url
 
-        def ffname(pattern):
-            return pattern.format(taxid=taxid, version=version)
-
         links_filename, links_url = paths("protein.links")
 
         actions_filename, actions_url = paths("protein.actions")
@@ -785,93 +1317,51 @@ class STRING(PPIDatabase):
             if not os.path.exists(pjoin(cache_dir, fname)):
                 download(fname, url)
 
-        links_fileobj = open(pjoin(cache_dir, links_filename), "rb")
-        actions_fileobj = open(pjoin(cache_dir, actions_filename), "rb")
-        aliases_fileobj = open(pjoin(cache_dir, aliases_filename), "rb")
-
-        # python 3 support
-        links_file = gzip.open(pjoin(cache_dir, links_filename), mode='rt')
-        actions_file = gzip.open(pjoin(cache_dir, actions_filename), mode='rt')
-        aliases_file = gzip.open(pjoin(cache_dir, aliases_filename), mode='rt')
-
-        progress = ConsoleProgressBar("Processing {}:".format(links_filename))
-        progress(0.0)
-
-        def st_size(filename):
-            return os.stat(pjoin(cache_dir, filename)).st_size
+        cls.build_db(dbfilename, version,
+                     pjoin(cache_dir, links_filename),
+                     pjoin(cache_dir, actions_filename),
+                     pjoin(cache_dir, aliases_filename))
 
-        filesize = st_size(links_filename)
+    @classmethod
+    def build_db(cls, dbfilename, version, links_filename, actions_filename,
+                 aliases_filename):
+        """
+        Build the database `dbfilename` from the STRING protein.links,
+        protein.actions and protein.aliases (gzipped) files.
 
-        con = sqlite3.connect(dbfilename)
+        The files are read in large chunks and inserted with no journal
+        and with the indices created after the load. The rows are passed
+        to sqlite as read (the INT columns convert the scores).
 
-        with con:
+        """
+        with _bulk_build(dbfilename) as con:
             cls.clear_db(con)
 
-            links_file.readline()  # read the header line
-
-            reader = csv.reader(links_file, delimiter=" ")
-
-            def read_links(reader, progress):
-                for i, (p1, p2, score) in enumerate(reader):
-                    yield p1, p2, int(score)
-
-                    if i % 100000 == 0:
-                        # Update the progress every 100000 lines
-                        progress(100.0 * links_fileobj.tell() / filesize)
-
-            con.executemany("INSERT INTO links VALUES (?, ?, ?)",
-                            read_links(reader, progress))
-
-            progress.finish()
-
-            def part(string, sep, part):
-                return string.split(sep)[part]
+            for rows in _read_table(links_filename, " "):
+                con.executemany("INSERT INTO links VALUES (?, ?, ?)", rows)
 
-            con.create_function("part", 3, part)
             con.execute("""
                 INSERT INTO proteins
-                SELECT protein_id1, part(protein_id1, '.', 0)
+                SELECT protein_id1,
+                       substr(protein_id1, 1, instr(protein_id1, '.') - 1)
                 FROM (SELECT DISTINCT(protein_id1)
-                     FROM links
-                     ORDER BY protein_id1)
+                      FROM links
+                      ORDER BY protein_id1)
             """)
 
-            filesize = st_size(actions_filename)
-
-            actions_file.readline()  # read header line
-
-            progress = ConsoleProgressBar("Processing actions:")
-            reader = csv.reader(actions_file, delimiter="\t")
-
-            def read_actions(reader):
-                for i, (p1, p2, mode, action, a_is_acting, score) in \
-                        enumerate(reader):
-                    yield p1, p2, mode, action, int(score)
-
-                    if i % 10000 == 0:
-                        progress(100.0 * actions_fileobj.tell() / filesize)
-
-            con.executemany("INSERT INTO actions VALUES (?, ?, ?, ?, ?)",
-                            read_actions(reader))
-
-            progress.finish()
-
-            filesize = st_size(aliases_filename)
-            aliases_file.readline()  # read header line
-            progress = ConsoleProgressBar("Processing aliases:")
-
-            reader = csv.reader(aliases_file, delimiter="\t")
-
-            def read_aliases(reader, progress):
-                for i, (taxid_proteinid, alias, source) in enumerate(reader):
-                    yield (taxid_proteinid, alias, source)
-                    if i % 10000 == 0:
-                        progress(100.0 * aliases_fileobj.tell() / filesize)
-
-            con.executemany("INSERT INTO aliases VALUES (?, ?, ?)",
-                            read_aliases(reader, progress))
+            # Columns: item_id_a, item_id_b, mode, action, [is_directional,]
+            # a_is_acting, score
+            for rows in _read_table(actions_filename, "\t",
+                                    "Processing actions:"):
+                con.executemany(
+                    "INSERT INTO actions VALUES (?, ?, ?, ?, ?)",
+                    ((r[0], r[1], r[2], r[3], r[-1]) for r in rows))
 
-            progress.finish()
+            # Columns: [taxid,] protein_id, alias, source
+            for rows in _read_table(aliases_filename, "\t",
+                                    "Processing aliases:"):
+                con.executemany("INSERT INTO aliases VALUES (?, ?, ?)",
+                                (r[-3:] for r in rows))
 
             print("Indexing the database")
             cls.create_db_index(con)
@@ -1003,9 +1493,35 @@ class STRINGDetailed(STRING):
             detailed_database = serverfiles.localpath_download(
                 "PPI", "string-protein-detailed.sqlite")
 
+        self.detailed_filename = detailed_database
         self.db_detailed = sqlite3.connect(detailed_database)
         self.db_detailed.execute("ATTACH DATABASE ? as string", (db_file,))
 
+    SNAPSHOT_SUFFIX = ".detailed.network"
+
+    #: Evidence channels (score columns of the detailed network snapshot)
+    CHANNELS = ["neighborhood", "fusion", "cooccurence", "coexpression",
+                "experimental", "database", "textmining"]
+
+    def _snapshot_files(self):
+        return STRING._snapshot_files(self) + [self.detailed_filename]
+
+    def _snapshot_data(self):
+        ids, id1, id2, columns, actions = STRING._snapshot_data(self)
+        index = dict(((a, b), i) for i, (a, b) in enumerate(zip(id1, id2)))
+        channels = numpy.zeros((len(id1), len(self.CHANNELS)))
+        cur = self.db_detailed.execute("""
+            SELECT protein_id1, protein_id2, %s
+            FROM evidence
+            """ % ", ".join(self.CHANNELS))
+        for row in cur:
+            i = index.get(row[:2])
+            if i is not None:
+                channels[i] = row[2:]
+        for j, name in enumerate(self.CHANNELS):
+            columns[name] = channels[:, j]
+        return ids, id1, id2, columns, actions
+
     def edges_annotated(self, id):
         edges = STRING.edges_annotated(self, id)
         edges_nc = []
@@ -1049,15 +1565,15 @@ class STRINGDetailed(STRING):
             with open(pjoin(cache_dir, filename), "wb") as dest:
                 wget(url, dest, progress=True)
 
-        links_fileobj = open(pjoin(cache_dir, filename), "rb")
-        links_file = gzip.open(pjoin(cache_dir, filename), mode='rt')
-
-        con = sqlite3.connect(dbfilename)
-        with con:
-            con.execute("""
-                DROP TABLE IF EXISTS evidence
-            """)
+        cls.build_detailed_db(dbfilename, version, pjoin(cache_dir, filename))
 
+    @classmethod
+    def build_detailed_db(cls, dbfilename, version, links_filename):
+        """
+        Build the detailed database `dbfilename` from a STRING
+        protein.links.detailed (gzipped) file (see :func:`STRING.build_db`).
+        """
+        with _bulk_build(dbfilename) as con:
             con.execute("""
                 CREATE TABLE evidence(
                      protein_id1 TEXT,
@@ -1072,28 +1588,12 @@ class STRINGDetailed(STRING):
                     )
                 """)
 
-            links_file.readline()  # Read header
-            links = csv.reader(links_file, delimiter=" ")
-
-            filesize = os.stat(pjoin(cache_dir, filename)).st_size
-
-            progress = ConsoleProgressBar("Processing links file:")
-            progress(1.0)
-
-            def read_links(reader):
-                for i, (p1, p2, n, f, c, cx, ex, db, t, _) in \
-                        enumerate(reader):
-                    yield p1, p2, n, f, c, cx, ex, db, t
-
-                    if i % 10000 == 0:
-                        progress(100.0 * links_fileobj.tell() / filesize)
-
-            con.executemany("""
-                INSERT INTO evidence
-                VALUES  (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, read_links(links))
-
-            progress.finish()
+            for rows in _read_table(links_filename, " ",
+                                    "Processing links file:"):
+                con.executemany("""
+                    INSERT INTO evidence
+                    VALUES  (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (r[:9] for r in rows))
 
             print("Indexing")
             con.execute("""\
@@ -1114,14 +1614,6 @@ class STRINGDetailed(STRING):
                 INSERT INTO version
                 VALUES (?, ?)""", (version, cls.VERSION))
 
-    @classmethod
-    def download_data(cls, version, taxids=None):
-        if taxids is None:
-            taxids = cls.common_taxids()
-
-        for taxid in taxids:
-            cls.init_db(version, taxid)
-
 
 ##########
 # Obsolete
@@ -1,8 +1,12 @@
 from __future__ import absolute_import, division
 
+import copy
 import os
 import sys
+import threading
 import warnings
+from collections import OrderedDict
+from functools import wraps
 
 try:
     import cPickle as pickle
@@ -115,10 +119,111 @@ class UnknownSpeciesIdentifier(Exception):
     pass
 
 
+class _AppendLog(object):
+    """
+    A bounded in-memory LRU mapping persisted in an append-only file of
+    pickled (key, value) records (after a leading version record). New
+    entries are appended; the file is rewritten with the current entries
+    only when it grows to several times `max_size` records.
+    """
+    #: Compact the file when it has this many times max_size records.
+    COMPACT_FACTOR = 4
+
+    def __init__(self, filename, max_size, protocol):
+        self.filename = filename
+        self.max_size = max_size
+        self.protocol = protocol
+        self.version = None
+        self.entries = OrderedDict()
+        self.records = 0
+        self.lock = threading.Lock()
+
+    def _read(self, version):
+        """ Load the entries saved for `version` (or start anew). """
+        self.version = version
+        self.entries = OrderedDict()
+        self.records = 0
+        try:
+            with open(self.filename, "rb") as f:
+                if pickle.load(f) != version:
+                    raise ValueError
+                while True:
+                    try:
+                        key, value = pickle.load(f)
+                    except EOFError:
+                        break
+                    self.entries.pop(key, None)
+                    self.entries[key] = value
+                    self.records += 1
+        except (OSError, IOError):
+            pass
+        except Exception:
+            # a different version, an unknown or a truncated record
+            self._write()
+        self._trim()
+
+    def _trim(self):
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def _write(self):
+        """ Rewrite the file with the current entries. """
+        tmpname = "%s.%i.tmp" % (self.filename, os.getpid())
+        try:
+            with open(tmpname, "wb") as f:
+                pickle.dump(self.version, f, protocol=self.protocol)
+                for item in self.entries.items():
+                    pickle.dump(item, f, protocol=self.protocol)
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(tmpname, self.filename)
+            self.records = len(self.entries)
+        except (OSError, IOError):
+            pass
+
+    def get(self, version, key):
+        """ Return the value for `key` (raise KeyError if missing). """
+        with self.lock:
+            if version != self.version:
+                self._read(version)
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            return value
+
+    def set(self, version, key, value):
+        with self.lock:
+            if version != self.version:
+                self._read(version)
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            self._trim()
+            if not os.path.exists(self.filename) or \
+                    self.records >= self.COMPACT_FACTOR * self.max_size:
+                self._write()
+                return
+            try:
+                with open(self.filename, "ab") as f:
+                    pickle.dump((key, value), f, protocol=self.protocol)
+                self.records += 1
+            except (OSError, IOError):
+                pass
+
+    def clear(self):
+        with self.lock:
+            self.version = None
+            self.entries = OrderedDict()
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+
+
 def pickled_cache(filename=None, dependencies=[], version=1, maxSize=30,
                   pickleprotocol=pickle.HIGHEST_PROTOCOL):
     """
-    Return a persistent cache function decorator.
+    Return a persistent cache function decorator. The last `maxSize`
+    results are kept in memory and appended to a cache file that is
+    invalidated when `version` or the `dependencies` (a list of
+    (domain, filename) server files) change. The decorated function
+    returns a copy of the cached result, so the callers can modify it.
     """
     def datetime_info(domain, filename):
         try:
@@ -134,45 +239,24 @@ def pickled_cache(filename=None, dependencies=[], version=1, maxSize=30,
                 "_" + pytag + "_cache.pickle")
         else:
             cache_filename = filename
+        cache = _AppendLog(cache_filename, maxSize, pickleprotocol)
 
+        @wraps(func)
         def f(*args, **kwargs):
             currentVersion = tuple([datetime_info(domain, file)
                                     for domain, file in dependencies] +
                                     [version, pytag])
-            try:
-                with open(cache_filename, "rb") as f:
-                    cachedVersion, cache = pickle.load(f)
-            except (OSError, IOError) as er:
-                cachedVersion, cache = "no version", {}
-            except ValueError as er:
-                # unknown pickle format
-                cachedVersion, cache = "no version", {}
-            except Exception as er:
-                warnings.warn(
-                    "An error occurred while reading cache, using empty cache",
-                    UserWarning)
-                cachedVersion, cache = "no version", {}
-            else:
-                if cachedVersion != currentVersion:
-                    cachedVersion, cache = "no version", {}
 
             allArgs = args + tuple([(key, tuple(value) if type(value) in [set, list] else value)\
-                                     for key, value in kwargs.items()])
-            if allArgs in cache:
-                return cache[allArgs]
-            else:
+                                     for key, value in sorted(kwargs.items())])
+            try:
+                res = cache.get(currentVersion, allArgs)
+            except KeyError:
                 res = func(*args, **kwargs)
-                if len(cache) > maxSize:
-                    del cache[next(iter(cache))]
-                cache[allArgs] = res
-                try:
-                    with open(cache_filename, "wb") as f:
-                        pickle.dump((currentVersion, cache), f,
-                                    protocol=pickleprotocol)
-                except (OSError, IOError) as err:
-                    pass
-
-                return res
+                cache.set(currentVersion, allArgs, res)
+            return copy.deepcopy(res)
+
+        f.cache = cache
         return f
 
     return cached
@@ -218,11 +302,7 @@ class Taxonomy(object):
         return self._tax[id].parent_tax_id
 
     def subnodes(self, id, levels=1):
-        res = self._tax.child_tax_ids(id)
-        if levels > 1:
-            for child_id in res:
-                res.extend(self.subnodes(child_id, levels - 1))
-        return res
+        return self._tax.subtree_tax_ids(id, levels)
 
     def taxids(self):
         return list(self._tax)
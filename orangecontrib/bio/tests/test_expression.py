@@ -0,0 +1,222 @@
+import math
+import unittest
+import warnings
+
+import numpy
+import scipy.stats
+
+from orangecontrib.bio.utils import expression
+
+
+class TestNormalization(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.x = rng.uniform(1, 5, size=300)
+        self.y = numpy.sin(self.x) + rng.normal(0, 0.3, size=300)
+        self.y[::40] += 3
+
+    def test_lowess(self):
+        x, y = self.x, self.y
+        for f, iter in [(2./3., 1), (0.2, 3), (1.0, 2)]:
+            numpy.testing.assert_allclose(
+                expression.lowess_windowed(x, y, f=f, iter=iter),
+                expression.lowess(x, y, f=f, iter=iter))
+            xest = numpy.linspace(1.5, 4.5, 7)
+            numpy.testing.assert_allclose(
+                expression.lowess_windowed(x, y, xest, f=f, iter=iter),
+                expression.lowess2(x, y, xest, f=f, iter=iter), atol=1e-4)
+        grid = expression.lowess_windowed(x, y, iter=3, grid=100)
+        numpy.testing.assert_allclose(
+            grid, expression.lowess(x, y, iter=3), atol=1e-2)
+        self.assertEqual(len(expression.lowess_windowed([], [])), 0)
+
+    def test_zscore(self):
+        G = numpy.ma.masked_array(numpy.exp(self.x))
+        R = numpy.ma.masked_array(numpy.exp(self.y), mask=self.x < 1.2)
+        ratio, intensity = expression.ratio_intensity(G, R)
+        order = list(numpy.ma.argsort(intensity))
+        r = int(math.ceil(len(order) / 5.))
+        for padded in [False, True]:
+            z = expression.MA_zscore(G, R, padded=padded)
+            for i, ind in enumerate(order):
+                start, end = i - r // 2, i + r // 2 + r % 2
+                indices = order[max(start, 0):end]
+                if padded:
+                    indices = order[:max(-start, 0)] + indices + \
+                              (order[end - len(order):]
+                               if end > len(order) else [])
+                std = numpy.ma.std(numpy.take(ratio, indices))
+                if ratio.mask[ind]:
+                    self.assertIs(z[ind], numpy.ma.masked)
+                else:
+                    self.assertAlmostEqual(z[ind], ratio[ind] / std)
+
+
+class Value(object):
+    """ A value of an Orange 2 example (None if unknown). """
+    def __init__(self, value):
+        self.value = value
+
+    def isSpecial(self):
+        return self.value is None
+
+
+class ExampleTable(list):
+    """ The part of an Orange 2 example table used by MA_signalToNoise:
+    rows of values, the class last. """
+    def __init__(self, X, y, class_values):
+        list.__init__(self, [
+            [Value(None if numpy.isnan(v) else v) for v in row] +
+            [Value(class_values[int(c)])] for row, c in zip(X, y)])
+        class_var = type("Variable", (), {"values": class_values})
+        self.domain = type("Domain", (), {"class_var": class_var})
+
+
+class MatrixTable(object):
+    """ The part of an Orange 2 example table used by MA_anova.scores. """
+    def __init__(self, X, y, class_values):
+        self.X, self.y = X, numpy.asarray(y, dtype=float)
+        class_var = type("Variable", (), {"values": class_values})
+        self.domain = type("Domain", (), {"class_var": class_var})
+
+    def toNumpyMA(self, content):
+        return (numpy.ma.masked_invalid(self.X if content == "a" else self.y),)
+
+
+class TestScores(unittest.TestCase):
+    def test_signal_to_noise(self):
+        rng = numpy.random.RandomState(0)
+        X = rng.randn(12, 8)
+        X[rng.rand(12, 8) < 0.2] = numpy.nan
+        y = numpy.array([0, 1] * 5 + [2, 2])
+        X[:, 1] = 3.0  # zero variance in both groups
+        X[:, 2] = numpy.where(y == 1, 0.0, X[:, 2])  # zero mean and variance
+        X[2:, 3] = numpy.nan  # single member groups
+        X[y == 0, 4] = numpy.nan  # an empty group
+        data = ExampleTable(X, y, ["a", "b", "c"])
+
+        with warnings.catch_warnings():
+            # statistics of empty and single member groups
+            warnings.simplefilter("ignore", RuntimeWarning)
+            expected = [expression.MA_signalToNoise()(i, data)
+                        for i in range(8)]
+            expected_ca = [expression.MA_signalToNoise("c", "a")(i, data)
+                        for i in range(8)]
+        numpy.testing.assert_allclose(expression.signalToNoise(X, y),
+                                      expected)
+        numpy.testing.assert_allclose(expression.signalToNoise(X, y, 2, 0),
+                                      expected_ca)
+        self.assertTrue(numpy.isnan(expected[3]) and numpy.isnan(expected[4]))
+
+    def test_anova_scores(self):
+        rng = numpy.random.RandomState(0)
+        X = rng.randn(15, 5)
+        X[rng.rand(15, 5) < 0.2] = numpy.nan
+        y = numpy.arange(15) % 3
+        X[:, 4] = 1.0  # no variance
+        data = MatrixTable(X, y, ["a", "b", "c"])
+        for prob in [False, True]:
+            scores = expression.MA_anova(prob=prob).scores(data)
+            for i in range(4):
+                groups = [X[(y == g) & ~numpy.isnan(X[:, i]), i]
+                          for g in range(3)]
+                self.assertAlmostEqual(
+                    scores[i], scipy.stats.f_oneway(*groups)[int(prob)])
+            self.assertEqual(scores[4], 1.0 if prob else 0.0)
+
+    def test_t_test_columns(self):
+        rng = numpy.random.RandomState(0)
+        X = rng.randn(20, 6)
+        X[rng.rand(20, 6) < 0.2] = numpy.nan
+        X[1:, 5] = numpy.nan
+        y = rng.randint(0, 3, size=20)
+        y[:2] = [0, 1]
+        t = expression.t_test_columns(X, y)
+        for i in range(6):
+            a = X[(y == 0) & ~numpy.isnan(X[:, i]), i]
+            b = X[(y == 1) & ~numpy.isnan(X[:, i]), i]
+            if len(a) < 2 or len(b) < 2:
+                self.assertTrue(numpy.isnan(t[i]))
+            else:
+                self.assertAlmostEqual(t[i], scipy.stats.ttest_ind(a, b)[0])
+
+    def test_rank_columns(self):
+        rng = numpy.random.RandomState(0)
+        X = numpy.round(rng.randn(40, 8), 1)
+        X[rng.rand(40, 8) < 0.2] = numpy.nan
+        ranks, ties = expression.rank_columns(X)
+        for i in range(8):
+            known = ~numpy.isnan(X[:, i])
+            self.assertTrue(numpy.all(numpy.isnan(ranks[~known, i])))
+            numpy.testing.assert_allclose(
+                ranks[known, i], scipy.stats.rankdata(X[known, i]))
+            _, t = numpy.unique(X[known, i], return_counts=True)
+            self.assertEqual(ties[i], (t ** 3 - t).sum())
+
+    def test_mann_whitney_f_oneway_columns(self):
+        rng = numpy.random.RandomState(0)
+        X = numpy.round(rng.randn(30, 10), 1)
+        X[rng.rand(30, 10) < 0.1] = numpy.nan
+        y = rng.randint(0, 3, size=30)
+        U, P = expression.mann_whitney_columns(X, y, a=0, b=2)
+        F, FP = expression.f_oneway_columns(X, y)
+        for i in range(10):
+            groups = [X[(y == g) & ~numpy.isnan(X[:, i]), i]
+                      for g in range(3)]
+            numpy.testing.assert_allclose(
+                [U[i], P[i]],
+                scipy.stats.mannwhitneyu(groups[0], groups[2],
+                                         alternative="two-sided",
+                                         method="asymptotic"))
+            numpy.testing.assert_allclose(
+                [F[i], FP[i]], scipy.stats.f_oneway(*groups))
+
+    def test_null_distribution_batch(self):
+        rng = numpy.random.RandomState(0)
+        array = numpy.ma.masked_array(rng.randn(15, 30) + 2,
+                                      mask=rng.rand(15, 30) < 0.15)
+        classes = numpy.array(list("aaaaabbbbbbcccc"))
+        permutations = expression.permutation_indices(15, 20, 1)
+
+        def test(cls):
+            test = object.__new__(cls)
+            test.array, test.classes = array, classes.copy()
+            test.useAttributeLabels, test.dim = False, 0
+            test.keys = list(range(30))
+            return test
+
+        for cls in [expression.ExpressionSignificance_FoldChange,
+                    expression.ExpressionSignificance_SignalToNoise]:
+            score = test(cls)
+            null = score.null_distribution_batch(
+                20, {"a"}, permutations=permutations, memory=10000)
+            for perm, values in zip(permutations, null):
+                score.classes = classes[perm]
+                numpy.testing.assert_allclose(
+                    values, [v for _, v in score({"a"})], rtol=1e-10)
+
+        F, p = test(expression.ExpressionSignificance_ANOVA) \
+            .null_distribution_batch(20, list("abc"),
+                                     permutations=permutations)
+        for perm, f_values, p_values in zip(permutations, F, p):
+            for i in range(30):
+                groups = [array[classes[perm] == c, i].compressed()
+                          for c in "abc"]
+                numpy.testing.assert_allclose(
+                    [f_values[i], p_values[i]],
+                    scipy.stats.f_oneway(*groups), rtol=1e-8)
+
+        # no permutations
+        for cls, target, pair in [
+                (expression.ExpressionSignificance_FoldChange, {"a"}, False),
+                (expression.ExpressionSignificance_TTest, {"a"}, True),
+                (expression.ExpressionSignificance_ANOVA, list("abc"), True)]:
+            for kwargs in [{}, dict(permutations=permutations[:0])]:
+                null = test(cls).null_distribution_batch(0, target, **kwargs)
+                self.assertEqual(isinstance(null, tuple), pair)
+                for values in (null if pair else [null]):
+                    self.assertEqual(values.shape, (0, 30))
+
+
+if __name__ == "__main__":
+    unittest.main()
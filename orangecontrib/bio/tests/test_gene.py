@@ -0,0 +1,171 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from orangecontrib.bio import gene
+
+
+class MatcherTest(gene.MatcherAliasesPickled):
+    created = 0
+
+    def __init__(self, aliases, version="1", ignore_case=True):
+        self.test_aliases = aliases
+        self.version = version
+        gene.MatcherAliasesPickled.__init__(self, ignore_case=ignore_case)
+
+    def filename(self):
+        return "test_matcher"
+
+    def create_aliases_version(self):
+        return self.version
+
+    def create_aliases(self):
+        MatcherTest.created += 1
+        return self.test_aliases
+
+
+ALIASES = [set(["A1", "a2", "alpha"]), set(["B1", "beta"]),
+           set(["C1", "alpha"]), set()]
+
+
+class TestAliasIndex(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.old_path = gene.gene_matcher_path
+        gene.gene_matcher_path = self.path
+        MatcherTest.created = 0
+
+    def tearDown(self):
+        gene.gene_matcher_path = self.old_path
+        shutil.rmtree(self.path)
+
+    def test_matching(self):
+        targets = ["a1", "B1", "C1", "D1"]
+        for ignore_case in [True, False]:
+            indexed = MatcherTest(ALIASES, ignore_case=ignore_case)
+            memory = gene.MatcherAliases(ALIASES, ignore_case=ignore_case)
+            mi = indexed.set_targets(targets)
+            mm = memory.set_targets(targets)
+            for name in ["A1", "a1", "ALPHA", "alpha", "beta", "x"]:
+                self.assertEqual(sorted(mi.match(name)),
+                                 sorted(mm.match(name)))
+                self.assertEqual(mi.umatch(name), mm.umatch(name))
+                self.assertEqual(sorted(mi.explain(name)),
+                                 sorted(mm.explain(name)))
+                self.assertEqual(indexed.to_ids(name), memory.to_ids(name))
+        self.assertEqual(indexed.aliases, ALIASES)
+
+    def test_persistence(self):
+        MatcherTest(ALIASES).set_targets(["A1"])
+        self.assertEqual(MatcherTest.created, 1)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.path, "test_matcher.index.sqlite")))
+
+        # the same version is reused
+        m = MatcherTest(None)
+        self.assertEqual(m.set_targets(["A1"]).umatch("a2"), "A1")
+        self.assertEqual(MatcherTest.created, 1)
+
+        # a new version is rebuilt
+        m = MatcherTest([set(["A1", "new"])], version="2")
+        self.assertEqual(m.set_targets(["A1"]).umatch("new"), "A1")
+        self.assertEqual(MatcherTest.created, 2)
+
+
+class TestMatchMany(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.old_path = gene.gene_matcher_path
+        gene.gene_matcher_path = self.path
+        gene._match_many_cache.clear()
+
+    def tearDown(self):
+        gene.gene_matcher_path = self.old_path
+        shutil.rmtree(self.path)
+
+    def test_match_many(self):
+        targets = ["a1", "B1", "C1", "D1", "beta"]
+        names = ["A1", "a2", "alpha", "beta", "B1", "d1", "x", "C1"]
+        for mat in [gene.MatcherAliases(ALIASES),
+                    MatcherTest(ALIASES),
+                    MatcherTest(ALIASES, ignore_case=False),
+                    gene.matcher([MatcherTest(ALIASES)]),
+                    gene.matcher([gene.MatcherAliases(ALIASES)],
+                                 ignore_case=False)]:
+            mo = mat.set_targets(targets)
+            indices = mo.match_many(names)
+            self.assertEqual(
+                [targets[i] if i >= 0 else None for i in indices],
+                [mo.umatch(name) for name in names])
+            self.assertEqual(list(mat.match_many(names)), list(indices))
+            self.assertEqual(mo.umatch_many(names),
+                             [mo.umatch(name) for name in names])
+            self.assertEqual([sorted(m) for m in mo.match_lists(names)],
+                             [sorted(mo.match(name)) for name in names])
+
+    def test_cache(self):
+        mat = gene.matcher([MatcherTest(ALIASES)])
+        mo = mat.set_targets(["a1", "B1"])
+        self.assertIsNotNone(mo.cache_key)
+        first = mo.match_many(["alpha", "beta"])
+        self.assertEqual(len(gene._match_many_cache), 1)
+        first[:] = 5  # returned arrays are copies
+        self.assertEqual(list(mo.match_many(["alpha", "beta"])), [0, 1])
+        self.assertEqual(len(gene._match_many_cache), 1)
+
+        # in-memory aliases are not cached
+        mo = gene.matcher([gene.MatcherAliases(ALIASES)]).set_targets(["a1"])
+        self.assertIsNone(mo.cache_key)
+        mo.match_many(["alpha"])
+        self.assertEqual(len(gene._match_many_cache), 1)
+
+
+GENE_INFO = """#tax_id\tGeneID\tSymbol\tLocusTag\tSynonyms
+9606\t1\tA1BG\t-\tA1B|ABG\t-\t19\t19q13.4\talpha-1-B\tprotein-coding
+9606\t10\tNAT2\t-\t-\t-\t8\t8p22\tN-acetyltransferase 2\tprotein-coding\r
+9606\t2\tA2M\t-\tA2MD\t-\t12\t12p13.31\talpha-2-M\tprotein-coding
+
+9606\t1\tA1BG\t-\tA1B\t-\t19\t19q13.4\talpha-1-B\tprotein-coding
+"""
+
+
+class TestGeneInfoTable(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "gene_info.9606.db")
+        with open(self.filename, "w") as f:
+            f.write(GENE_INFO)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_lines(self):
+        lines = [line.rstrip("\r") for line in GENE_INFO.splitlines()
+                 if line.strip() and not line.startswith("#")]
+        expected = dict((line.split("\t", 3)[1], line) for line in lines)
+        for cache in [True, False, True]:
+            table = gene.GeneInfoTable(self.filename, cache=cache)
+            self.assertEqual(list(table), ["1", "10", "2"])
+            self.assertEqual(dict((id, table[id]) for id in table), expected)
+            self.assertEqual(table.lines(["2", "3", "1000", 1]),
+                             [expected["2"], None, None, None])
+            self.assertRaises(KeyError, table.__getitem__, "3")
+        self.assertTrue(os.path.exists(self.filename + ".index.npy"))
+
+    def test_ncbi_gene_info(self):
+        info = gene.NCBIGeneInfo.load(self.filename)
+        self.assertEqual(len(info), 3)
+        self.assertEqual(info["1"].synonyms, ["A1B"])
+        self.assertEqual(info["10"].type, "protein-coding")
+        self.assertIsNone(info.get("3"))
+        self.assertEqual([i.symbol for i in info.values()],
+                         ["A1BG", "NAT2", "A2M"])
+        info["3"] = "9606\t3\tA2MP1"
+        self.assertEqual(len(info), 4)
+        self.assertEqual(info["3"].symbol, "A2MP1")
+        self.assertEqual(list(info)[-1], "3")
+
+
+if __name__ == "__main__":
+    unittest.main()
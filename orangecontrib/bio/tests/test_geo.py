@@ -0,0 +1,135 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from six import StringIO
+
+from orangecontrib.bio import geo
+
+
+SOFT = """^DATABASE = Geo
+!Database_name = Gene Expression Omnibus (GEO)
+^DATASET = GDS1
+!dataset_title = Test
+!dataset_sample_organism = Homo sapiens
+!dataset_sample_count = 3
+!dataset_feature_count = 2
+^SUBSET = GDS1_1
+!subset_description = control
+!subset_sample_id = S1,S2
+!subset_type = disease state
+^SUBSET = GDS1_2
+!subset_description = tumor
+!subset_sample_id = S3
+!subset_type = disease state
+^DATASET = GDS1
+#ID_REF = Platform reference identifier
+!dataset_table_begin
+ID_REF\tIDENTIFIER\tS1\tS2\tS3
+p1\tA\t1.0\t2.0\tnull
+p2\tB\t3.0\tnull\tnull
+p3\tA\t5.0\t6.0\tnull
+p4\tC\t1.5\t2.5\t3.5
+p0\tB\tnull\tnull\tnull
+!dataset_table_end
+"""
+
+
+class TestSOFT(unittest.TestCase):
+    def test_parse(self):
+        soft = geo.parse_soft(StringIO(SOFT))
+        self.assertEqual(soft.info["dataset_id"], "GDS1")
+        self.assertEqual(soft.info["sample_count"], 3)
+        self.assertEqual(soft.info["samples"], ["S1", "S2", "S3"])
+        self.assertEqual([s["id"] for s in soft.info["subsets"]],
+                         ["GDS1_1", "GDS1_2"])
+        self.assertEqual(soft.info["subsets"][0]["sample_id"], ["S1", "S2"])
+        self.assertEqual(soft.spots, ["p1", "p2", "p3", "p4", "p0"])
+        self.assertEqual(soft.genes, ["A", "B", "A", "C", "B"])
+        numpy.testing.assert_equal(soft.values[0], [1, 2, numpy.nan])
+        self.assertEqual(soft.values.shape, (5, 3))
+
+    def test_merge(self):
+        rng = numpy.random.RandomState(0)
+        values = rng.rand(60, 4)
+        values[rng.rand(60, 4) < 0.3] = numpy.nan
+        groups = rng.randint(0, 20, size=60)
+        for merge_function in [geo.spots_mean, geo.spots_median,
+                               geo.spots_min, geo.spots_max,
+                               lambda x: len(x)]:
+            merged, present = geo.merge_spots(values, groups, 25,
+                                              merge_function)
+            for g in range(25):
+                self.assertEqual(present[g], g in groups)
+                if not present[g]:
+                    continue
+                for i in range(values.shape[1]):
+                    expected = merge_function(list(values[groups == g, i]))
+                    numpy.testing.assert_almost_equal(merged[g, i], expected)
+
+    def test_getdata(self):
+        gds = geo.GDS.__new__(geo.GDS)
+        gds.verbose = False
+        gds._set_soft(geo.parse_soft(StringIO(SOFT)))
+        self.assertEqual(gds.genes, ["A", "B", "C"])
+        self.assertEqual(gds.gene2spots["A"], ["p1", "p3"])
+
+        data = gds.getdata()
+        self.assertEqual([str(row[data.domain.metas[0]]) for row in data],
+                         ["A", "B", "C"])
+        numpy.testing.assert_equal(data.X, [[3, 4, numpy.nan],
+                                            [3, numpy.nan, numpy.nan],
+                                            [1.5, 2.5, 3.5]])
+
+        data = gds.getdata(report_genes=False, remove_unknown=0.5)
+        self.assertEqual([str(row[data.domain.metas[0]]) for row in data],
+                         ["p1", "p3", "p4"])
+
+        data = gds.getdata(transpose=True, merge_function=geo.spots_median)
+        self.assertEqual([a.name for a in data.domain.attributes],
+                         ["A", "B", "C"])
+        self.assertEqual(list(data.Y), [0, 0, 1])
+        numpy.testing.assert_equal(data.X[:, 0], [3, 4, numpy.nan])
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "GDS1.soft.gz")
+        self.write(SOFT)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, text):
+        with gzip.open(self.filename, "wb") as f:
+            f.write(text.encode("utf-8"))
+
+    def load(self, cache=True):
+        gds = geo.GDS.__new__(geo.GDS)
+        gds.filename = self.filename
+        return gds._load_soft(cache)
+
+    def test_cache(self):
+        parsed = self.load()
+        self.assertTrue(os.path.exists(self.filename + ".cache.npy"))
+        cached = self.load()
+        self.assertIsInstance(cached.values, numpy.memmap)
+        self.assertEqual(cached.info, parsed.info)
+        self.assertEqual(cached.spots, parsed.spots)
+        numpy.testing.assert_equal(cached.values, parsed.values)
+
+        # a changed file is parsed again
+        self.write(SOFT.replace("p4\tC", "p4\tD"))
+        self.assertEqual(self.load().genes[3], "D")
+        self.assertEqual(self.load().genes[3], "D")
+        self.assertNotIsInstance(self.load(cache=False).values,
+                                 numpy.memmap)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,314 @@
+import os
+import shutil
+import tempfile
+import unittest
+import random
+
+from six import StringIO
+
+from orangecontrib.bio import go
+from orangecontrib.bio.utils import stats
+
+
+ONTOLOGY = """format-version: 1.2
+subsetdef: goslim_generic "Generic GO slim"
+
+[Term]
+id: GO:0000001
+name: root
+namespace: biological_process
+subset: goslim_generic
+
+[Term]
+id: GO:0000002
+name: a
+namespace: biological_process
+is_a: GO:0000001 ! root
+subset: goslim_generic
+
+[Term]
+id: GO:0000003
+name: b
+namespace: biological_process
+is_a: GO:0000001 ! root
+
+[Term]
+id: GO:0000004
+name: c
+namespace: biological_process
+is_a: GO:0000002 ! a
+relationship: part_of GO:0000003 ! b
+
+[Term]
+id: GO:0000005
+name: d
+namespace: biological_process
+alt_id: GO:0000015
+is_a: GO:0000003 ! b
+
+[Term]
+id: GO:0000006
+name: e
+namespace: biological_process
+is_a: GO:0000004 ! c
+is_a: GO:0000005 ! d
+
+"""
+
+ONTOLOGY_TERMS = ["GO:0000001", "GO:0000002", "GO:0000003", "GO:0000004",
+                  "GO:0000005", "GO:0000006"]
+
+
+def annotation(gene, term, evidence="IDA"):
+    fields = ["DB", gene, gene, "", term, "", evidence, "", "P", "",
+              "", "gene", "taxon:1", "", "", "", ""]
+    return go.AnnotationRecord("\t".join(fields))
+
+
+def reachable(ontology, term, attr):
+    visited, queue = set(), set([term])
+    while queue:
+        term = queue.pop()
+        visited.add(term)
+        queue.update(set(t for _, t in getattr(ontology[term], attr)) -
+                     visited)
+    return visited
+
+
+class TestOntologyIndex(unittest.TestCase):
+    def test_closure(self):
+        ontology = go.Ontology(StringIO(ONTOLOGY))
+        for term in ONTOLOGY_TERMS + ["GO:0000015"]:
+            self.assertEqual(ontology.extract_super_graph([term]),
+                             reachable(ontology, term, "related"))
+            self.assertEqual(ontology.extract_sub_graph(term),
+                             reachable(ontology, term, "related_to"))
+        self.assertEqual(ontology.extract_super_graph(["GO:0000004",
+                                                       "GO:0000005"]),
+                         reachable(ontology, "GO:0000004", "related") |
+                         reachable(ontology, "GO:0000005", "related"))
+        self.assertEqual([ontology.term_depth(t) for t in ONTOLOGY_TERMS],
+                         [1, 2, 2, 3, 3, 4])
+        self.assertEqual(ontology.term_depth("GO:0000015"), 3)
+        self.assertRaises(KeyError, ontology.extract_super_graph, ["GO:1"])
+
+        index = ontology.index
+        position = index.order_position
+        for i in range(len(index.term_ids)):
+            for p in index.parents(i):
+                self.assertLess(position[p], position[i])
+
+    def test_slims(self):
+        ontology = go.Ontology(StringIO(ONTOLOGY))
+        ontology.set_slims_subset("goslim_generic")
+        self.assertEqual(ontology.slims_for_term("GO:0000006"),
+                         set(["GO:0000002", "GO:0000001"]))
+        self.assertEqual(ontology.slims_for_term("GO:0000002"),
+                         set(["GO:0000002"]))
+        ontology.set_slims_subset(["GO:0000003"])
+        self.assertEqual(ontology.slims_for_term("GO:0000006"),
+                         set(["GO:0000003"]))
+        self.assertEqual(ontology.slims_for_term("GO:0000002"), set())
+
+    def test_cache(self):
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, "ontology.obo")
+            with open(filename, "w") as f:
+                f.write(ONTOLOGY)
+            built = go.Ontology(filename).index
+            self.assertTrue(os.path.exists(filename + ".index.npz"))
+            loaded = go.Ontology(filename).index
+            self.assertEqual(loaded.term_ids, built.term_ids)
+            for name in go.OntologyIndex._ARRAYS:
+                self.assertEqual(list(getattr(loaded, name)),
+                                 list(getattr(built, name)))
+        finally:
+            shutil.rmtree(path)
+
+
+class TestEnrichment(unittest.TestCase):
+    def setUp(self):
+        self.ontology = go.Ontology(StringIO(ONTOLOGY))
+        self.annotations = go.Annotations(ontology=self.ontology)
+        rng = random.Random(42)
+        terms = ["GO:0000002", "GO:0000003", "GO:0000004", "GO:0000005"]
+        self.genes = ["G%i" % i for i in range(40)]
+        for gene in self.genes:
+            for term in rng.sample(terms, rng.randint(1, 3)):
+                evidence = rng.choice(["IDA", "IEA"])
+                self.annotations.add_annotation(
+                    annotation(gene, term, evidence))
+
+    def assertSameResults(self, batch, single):
+        self.assertEqual(set(batch), set(single))
+        for term in single:
+            genes, p, ref = single[term]
+            bgenes, bp, bref = batch[term]
+            self.assertEqual(sorted(bgenes), sorted(genes))
+            self.assertAlmostEqual(bp, p)
+            self.assertEqual(bref, ref)
+
+    def test_batch(self):
+        rng = random.Random(0)
+        gene_lists = [rng.sample(self.genes, rng.randint(1, 15))
+                      for _ in range(10)]
+        gene_lists.append(["G1", "G2", "not_a_gene"])
+        reference = self.genes[:30]
+        for kwargs in [{},
+                       dict(reference=reference),
+                       dict(evidence_codes=["IDA"]),
+                       dict(prob=stats.Hypergeometric(), use_fdr=False),
+                       dict(slims_only=True)]:
+            batch = self.annotations.get_enriched_terms_batch(
+                gene_lists, **kwargs)
+            self.assertEqual(len(batch), len(gene_lists))
+            for genes, res in zip(gene_lists, batch):
+                self.assertSameResults(
+                    res, self.annotations.get_enriched_terms(genes, **kwargs))
+
+    def test_invalidate(self):
+        self.annotations.get_enriched_terms_batch([["G1"]])
+        self.annotations.add_annotation(annotation("G1", "GO:0000005"))
+        self.annotations.add_annotation(annotation("NEW", "GO:0000005"))
+        self.assertSameResults(
+            self.annotations.get_enriched_terms_batch([["G1", "NEW"]])[0],
+            self.annotations.get_enriched_terms(["G1", "NEW"]))
+
+
+class TestIndexedAnnotations(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.gaf = os.path.join(self.path, "gene_association.test")
+        rng = random.Random(42)
+        terms = ["GO:0000002", "GO:0000003", "GO:0000004", "GO:0000005"]
+        lines = ["!gaf-version: 2.0"]
+        for i in range(40):
+            for term in rng.sample(terms, rng.randint(1, 3)):
+                lines.append("\t".join(annotation(
+                    "G%i" % i, term, rng.choice(["IDA", "IEA"]))))
+        with open(self.gaf, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        self.ontology = go.Ontology(StringIO(ONTOLOGY))
+        self.annotations = go.Annotations(self.gaf, ontology=self.ontology)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def indexed(self, **kwargs):
+        return go.IndexedAnnotations(self.gaf, ontology=self.ontology,
+                                     **kwargs)
+
+    def test_same_api(self):
+        indexed = self.indexed()
+        memory = self.annotations
+        self.assertTrue(os.path.exists(self.gaf + ".sqlite"))
+        self.assertEqual(len(indexed), len(memory))
+        self.assertEqual(list(indexed), memory.annotations)
+        self.assertEqual(indexed[-1], memory[-1])
+        self.assertEqual(indexed.header, memory.header)
+        self.assertEqual(indexed.gene_names, memory.gene_names)
+        self.assertEqual(indexed.alias_mapper, memory.alias_mapper)
+        self.assertEqual(set(indexed.gene_annotations),
+                         set(memory.gene_annotations))
+        for gene in ["G1", "G17", "missing"]:
+            self.assertEqual(indexed.gene_annotations[gene],
+                             memory.gene_annotations[gene])
+        for term in ONTOLOGY_TERMS:
+            self.assertEqual(indexed.get_all_annotations(term),
+                             memory.get_all_annotations(term))
+            self.assertEqual(sorted(indexed.get_all_genes(term, ["IDA"])),
+                             sorted(memory.get_all_genes(term, ["IDA"])))
+        genes = ["G%i" % i for i in range(0, 40, 3)]
+        self.assertEqual(indexed.get_enriched_terms(genes),
+                         memory.get_enriched_terms_batch([genes])[0])
+        self.assertEqual(indexed.get_annotated_terms(genes),
+                         memory.get_annotated_terms(genes))
+
+    def test_alt_ids(self):
+        with open(self.gaf, "a") as f:
+            f.write("\t".join(annotation("ALT", "GO:0000015")) + "\n")
+        indexed = self.indexed()
+        memory = go.Annotations(self.gaf, ontology=self.ontology)
+        genes = ["ALT", "G1", "G4"]
+        res = indexed.get_enriched_terms(genes)
+        self.assertEqual(res, memory.get_enriched_terms_batch([genes])[0])
+        # annotations to alternative ids are counted under primary ids
+        self.assertIn("ALT", res["GO:0000005"][0])
+        self.assertNotIn("GO:0000015", res)
+        self.assertIn("GO:0000015", memory.get_enriched_terms(genes))
+
+    def test_getitem(self):
+        indexed = self.indexed()
+        memory = self.annotations
+        indexed.add_annotation(annotation("NEW", "GO:0000005"))
+        memory.add_annotation(annotation("NEW", "GO:0000005"))
+        for i in [0, 7, len(memory) - 1, -1, -len(memory)]:
+            self.assertEqual(indexed[i], memory[i])
+        for s in [slice(2, 7), slice(-3, None), slice(None, None, -5),
+                  slice(10, 2), slice(None)]:
+            self.assertEqual(indexed[s], memory[s])
+        for i in [len(memory), -len(memory) - 1]:
+            self.assertRaises(IndexError, indexed.__getitem__, i)
+
+    def test_parse_file(self):
+        other = os.path.join(self.path, "gene_association.other")
+        with open(other, "w") as f:
+            f.write("!other header\n")
+            for gene, term in [("NEW", "GO:0000005"), ("G1", "GO:0000006"),
+                               ("", "GO:0000002")]:
+                f.write("\t".join(annotation(gene, term)) + "\n")
+        indexed = self.indexed()
+        memory = self.annotations
+        progress = []
+        for annotations in [indexed, memory]:
+            annotations.parse_file(other, progress_callback=progress.append)
+        self.assertEqual(list(indexed), memory.annotations)
+        self.assertEqual(indexed.header, memory.header)
+        self.assertEqual(indexed.gene_names, memory.gene_names)
+        self.assertEqual(indexed.gene_annotations["G1"],
+                         memory.gene_annotations["G1"])
+        self.assertTrue(progress)
+        # the index only has the annotations file
+        self.assertNotIn("NEW", self.indexed().gene_names)
+
+    def test_rebuild(self):
+        self.assertEqual(self.indexed().index.version,
+                         self.indexed().index.version)
+        # a changed annotations file is indexed again
+        with open(self.gaf, "a") as f:
+            f.write("\t".join(annotation("OTHER", "GO:0000004")) + "\n")
+        os.utime(self.gaf, (0, 0))
+        indexed = self.indexed()
+        self.assertIn("OTHER", indexed.gene_names)
+        self.assertEqual(len(self.indexed(rebuild=True)), len(indexed))
+
+    def test_edits(self):
+        indexed, other = self.indexed(), self.indexed()
+        memory = self.annotations
+        for annotations in [indexed, memory]:
+            annotations.add_annotation(annotation("NEW", "GO:0000005"))
+            annotations.extend([annotation("NEW2", "GO:0000002"),
+                                annotation("G1", "GO:0000003")])
+            annotations.remap_genes({"G2": ["R2", "S2"], "G3": ["R3"]})
+        self.assertEqual(list(indexed), memory.annotations)
+        self.assertEqual(indexed.gene_names, memory.gene_names)
+        self.assertEqual(indexed.alias_mapper, memory.alias_mapper)
+        for gene in ["NEW", "G1", "R2", "S2", "R3"]:
+            self.assertEqual(indexed.gene_annotations[gene],
+                             memory.gene_annotations[gene])
+        self.assertEqual(sorted(indexed.get_all_genes("GO:0000005")),
+                         sorted(memory.get_all_genes("GO:0000005")))
+
+        # other instances (open or new) of the same index only see the
+        # annotations file
+        fresh = go.Annotations(self.gaf, ontology=self.ontology)
+        for annotations in [other, self.indexed()]:
+            self.assertEqual(list(annotations), fresh.annotations)
+            self.assertEqual(annotations.gene_names, fresh.gene_names)
+            self.assertEqual(annotations.alias_mapper, fresh.alias_mapper)
+            self.assertEqual(annotations.gene_annotations["R2"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
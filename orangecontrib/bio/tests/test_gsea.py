@@ -0,0 +1,50 @@
+import unittest
+
+import numpy
+
+try:
+    from orangecontrib.bio import gsea
+except ImportError:
+    # gsea needs Orange 2
+    gsea = None
+
+
+@unittest.skipIf(gsea is None, "gsea needs Orange 2")
+class TestEnrichmentScores(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.ngenes = 60
+        self.rankings = rng.randn(5, self.ngenes)
+        self.rankings[1, ::7] = 0.0
+        self.subsets = [sorted(rng.choice(self.ngenes, size, replace=False))
+                        for size in [1, 3, 10, 25, 59]]
+
+    def ranked(self, subset, lcor, p=1.0):
+        return gsea.enrichmentScoreRanked(
+            subset, list(lcor), gsea.orderedPointersCorr(list(lcor)), p=p)[0]
+
+    def test_enrichment_scores_batch(self):
+        for p in [1.0, 2.0]:
+            scores = gsea.enrichmentScoresBatch(self.subsets, self.rankings,
+                                                p=p, chunk_size=100)
+            self.assertEqual(scores.shape, (5, len(self.subsets)))
+            for lcor, row in zip(self.rankings, scores):
+                numpy.testing.assert_allclose(
+                    row, [self.ranked(s, lcor, p) for s in self.subsets],
+                    atol=1e-12)
+
+    def test_gsea_batch(self):
+        lcor = self.rankings[0]
+        es, nulls = gsea.gseaBatch(list(lcor), self.subsets, 4,
+                                   lambda i: self.rankings[i + 1],
+                                   chunk_size=150)
+        numpy.testing.assert_allclose(
+            es, [self.ranked(s, lcor) for s in self.subsets], atol=1e-12)
+        for s, null in zip(self.subsets, nulls):
+            numpy.testing.assert_allclose(
+                null, [self.ranked(s, r) for r in self.rankings[1:]],
+                atol=1e-12)
+
+
+if __name__ == "__main__":
+    unittest.main()
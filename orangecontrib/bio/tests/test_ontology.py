@@ -1,4 +1,8 @@
 import doctest
+import os
+import random
+import shutil
+import tempfile
 import unittest
 
 from six import StringIO
@@ -51,6 +55,43 @@ name: bar
         seinfeld = ontology.OBOOntology(seinfeld)
 #        print(seinfeld.child_edges("001"))
 
+    def test_parse_tag_value_fast(self):
+        rng = random.Random(0)
+        parts = ["foo", "bar", ":", " ", "!", "{", "}", "=", '"', "[baz:0]"]
+        lines = ["foo: bar", "foo:bar ! c", "id: GO:1 {a=b} ! c !",
+                 "def: \"x\" [] {", "def: \"x ! y\" {m}", "foo",
+                 "foo: {x} y } ! {c}", "a : b \\! c"]
+        lines += ["".join(rng.choice(parts) for _ in range(rng.randint(1, 12)))
+                  for _ in range(2000)]
+        for line in lines:
+            self.assertEqual(ontology._parse_tag_value_fast(line),
+                             ontology.parse_tag_value(line), line)
+
+    def test_snapshot(self):
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, "test.obo")
+            with open(filename, "w") as f:
+                f.write("format-version: 1.2\n\n[Term]\nid: A:1\n"
+                        "name: a ! comment\n\n[Term]\nid: A:2\n"
+                        "is_a: A:1 ! a\n")
+            parsed = ontology.OBOOntology(filename)
+            self.assertTrue(os.path.exists(filename + ".snapshot"))
+            loaded = ontology.OBOOntology(filename)
+            self.assertEqual(loaded.header_tags, parsed.header_tags)
+            self.assertEqual([o.tags() for o in loaded],
+                             [o.tags() for o in parsed])
+            self.assertEqual(loaded.parent_terms("A:2"),
+                             set([loaded.term("A:1")]))
+
+            with open(filename, "a") as f:
+                f.write("\n[Term]\nid: A:3\n")
+            os.utime(filename, (0, 0))
+            self.assertIn("A:3", ontology.OBOOntology(filename))
+        finally:
+            shutil.rmtree(path)
+
+
 def load_tests(loader, tests, ignore):
     stanza = '''[Term]
 id: FOO:001
@@ -0,0 +1,280 @@
+import gzip
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import types
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from orangecontrib.bio import ppi
+
+
+def string_database(filename, proteins=40, links=150, seed=0):
+    rng = random.Random(seed)
+    ids = ["9606.P%03i" % i for i in range(proteins)]
+    con = sqlite3.connect(filename)
+    with con:
+        ppi.STRING.clear_db(con)
+        pairs = set()
+        while len(pairs) < links:
+            pairs.add(tuple(sorted(rng.sample(ids, 2))))
+        rows = []
+        for a, b in pairs:
+            score = rng.randint(150, 999)
+            rows.extend([(a, b, score), (b, a, score)])
+        con.executemany("INSERT INTO links VALUES (?, ?, ?)", rows)
+        con.executemany("INSERT INTO proteins VALUES (?, ?)",
+                        [(id, "9606") for id in ids])
+        modes = ["binding", "catalysis", "inhibition"]
+        con.executemany(
+            "INSERT INTO actions VALUES (?, ?, ?, ?, ?)",
+            [(a, b, rng.choice(modes), "", s) for a, b, s in rows[::3]])
+        con.executemany(
+            "INSERT INTO aliases VALUES (?, ?, ?)",
+            [(id, name, "source") for id in ids
+             for name in [id.split(".")[1], "G" + id[-3:]]])
+        ppi.STRING.create_db_index(con)
+    con.close()
+    return ids
+
+
+class TestNetworkSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "string.sqlite")
+        self.ids = string_database(self.filename)
+        self.string = ppi.STRING(database=self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def reachable(self, seeds, min_score, hops):
+        nodes = set(seeds)
+        frontier = set(seeds)
+        for _ in range(hops):
+            frontier = set(id2 for id in frontier
+                           for _, id2, score in self.string.edges(id)
+                           if score >= min_score) - nodes
+            nodes.update(frontier)
+        return sorted(nodes)
+
+    def test_neighbors(self):
+        seeds = self.ids[:3] + ["unknown"]
+        for min_score, hops in [(0, 1), (500, 1), (0, 2), (700, 3)]:
+            self.assertEqual(
+                self.string.neighbors(seeds, min_score=min_score, hops=hops),
+                self.reachable(self.ids[:3], min_score, hops))
+
+    def test_subgraph(self):
+        nodes = self.ids[::2]
+        expected = sorted(
+            (a, b, float(s)) for id in nodes
+            for a, b, s in self.string.edges(id) if b in nodes and s >= 400)
+        self.assertEqual(sorted(self.string.subgraph(nodes, min_score=400)),
+                         expected)
+
+    def test_extract_network(self):
+        class Graph(object):
+            # the part of (undirected) Orange.network.Graph used by
+            # extract_network
+            def __init__(self):
+                self.nodes, self.edges = {}, {}
+
+            def add_node(self, id, **attrs):
+                self.nodes[id] = attrs
+
+            def add_edge(self, id1, id2, **attrs):
+                self.edges[frozenset([id1, id2])] = attrs["weight"]
+
+        network = types.ModuleType("Orange.network")
+        network.Graph = Graph
+        ids = self.ids[:3]
+        with mock.patch.dict(sys.modules, {"Orange.network": network}):
+            graph = self.string.extract_network(ids)
+        self.assertEqual(sorted(graph.nodes), ids)
+        expected = dict((frozenset([a, b]), float(s)) for id in ids
+                        for a, b, s in self.string.edges(id))
+        self.assertEqual(graph.edges, expected)
+        # edges to neighbors outside of ids
+        self.assertTrue(any(not edge <= set(ids) for edge in graph.edges))
+
+    def test_snapshot(self):
+        snapshot = self.string.network_snapshot()
+        self.assertTrue(os.path.isdir(self.filename + ".network"))
+        loaded = ppi.STRING(database=self.filename).network_snapshot()
+        self.assertEqual(loaded.ids, snapshot.ids)
+        self.assertEqual(list(loaded.targets), list(snapshot.targets))
+        self.assertEqual(loaded.action_types,
+                         ["binding", "catalysis", "inhibition"])
+
+        actions = self.string.db.execute(
+            "SELECT protein_id1, protein_id2, mode FROM actions").fetchall()
+        mask = loaded.columns["actions"]
+        for a, b, mode in actions:
+            _, edges = loaded.edges([loaded.id_index[a]])
+            edge = [e for e in edges
+                    if loaded.ids[loaded.targets[e]] == b][0]
+            self.assertTrue(mask[edge] &
+                            (1 << loaded.action_types.index(mode)))
+
+    def test_symmetric(self):
+        snapshot = ppi.NetworkSnapshot.from_edges(
+            ["a", "d"], ["a", "a", "b"], ["b", "b", "c"],
+            {"score": [1, 3, float("nan")]}, symmetric=True)
+        self.assertEqual(snapshot.ids, ["a", "b", "c", "d"])
+        self.assertEqual(list(snapshot.indptr), [0, 1, 3, 4, 4])
+        self.assertEqual(list(snapshot.targets), [1, 0, 2, 1])
+        self.assertEqual(list(snapshot.columns["score"][:2]), [3, 3])
+        self.assertEqual(list(snapshot.neighbors([0], hops=2)), [0, 1, 2])
+        self.assertEqual(list(snapshot.neighbors([0], min_score=0, hops=2)),
+                         [0, 1])
+
+
+class TestEdges(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "string.sqlite")
+        self.ids = string_database(self.filename)
+        self.string = ppi.STRING(database=self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_all_edges(self):
+        links = self.string.db.execute("SELECT * FROM links").fetchall()
+        self.assertEqual(sorted(self.string.all_edges()), sorted(links))
+        self.assertEqual(sorted(self.string.all_edges("9606")),
+                         sorted(links))
+
+        biogrid = object.__new__(ppi.BioGRID)
+        biogrid.db = sqlite3.connect(":memory:")
+        biogrid.db.execute("CREATE TABLE links (biogrid_id_interactor_a, "
+                           "biogrid_id_interactor_b, score)")
+        biogrid.db.executemany("INSERT INTO links VALUES (?, ?, ?)",
+                               [("1", "2", 0.5), ("2", "3", None)])
+        self.assertEqual(biogrid.all_edges(),
+                         [("1", "2", 0.5), ("2", "3", None)])
+
+    def test_edges_annotated(self):
+        actions = dict(((a, b), (mode, action, score)) for a, b, mode,
+                       action, score in self.string.db.execute(
+                           "SELECT * FROM actions"))
+        links = dict(((a, b), score) for a, b, score in
+                     self.string.db.execute("SELECT * FROM links"))
+        for id in self.ids[:10]:
+            edges = list(self.string.edges_annotated(id))
+            self.assertEqual(
+                sorted(e.protein_id2 for e in edges),
+                sorted(b for a, b in links if a == id))
+            for e in edges:
+                self.assertEqual(e.protein_id1, id)
+                key = (e.protein_id1, e.protein_id2)
+                self.assertEqual(e.combined_score, links[key])
+                self.assertEqual((e.mode, e.action, e.score),
+                                 actions.get(key, (None, None, None)))
+        self.assertEqual(
+            sorted(self.string.all_edges_annotated()),
+            sorted(e for id in self.ids
+                   for e in self.string.edges_annotated(id)))
+
+
+class TestSearchIds(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "string.sqlite")
+        self.ids = string_database(self.filename)
+        con = sqlite3.connect(self.filename)
+        with con:
+            con.executemany("INSERT INTO aliases VALUES (?, ?, ?)",
+                            [(self.ids[0], "SHARED", "source"),
+                             (self.ids[1], "SHARED", "source")])
+        con.close()
+        self.string = ppi.STRING(database=self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_search_ids(self):
+        names = ["P001", "G002", "SHARED", "unknown", "P039", "G002"]
+        result = self.string.search_ids(names, taxid="9606")
+        expected = [list(self.string.search_id(name, taxid="9606"))
+                    for name in names]
+        self.assertEqual(result.ids,
+                         [ids[0] if len(ids) == 1 else None
+                          for ids in expected])
+        self.assertEqual(result.ambiguous, {"SHARED": self.ids[:2]})
+        self.assertEqual(result.unmatched, ["unknown"])
+        self.assertEqual(self.string.search_ids(names, taxid="10090").ids,
+                         [None] * len(names))
+        self.assertIs(ppi.STRING(database=self.filename).alias_index(),
+                      self.string.alias_index())
+
+    def test_synonyms_batch(self):
+        ids = self.ids[::3] + ["unknown"] + self.ids[:2]
+        self.string.MAX_VARIABLES = 4  # duplicates in different chunks
+        self.assertEqual(self.string.synonyms_batch(ids),
+                         {id: self.string.synonyms(id) for id in ids})
+
+
+def write_gz(filename, header, rows, sep):
+    with gzip.open(filename, "wb") as f:
+        text = "\n".join([header] + [sep.join(map(str, r)) for r in rows])
+        f.write((text + "\n").encode("utf-8"))
+
+
+class TestBuildDB(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_build(self):
+        join = os.path.join
+        links = [("9606.A", "9606.B", 900), ("9606.B", "9606.A", 900),
+                 ("9606.B", "9606.C", 200), ("9606.C", "9606.B", 200)]
+        actions = [("9606.A", "9606.B", "binding", "", "f", "t", 900)]
+        aliases = [("9606", "9606.A", "GENEA", "Ensembl"),
+                   ("9606", "9606.C", "GENEC", "Ensembl")]
+        write_gz(join(self.path, "links.gz"),
+                 "protein1 protein2 combined_score", links, " ")
+        write_gz(join(self.path, "actions.gz"), "header", actions, "\t")
+        write_gz(join(self.path, "aliases.gz"), "header", aliases, "\t")
+
+        filename = join(self.path, "string.sqlite")
+        ppi.STRING.build_db(filename, "v0", join(self.path, "links.gz"),
+                            join(self.path, "actions.gz"),
+                            join(self.path, "aliases.gz"))
+        self.assertEqual(os.listdir(self.path).count("string.sqlite"), 1)
+        string = ppi.STRING(database=filename)
+        self.assertEqual(string.ids(), ["9606.A", "9606.B", "9606.C"])
+        self.assertEqual(string.organisms(), ["9606"])
+        self.assertEqual(sorted(string.all_edges()), sorted(links))
+        self.assertEqual(list(string.edges_annotated("9606.A"))[0].mode, "binding")
+        self.assertEqual(list(string.search_id("GENEC")), ["9606.C"])
+        self.assertEqual(string.db.execute(
+            "SELECT string_version FROM version").fetchall(), [("v0",)])
+        indices = string.db.execute(
+            "SELECT name FROM sqlite_master WHERE type='index'").fetchall()
+        self.assertIn(("index_aliases_alias",), indices)
+
+        detailed = [("9606.A", "9606.B", 0, 0, 0, 5, 6, 7, 800, 900)]
+        write_gz(join(self.path, "detailed.gz"), "header", detailed, " ")
+        filename = join(self.path, "detailed.sqlite")
+        ppi.STRINGDetailed.build_detailed_db(
+            filename, "v0", join(self.path, "detailed.gz"))
+        con = sqlite3.connect(filename)
+        self.assertEqual(con.execute("SELECT * FROM evidence").fetchall(),
+                         [detailed[0][:9]])
+        con.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+import numpy
+
+from orangecontrib.bio.utils import scoring
+
+
+class TestNullScores(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.X = rng.randn(16, 25) + 3
+        self.X[rng.rand(16, 25) < 0.1] = numpy.nan
+        self.groups = [numpy.arange(0, 6), numpy.arange(6, 11),
+                       numpy.arange(12, 16)]
+
+    def sequential(self, score_func, groups, count):
+        # a shuffle of the joined group indices for each permutation
+        rng = numpy.random.RandomState(1)
+        scores = []
+        for _ in range(count):
+            joined = numpy.hstack(groups)
+            rng.shuffle(joined)
+            splits = numpy.split(joined, numpy.cumsum(
+                [len(g) for g in groups])[:-1])
+            ss = score_func(*[self.X[ind] for ind in splits], axis=0)
+            scores.append(ss[0] if isinstance(ss, tuple) else ss)
+        return numpy.array(scores, dtype=float)
+
+    def test_batch_scores(self):
+        two = self.groups[:2]
+        for score_func, groups in [
+                (scoring.score_fold_change, two),
+                (scoring.score_log_fold_change, two),
+                (scoring.score_ttest_t, two),
+                (scoring.score_ttest_p, two),
+                (scoring.score_signal_to_noise, two),
+                (scoring.score_anova_f, self.groups),
+                (scoring.score_anova_p, self.groups),
+                (scoring.score_mann_whitney_u, two)]:
+            expected = self.sequential(score_func, groups, 30)
+            scores = numpy.vstack(list(scoring.null_scores(
+                self.X, groups, score_func, 30,
+                numpy.random.RandomState(1), memory=20000)))
+            numpy.testing.assert_allclose(scores, expected, rtol=1e-8,
+                                          err_msg=score_func.__name__)
+
+    def test_pool(self):
+        for score_func, groups in [
+                (scoring.score_ttest_t, self.groups[:2]),
+                (scoring.score_anova_f, self.groups),
+                (scoring.score_mann_whitney_u, self.groups[:2])]:
+            serial, pooled = [
+                numpy.vstack(list(scoring.null_scores(
+                    self.X, groups, score_func, 30,
+                    numpy.random.RandomState(1), memory=20000,
+                    n_jobs=n_jobs)))
+                for n_jobs in [None, 2]]
+            numpy.testing.assert_array_equal(pooled, serial)
+
+    def test_null_distribution(self):
+        rng = numpy.random.RandomState(0)
+        scores = rng.randn(40, 100)
+        scores[0, :10] = numpy.nan
+        full = scoring.NullDistribution()
+        thinned = scoring.NullDistribution(max_size=1000)
+        for batch in numpy.split(scores, 4):
+            full.add(batch)
+            thinned.add(batch)
+        self.assertEqual(len(full), 40)
+        self.assertEqual(full.values().size, 3990)
+        numpy.testing.assert_array_equal(
+            numpy.sort(full.values()),
+            numpy.sort(scores[numpy.isfinite(scores)]))
+        self.assertLessEqual(thinned.values().size, 1000)
+        self.assertLessEqual(thinned.rate, 0.25)
+        bins = numpy.linspace(-4, 4, 5)
+        numpy.testing.assert_allclose(thinned.histogram(bins).sum(),
+                                      full.histogram(bins).sum(), rtol=0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
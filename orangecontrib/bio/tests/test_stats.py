@@ -0,0 +1,49 @@
+import unittest
+import random
+
+import numpy
+
+from orangecontrib.bio.utils import stats
+
+
+class TestPValueArray(unittest.TestCase):
+    def random_tests(self, max_n=None):
+        rng = random.Random(0)
+        tests = []
+        for _ in range(500):
+            N = rng.choice([1, 7, 100, 5000])
+            m = rng.randint(0, N)
+            n = rng.randint(0, min(N, max_n or N))
+            k = rng.randint(0, min(n, m) + 2)
+            tests.append((k, N, m, n))
+        return tests
+
+    def assertMatchesScalar(self, prob, tests):
+        k, N, m, n = map(numpy.array, zip(*tests))
+        p_values = prob.p_value_array(k, N, m, n)
+        expected = numpy.array([prob.p_value(*t) for t in tests])
+        numpy.testing.assert_allclose(p_values, expected,
+                                      rtol=1e-6, atol=1e-12)
+
+    def test_hypergeometric(self):
+        self.assertMatchesScalar(stats.Hypergeometric(), self.random_tests())
+
+    def test_binomial(self):
+        self.assertMatchesScalar(stats.Binomial(), self.random_tests(200))
+
+    def test_broadcast(self):
+        prob = stats.Hypergeometric()
+        p_values = prob.p_value_array([[0, 1], [2, 3]], 100, 10, 20)
+        self.assertEqual(p_values.shape, (2, 2))
+        self.assertAlmostEqual(p_values[1, 1], prob.p_value(3, 100, 10, 20))
+
+    def test_log_factorial(self):
+        n = numpy.array([0, 1, 5, stats.LOG_FACTORIAL_TABLE_MAX + 10])
+        numpy.testing.assert_allclose(
+            stats.log_factorial(n),
+            [0.0, 0.0, numpy.log(120),
+             stats.LogBin._logfactorial(stats.LOG_FACTORIAL_TABLE_MAX + 10)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,13 @@
+import io
 import os
+import shutil
+import tarfile
+import tempfile
 import unittest
 import errno
 
 from orangecontrib.bio import taxonomy
+from orangecontrib.bio.ncbi import taxonomy as ncbi_taxonomy
 from orangecontrib.bio.utils import serverfiles
 
 
@@ -50,3 +55,119 @@ class TestTaxonomy(unittest.TestCase):
         lineage = tax._tax.lineage("9606")
         self.assertEqual(lineage[0], "1")
         self.assertEqual(lineage[-1], "9605")
+
+
+# tax_id: (parent, rank, name)
+NODES = {1: (1, "no rank", "root"),
+         2: (1, "superkingdom", "Bacteria"),
+         10: (1, "superkingdom", "Eukaryota"),
+         11: (10, "genus", "Homo"),
+         12: (11, "species", "Homo sapiens"),
+         13: (11, "species", "Homo erectus"),
+         20: (2, "species", "Escherichia coli"),
+         21: (12, "subspecies", "Homo sapiens sapiens")}
+
+
+def write_taxdump(filename):
+    def dmp(rows):
+        return "".join("\t|\t".join(map(str, row)) + "\t|\n"
+                       for row in rows).encode("utf-8")
+    files = {
+        "nodes.dmp": dmp((id, parent, rank)
+                         for id, (parent, rank, _) in NODES.items()),
+        "names.dmp": dmp((id, name, "", "scientific name")
+                         for id, (_, _, name) in NODES.items())
+    }
+    with tarfile.open(filename, "w:gz") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+class TestTaxonomyIndex(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "taxonomy.sqlite")
+        taxdump = os.path.join(self.path, "taxdump.tar.gz")
+        write_taxdump(taxdump)
+        ncbi_taxonomy.Taxonomy.initialize(self.filename, taxdump)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_queries(self):
+        tax = ncbi_taxonomy.Taxonomy(self.filename)
+        self.assertEqual(sorted(tax, key=int), [str(i) for i in sorted(NODES)])
+        self.assertEqual(len(tax), len(NODES))
+        self.assertEqual(tax.lineage("21"), ["1", "10", "11", "12"])
+        self.assertEqual(tax.lineage("1"), [])
+        self.assertEqual(tax.parent_tax_id("12"), "11")
+        self.assertIsNone(tax.parent_tax_id("1"))
+        self.assertEqual(tax.child_tax_ids("1"), ["2", "10"])
+        self.assertEqual(tax.child_tax_ids("11"), ["12", "13"])
+        self.assertEqual(tax.subtree_tax_ids("10"), ["11", "12", "13", "21"])
+        self.assertEqual(tax.subtree_tax_ids("10", levels=2),
+                         ["11", "12", "13"])
+        entry = tax["12"]
+        self.assertEqual((entry.parent_tax_id, entry.name, entry.rank),
+                         ("11", "Homo sapiens", "species"))
+        self.assertEqual(tax["1"].parent_tax_id, "1")
+        self.assertRaises(KeyError, tax.lineage, "99")
+        self.assertRaises(KeyError, tax.__getitem__, "99")
+
+        self.assertTrue(os.path.exists(self.filename + ".index.npz"))
+        cached = ncbi_taxonomy.Taxonomy(self.filename)
+        self.assertEqual(list(cached.index.parents), list(tax.index.parents))
+        self.assertEqual(cached.index.ranks, tax.index.ranks)
+
+
+class TestPickledCache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, "cache.pickle")
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def cached(self, version=1, maxSize=3):
+        @taxonomy.pickled_cache(self.filename, version=version,
+                                maxSize=maxSize)
+        def square(x):
+            self.calls.append(x)
+            return x * x
+        return square
+
+    def test_cache(self):
+        square = self.cached()
+        self.assertEqual([square(x) for x in [1, 2, 1, 3, 4, 1]],
+                         [1, 4, 1, 9, 16, 1])
+        self.assertEqual(self.calls, [1, 2, 3, 4])
+        self.assertEqual(list(square.cache.entries), [(3,), (4,), (1,)])
+
+        # a new process reads the last appended entries
+        square = self.cached()
+        self.assertEqual([square(x) for x in [2, 3, 4, 1]], [4, 9, 16, 1])
+        self.assertEqual(self.calls, [1, 2, 3, 4, 1])
+        for x in range(20):
+            square(x)
+        self.assertLessEqual(square.cache.records, 4 * 3 + 1)
+        self.assertEqual(len(square.cache.entries), 3)
+
+        # a different version invalidates the cache
+        square = self.cached(version=2)
+        del self.calls[:]
+        square(19)
+        self.assertEqual(self.calls, [19])
+        self.assertEqual(square.__name__, "square")
+
+    def test_copy(self):
+        @taxonomy.pickled_cache(self.filename)
+        def names(x):
+            return {x: [x]}
+
+        names("a")["a"].append("b")
+        res = names("a")
+        res["b"] = []
+        self.assertEqual(names("a"), {"a": ["a"]})
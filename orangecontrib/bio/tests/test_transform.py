@@ -0,0 +1,187 @@
+import unittest
+import warnings
+
+import numpy
+import scipy.stats
+
+from orangecontrib.bio import gene
+from orangecontrib.bio.utils import expression
+
+try:
+    from orangecontrib.bio.geneset import transform
+except ImportError:
+    # transform needs Orange 2
+    transform = None
+
+
+class Value(object):
+    """ A value of an Orange 2 example. """
+    def __init__(self, value):
+        self.value = value
+
+
+class Instance(list):
+    """ The part of an Orange 2 example used by PCA and PLS _use_par. """
+    def __init__(self, values):
+        list.__init__(self, [Value(v) for v in values])
+        self.domain = type("Domain", (), {"attributes": values})
+
+
+class Domain(object):
+    def __init__(self, names):
+        self.attributes = [type("Variable", (), {"name": n}) for n in names]
+
+
+@unittest.skipIf(transform is None, "geneset.transform needs Orange 2")
+class TestBatchTransform(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.rng = rng
+        self.X = rng.randn(15, 12)
+        self.X[rng.rand(15, 12) < 0.15] = numpy.nan
+        self.columns = [[0, 1, 2], [3, 5, 7, 9], [4], [2, 6, 8, 10, 11],
+                        [1, 4, 7]]
+
+    def known(self, row, columns):
+        return [v for v in row[columns] if not numpy.isnan(v)]
+
+    def test_mean_median(self):
+        specs = [transform.BatchMean(c) for c in self.columns]
+        for kind, fn in [(transform.BatchMean, transform.Mean().fn),
+                         (transform.BatchMedian, transform.Median().fn)]:
+            out = kind.compute(self.X, specs, self.columns)
+            with warnings.catch_warnings():
+                # sets without known values
+                warnings.simplefilter("ignore", RuntimeWarning)
+                expected = [[fn(self.known(row, c)) for c in self.columns]
+                            for row in self.X]
+            numpy.testing.assert_allclose(out, expected)
+
+    def test_linear(self):
+        rng = self.rng
+        specs = [transform.BatchLinear(c, rng.randn(len(c)),
+                                       rng.randn(len(c)))
+                 for c in self.columns]
+        out = transform.BatchLinear.compute(self.X, specs, self.columns)
+        for row, values in zip(self.X, out):
+            # unknown values contribute 0 (as in CORGs)
+            expected = [numpy.nansum(s.weights * (row[c] - s.center))
+                        for s, c in zip(specs, self.columns)]
+            numpy.testing.assert_allclose(values, expected)
+
+        # PCA and PLS features (on data without unknown values)
+        X = numpy.nan_to_num(self.X)
+        c = self.columns[1]
+        evals, evect, xmean = transform.pca(X[:, c])
+        W, P = rng.randn(len(c), 1), rng.randn(len(c), 1)
+        for method, constructt, spec in [
+                (transform.PCA(), (evals, evect, xmean),
+                 transform.BatchLinear(c, evect[0], xmean)),
+                (transform.PLS(), (xmean, W, P, None),
+                 transform.BatchLinear(c, W[:, 0], xmean))]:
+            out = transform.BatchLinear.compute(X, [spec], [c])
+            numpy.testing.assert_allclose(
+                out[:, 0],
+                [method._use_par(Instance(row[c]), constructt)
+                 for row in X])
+
+    def llr(self, row, columns, gaussians, normalize):
+        # the get_value_from of LLR features
+        vals = [transform._llrlogratio(v, *g) if not numpy.isnan(v) else 0.0
+                for v, g in zip(row[columns], gaussians)]
+        if normalize is not None:
+            vals = [0. if s == 0 else (v - m) / s
+                    for v, (m, s) in zip(vals, normalize)]
+        return sum(vals)
+
+    def test_llr(self):
+        rng = self.rng
+        params = []
+        for i, c in enumerate(self.columns):
+            gaussians = [[rng.randn(), rng.rand() + 0.5,
+                          rng.randn(), rng.rand() + 0.5] for _ in c]
+            if i == 1:
+                gaussians[0][1] = 0  # problems with estimation
+                gaussians[1][2] = None
+            normalize = None
+            if i % 2 == 0:
+                normalize = [[rng.randn(), rng.rand() + 0.5] for _ in c]
+                normalize[0][1] = 0  # no differences
+            params.append((gaussians, normalize))
+        specs = [transform.BatchLLR(c, g, n)
+                 for c, (g, n) in zip(self.columns, params)]
+        # features with and without normalization are computed together
+        for chunk in [None, 4]:
+            out = transform.BatchLLR.compute(self.X, specs, self.columns,
+                                             chunk=chunk)
+            expected = [[self.llr(row, c, g, n)
+                         for c, (g, n) in zip(self.columns, params)]
+                        for row in self.X]
+            numpy.testing.assert_allclose(out, expected)
+
+    def test_batch_transform(self):
+        rng = self.rng
+        names = ["G%i" % i for i in range(12)]
+        domain = Domain(names)
+        genes = [[names[i] for i in c] + ["unknown"] for c in self.columns]
+        specs = [transform.BatchMean(genes[0]),
+                 transform.BatchLinear(genes[1], rng.randn(5)),
+                 transform.BatchMedian(genes[2]),
+                 transform.BatchLLR(genes[3],
+                                    rng.rand(6, 4) + 0.5, rng.rand(6, 2)),
+                 transform.BatchMean(genes[4])]
+        out = transform.batch_transform(self.X, domain, gene.GMDirect(),
+                                        specs)
+        # unmatched genes are unknown
+        X = numpy.hstack((self.X, numpy.full((len(self.X), 1), numpy.nan)))
+        for i, (spec, c) in enumerate(zip(specs, self.columns)):
+            numpy.testing.assert_allclose(
+                out[:, i], type(spec).compute(X, [spec], [c + [12]])[:, 0])
+
+
+def greedy_corg(X, y, inds, tscores):
+    """ The search of compute_corg on a data matrix. """
+    tscores = [tscores[i] for i in inds]
+    decreasing = bool(numpy.mean(tscores) >= 0)
+    sortedinds = [i for i, _ in sorted(zip(inds, tscores), key=lambda x: x[1],
+                                       reverse=decreasing)]
+
+    def S(corg):
+        activity = numpy.nan_to_num(X[:, corg]).sum(axis=1) / len(corg) ** 0.5
+        return abs(scipy.stats.ttest_ind(activity[y == 0],
+                                         activity[y == 1])[0])
+
+    g = S(sortedinds[:1])
+    bg = 1
+    for a in range(2, len(sortedinds) + 1):
+        tg = S(sortedinds[:a])
+        if tg > g:
+            g = tg
+            bg = a
+        else:
+            break
+    return sortedinds[:bg]
+
+
+@unittest.skipIf(transform is None, "geneset.transform needs Orange 2")
+class TestCorgSearch(unittest.TestCase):
+    def test_corg_search(self):
+        rng = numpy.random.RandomState(0)
+        y = numpy.array([0] * 10 + [1] * 12)
+        X = rng.randn(22, 60) + numpy.outer(y, rng.randn(60))
+        X[rng.rand(22, 60) < 0.1] = numpy.nan
+        tscores = expression.t_test_columns(X, y)
+        members = [sorted(rng.choice(60, size, replace=False))
+                   for size in [1, 2, 5, 10, 20, 40] * 3]
+        expected = [greedy_corg(X, y, inds, tscores) for inds in members]
+        self.assertEqual(
+            [transform.corg_search(X, y, inds, tscores) for inds in members],
+            expected)
+        self.assertEqual(transform.corg_search(X, y, [], tscores), [])
+        self.assertEqual(
+            transform.corg_search_many(X, y, members, n_jobs=2, block=4),
+            expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
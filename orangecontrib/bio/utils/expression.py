@@ -1,6 +1,7 @@
 from __future__ import absolute_import, division
 
 import numpy
+from numpy.lib.stride_tricks import as_strided
 
 import Orange
 import scipy.stats
@@ -146,28 +147,63 @@ class MA_fold_change(object):
 class MA_anova(object):
     def __init__(self, prob=False):
         self.prob = prob
-    def __call__(self, i, data):
-        cv = data.domain.class_var
-        #print data.domain
 
+    def __call__(self, i, data):
         #for faster computation. to save dragging many attributes along
-        dom2 = Orange.data.Domain([data.domain[i]], data.domain.class_var)
+        at = data.domain[data.domain.index(i)]
+        dom2 = Orange.data.Domain([at], data.domain.class_var)
         data = Orange.data.Table(dom2, data)
-        i = 0
-
-        def avWCVal(value):
-            return [ex[i].value for ex in data if ex[cv] == value and not ex[i].isSpecial() ]
-
-        data = [avWCVal(val) for val in cv.values]
-
-        try:
-            f, prob = scipy.stats.f_oneway(*tuple(data))
-            return prob if self.prob else f
-        except:
-            return 1.0 if self.prob else 0.0
+        return self.scores(data)[0]
+
+    def scores(self, data):
+        """ Return scores (as from calling with each attribute) of all
+        attributes of data, computed at once (see f_oneway_columns). """
+        f, prob = self.columns(data)
+        return [ (1.0 if self.prob else 0.0) if numpy.isnan(a)
+                 else float(b if self.prob else a) for a, b in zip(f, prob) ]
+
+    @staticmethod
+    def columns(data):
+        """ Return ANOVA F statistics and p-values of all attributes
+        across class values. """
+        X = data.toNumpyMA("a")[0].filled(numpy.nan)
+        y = data.toNumpyMA("c")[0].filled(numpy.nan)
+        return f_oneway_columns(X, y, range(len(data.domain.class_var.values)))
+
+import multiprocessing
+import multiprocessing.sharedctypes
 
 import numpy as np
 import numpy.ma as ma
+import scipy.special
+
+def expression_matrix(data):
+    """
+    Return a pair (X, y) of arrays with attribute values (NaN for
+    unknown values) and class value indices of an example table.
+    """
+    attributes = data.domain.attributes
+    X = numpy.array([ [ numpy.nan if ex[a].isSpecial() else float(ex[a])
+        for a in attributes ] for ex in data ], dtype=float)
+    values = list(data.domain.classVar.values)
+    y = numpy.array([ values.index(ex[-1].value) for ex in data ], dtype=float)
+    return X, y
+
+def shared_array(a):
+    """
+    Copy a float array into shared memory (for worker processes).
+    Return a (buffer, shape) pair.
+    """
+    a = numpy.ascontiguousarray(a, dtype=float)
+    raw = multiprocessing.sharedctypes.RawArray("d", a.size)
+    numpy.frombuffer(raw, dtype=float)[:] = a.ravel()
+    return raw, a.shape
+
+def from_shared(shared):
+    """ Return an array view of a (buffer, shape) pair from
+    :func:`shared_array`. """
+    raw, shape = shared
+    return numpy.frombuffer(raw, dtype=float).reshape(shape)
 
 class ExpressionSignificance_Test(object):
     def __new__(cls, data, useAttributeLabels, **kwargs):
@@ -246,12 +282,156 @@ class ExpressionSignificance_Test(object):
             advance()
         self.classes = originalClasses
         return results
-    
+
+    #a classmethod computing the statistic for all permutations at once
+    #from group moments (see null_distribution_batch), or None
+    batch_statistic = None
+
+    def null_distribution_batch(self, num, target=None, permutations=None,
+                                memory=2**28, n_jobs=None, advance=None):
+        """
+        Return the statistic for num random permutations of class labels
+        as an array (permutations x keys) or, for tests with a (statistic,
+        p-value) result, a pair of such arrays. Undefined values are nan.
+
+        Permutations (an index matrix as from :func:`permutation_indices`)
+        are evaluated in chunks which use roughly memory bytes, in n_jobs
+        processes if given.
+        """
+        if self.batch_statistic is None:
+            raise NotImplementedError("%s has no batch statistic" %
+                                      type(self).__name__)
+        if permutations is None:
+            permutations = permutation_indices(len(self.classes), num)
+        permutations = np.asarray(permutations, dtype=int)
+
+        groups = self.test_indices(target) if target is not None else []
+        members = np.zeros((len(groups), len(self.classes)))
+        for g, ind in enumerate(groups):
+            members[g, np.asarray(ind, dtype=int)] = 1.0
+        data = moment_arrays(self.array)
+
+        genes = self.array.shape[1]
+        per_perm = 8 * (genes * (3 * len(groups) + 2) + members.size)
+        rows = max(1, memory // per_perm)
+        chunks = [permutations[i:i + rows]
+                  for i in range(0, len(permutations), rows)]
+
+        pool = None
+        if n_jobs and n_jobs > 1 and len(chunks) > 1:
+            pool = multiprocessing.Pool(n_jobs, _null_init,
+                                        (type(self), members, data))
+            results = pool.imap(_null_chunk, chunks)
+        else:
+            results = (_permuted_statistic(type(self), members, data, perm)
+                       for perm in chunks)
+        parts = []
+        try:
+            for perm, res in zip(chunks, results):
+                parts.append(res)
+                if advance is not None:
+                    for _ in range(len(perm)):
+                        advance()
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        if not parts:
+            #no permutations; the statistic of none has the result's structure
+            parts.append(_permuted_statistic(
+                type(self), members, data,
+                np.zeros((0, len(self.classes)), dtype=int)))
+        if isinstance(parts[0], tuple):
+            return tuple(np.vstack([p[i] for p in parts])
+                         for i in range(len(parts[0])))
+        return np.vstack(parts)
+
+
+def permutation_indices(n, num, random_state=None):
+    """ Return a (num x n) matrix with a permutation of range(n) in each
+    row. random_state is a seed or a numpy RandomState (numpy.random if
+    None).
+    """
+    if random_state is None:
+        rng = np.random
+    elif isinstance(random_state, np.random.RandomState):
+        rng = random_state
+    else:
+        rng = np.random.RandomState(random_state)
+    return np.argsort(rng.rand(num, n), axis=1)
+
+
+def moment_arrays(array):
+    """ Return values (0 where unknown), squared deviations from column
+    means of known values, indicators of known values, and the column
+    means of a (masked) array.
+    """
+    array = ma.asarray(array)
+    known = (~ma.getmaskarray(array)).astype(float)
+    values = array.filled(0.0).astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        center = values.sum(axis=0) / known.sum(axis=0)
+    center = np.where(np.isfinite(center), center, 0.0)
+    return values, known * (values - center) ** 2, known, center
+
+
+def group_moments(members, data):
+    """ Return (rows, count, mean, var) of each group of a membership
+    matrix (groups x permutations x rows) on data from moment_arrays:
+    the number of rows, the number of known values, and the mean and the
+    (biased, as ma.var) variance of known values in each column.
+    """
+    values, sqdev, known, center = data
+    moments = []
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for m in members:
+            count = m.dot(known)
+            mean = m.dot(values) / count
+            var = m.dot(sqdev) / count - (mean - center) ** 2
+            moments.append((m.sum(axis=1)[:, None], count, mean,
+                            np.maximum(var, 0.0)))
+    return moments
+
+
+def _permuted_statistic(cls, members, data, permutations):
+    res = cls.batch_statistic(group_moments(members[:, permutations], data))
+    #infinite values (divisions by zero) are masked by __call__
+    undefined = lambda a: np.where(np.isfinite(a), a, np.nan)
+    return tuple(map(undefined, res)) if isinstance(res, tuple) \
+        else undefined(res)
+
+#state of null_distribution_batch worker processes
+_null_shared = {}
+
+def _null_init(cls, members, data):
+    _null_shared.clear()
+    _null_shared.update(cls=cls, members=members, data=data)
+
+def _null_chunk(permutations):
+    return _permuted_statistic(_null_shared["cls"], _null_shared["members"],
+                               _null_shared["data"], permutations)
+
+
+def _t_prob(df, t):
+    """ Two tailed p-values of the t statistic (as attest_ind). """
+    with np.errstate(invalid="ignore"):
+        return 2.0 * scipy.special.stdtr(df, -np.abs(t))
+
+
 class ExpressionSignificance_TTest(ExpressionSignificance_Test):
     def __call__(self, target):
         ind1, ind2 = self.test_indices(target)
         t, pval = attest_ind(self.array[ind1, :], self.array[ind2, :], dim=self.dim)
         return list(zip(self.keys,  zip(t, pval)))
+
+    @classmethod
+    def batch_statistic(cls, moments):
+        (n1, _, x1, v1), (n2, _, x2, v2) = moments
+        df = n1 + n2 - 2.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            svar = ((n1 - 1) * v1 + (n2 - 1) * v2) / df
+            t = (x1 - x2) / np.sqrt(svar * (1.0 / n1 + 1.0 / n2))
+        return t, _t_prob(df, t)
         
 class ExpressionSignificance_FoldChange(ExpressionSignificance_Test):
     def __call__(self, target):
@@ -259,6 +439,12 @@ class ExpressionSignificance_FoldChange(ExpressionSignificance_Test):
         a1, a2 = self.array[ind1, :], self.array[ind2, :]
         fold = ma.mean(a1, self.dim)/ma.mean(a2, self.dim)
         return list(zip(self.keys, fold))
+
+    @classmethod
+    def batch_statistic(cls, moments):
+        (_, _, x1, _), (_, _, x2, _) = moments
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return x1 / x2
     
 class ExpressionSignificance_SignalToNoise(ExpressionSignificance_Test):
     def __call__(self, target):
@@ -266,6 +452,12 @@ class ExpressionSignificance_SignalToNoise(ExpressionSignificance_Test):
         a1, a2 = self.array[ind1, :], self.array[ind2, :]
         stn = (ma.mean(a1, self.dim) - ma.mean(a2, self.dim)) / (ma.sqrt(ma.var(a1, self.dim)) + ma.sqrt(ma.var(a2, self.dim)))
         return list(zip(self.keys, stn))
+
+    @classmethod
+    def batch_statistic(cls, moments):
+        (_, _, x1, v1), (_, _, x2, v2) = moments
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (x1 - x2) / (np.sqrt(v1) + np.sqrt(v2))
     
 class ExpressionSignificance_ANOVA(ExpressionSignificance_Test):
     def __call__(self, target=None):
@@ -275,6 +467,24 @@ class ExpressionSignificance_ANOVA(ExpressionSignificance_Test):
             indices = []
         f, prob = aF_oneway(*[self.array[ind, :] for ind in indices], **dict(dim=0))
         return list(zip(self.keys, zip(f, prob)))
+
+    @classmethod
+    def batch_statistic(cls, moments):
+        # sums of squares of aF_oneway from group moments
+        bign = sum(count for _, count, _, _ in moments)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            grand = sum(count * mean for _, count, mean, _ in moments) / bign
+            ssbn = sum(count * (mean - grand) ** 2
+                       for _, count, mean, _ in moments)
+            sswn = sum(count * var for _, count, _, var in moments)
+            dfbn = float(len(moments) - 1)
+            dfwn = bign - len(moments)
+            F = (ssbn / dfbn) / (sswn / dfwn)
+            x = dfwn / (dfwn + dfbn * F)
+            prob = np.where((x >= 0.0) & (x <= 1.0),
+                            scipy.special.betainc(0.5 * dfwn, 0.5 * dfbn, x),
+                            np.nan)
+        return F, prob
         
 class ExpressionSignificance_ChiSquare(ExpressionSignificance_Test):
     def __call__(self, target):
@@ -334,6 +544,148 @@ def attest_ind(a, b, dim=None):
         prob = [scipy.stats.betai(0.5*df,0.5,df/(df+tsq)) if tsq is not ma.masked and df/(df+tsq) <= 1.0 else ma.masked  for tsq in t*t]
         return t, prob
 
+def signalToNoise(X, y, a=0, b=1):
+    """
+    Return signal to noise ratios (as MA_signalToNoise) of all columns
+    of X for class value indices a and b in y. Unknown values are NaN.
+    """
+    def meanstd(values):
+        known = ~numpy.isnan(values)
+        count = known.sum(axis=0)
+        values = numpy.where(known, values, 0.0)
+        mean = values.sum(axis=0) / count
+        sqdev = numpy.where(known, values - mean, 0.0)**2
+        std = numpy.sqrt(sqdev.sum(axis=0) / (count - 1))
+        #return minmally 0.2*|mi|, where mi=0 is adjusted to mi=1
+        return mean, numpy.maximum(std, 0.2*numpy.abs(numpy.where(mean == 0, 1.0, mean)))
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        meana, stda = meanstd(X[y == a])
+        meanb, stdb = meanstd(X[y == b])
+        return (meana - meanb) / (stda + stdb)
+
+def t_test_columns(X, y, a=0, b=1):
+    """ Return t statistics (as :obj:`MA_t_test`) of all columns of X
+    for instances with class value indices a and b in y. Unknown values
+    (nan) are left out column by column.
+    """
+    X = numpy.asarray(X, dtype=float)
+    y = numpy.asarray(y)
+
+    def moments(values):
+        known = ~numpy.isnan(values)
+        count = known.sum(axis=0)
+        values = numpy.where(known, values, 0.0)
+        mean = values.sum(axis=0) / count
+        ss = (numpy.where(known, values - mean, 0.0) ** 2).sum(axis=0)
+        return mean, ss, count
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        mean1, ss1, n1 = moments(X[y == a])
+        mean2, ss2, n2 = moments(X[y == b])
+        svar = (ss1 + ss2) / (n1 + n2 - 2)
+        #group variances are undefined for less than two values
+        svar = numpy.where((n1 < 2) | (n2 < 2), numpy.nan, svar)
+        return (mean1 - mean2) / numpy.sqrt(svar * (1.0 / n1 + 1.0 / n2))
+
+def rank_columns(X):
+    """ Return average ranks (from 1, tied values share the mean of
+    their ranks) of known values in each column of X and the tie
+    correction terms sum(t**3 - t) over groups of t tied values in each
+    column. Unknown values (nan) have nan ranks.
+    """
+    X = numpy.asarray(X, dtype=float)
+    n, m = X.shape
+    columns = numpy.arange(m)
+    #nan values are sorted last
+    order = numpy.argsort(X, axis=0, kind="mergesort")
+    values = X[order, columns]
+    known = ~numpy.isnan(values)
+
+    #the first and the last position of each run of tied values
+    index = numpy.arange(n).reshape(-1, 1)
+    first = numpy.ones(values.shape, dtype=bool)
+    first[1:] = values[1:] != values[:-1]
+    last = numpy.ones(values.shape, dtype=bool)
+    last[:-1] = first[1:]
+    start = numpy.maximum.accumulate(numpy.where(first, index, 0), axis=0)
+    end = numpy.minimum.accumulate(
+        numpy.where(last, index, n)[::-1], axis=0)[::-1]
+
+    ranks = numpy.empty(X.shape)
+    ranks[order, columns] = numpy.where(known, (start + end) / 2.0 + 1,
+                                        numpy.nan)
+    #each of t tied values adds t**2 - 1
+    t = end - start + 1
+    ties = numpy.where(known, t * t - 1, 0).sum(axis=0)
+    return ranks, ties
+
+def _mann_whitney_p(U, n1, n2, ties):
+    """ Two sided p-values of the Mann-Whitney U statistic (of either
+    group) from the normal approximation with tie and continuity
+    corrections (as scipy.stats.mannwhitneyu with method="asymptotic").
+    """
+    n = n1 + n2
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        U = numpy.maximum(U, n1 * n2 - U)
+        s = numpy.sqrt(n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1.0))))
+        z = (U - n1 * n2 / 2.0 - 0.5) / s
+        return numpy.clip(2 * scipy.special.ndtr(-z), 0, 1)
+
+def mann_whitney_columns(X, y, a=0, b=1):
+    """ Return Mann-Whitney U statistics (of the first group, as
+    scipy.stats.mannwhitneyu) and their two sided p-values (from the
+    normal approximation) of all columns of X for instances with class
+    value indices a and b in y. Unknown values (nan) are left out column
+    by column.
+    """
+    X = numpy.asarray(X, dtype=float)
+    y = numpy.asarray(y)
+    ina = y[(y == a) | (y == b)] == a
+    ranks, ties = rank_columns(X[(y == a) | (y == b)])
+    known = ~numpy.isnan(ranks)
+    n1 = known[ina].sum(axis=0)
+    n2 = known[~ina].sum(axis=0)
+    with numpy.errstate(invalid="ignore"):
+        U = numpy.where(known[ina], ranks[ina], 0.0).sum(axis=0) - \
+            n1 * (n1 + 1) / 2.0
+        U = numpy.where((n1 > 0) & (n2 > 0), U, numpy.nan)
+    return U, _mann_whitney_p(U, n1, n2, ties)
+
+def f_oneway_columns(X, y, groups=None):
+    """ Return one-way ANOVA F statistics and p-values of all columns of
+    X for groups of instances with class value indices (groups, by
+    default all values in y) in y. Unknown values (nan) are left out
+    column by column and groups without known values do not count.
+    """
+    X = numpy.asarray(X, dtype=float)
+    y = numpy.asarray(y)
+    if groups is None:
+        groups = numpy.unique(y[y == y])
+
+    counts, means, ssw = [], [], 0.0
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        for g in groups:
+            values = X[y == g]
+            known = ~numpy.isnan(values)
+            count = known.sum(axis=0)
+            mean = numpy.where(known, values, 0.0).sum(axis=0) / count
+            dev = numpy.where(known, values - mean, 0.0)
+            ssw = ssw + (dev ** 2).sum(axis=0)
+            counts.append(count)
+            means.append(numpy.where(count > 0, mean, 0.0))
+        counts, means = numpy.array(counts), numpy.array(means)
+
+        k = (counts > 0).sum(axis=0)
+        bign = counts.sum(axis=0)
+        grand = (counts * means).sum(axis=0) / bign
+        ssb = (counts * (means - grand) ** 2).sum(axis=0)
+        dfb, dfw = k - 1, bign - k
+        F = (ssb / dfb) / (ssw / dfw)
+        F = numpy.where((dfb > 0) & (dfw > 0), F, numpy.nan)
+        return F, scipy.special.fdtrc(numpy.maximum(dfb, 1),
+                                      numpy.maximum(dfw, 1), F)
+
 def aF_oneway(*args, **kwargs):
     dim = kwargs.get("dim", None)
     arrays = args
@@ -608,6 +960,145 @@ def lowess2(x, y, xest, f=2./3., iter=3, progressCallback=None):
     return yest2
 
 
+def _lowess_windows(xs, q, k):
+    """
+    Return the start (into sorted `xs`) of the window of `k` nearest
+    points to each of the points `q` and the distance to the farthest
+    of them (the bandwidth).
+    """
+    n = len(xs)
+    lo = numpy.zeros(len(q), dtype=int)
+    hi = numpy.zeros(len(q), dtype=int) + (n - k)
+    # bisect for the first start from which moving the window to the
+    # right does not bring it closer
+    while True:
+        active = lo < hi
+        if not active.any():
+            break
+        mid = (lo + hi) // 2
+        right = xs[numpy.minimum(mid + k, n - 1)] - q < q - xs[mid]
+        lo = numpy.where(active & right, mid + 1, lo)
+        hi = numpy.where(active & ~right, mid, hi)
+    h = numpy.maximum(q - xs[lo], xs[lo + k - 1] - q)
+    return lo, h
+
+
+def _lowess_fit(xs, ys, delta, q, k, block_size=2 ** 16,
+                progressCallback=None):
+    """
+    Return the robust locally weighted linear fit at points `q` using
+    the `k` nearest of the sorted points `xs`, `ys` (with robustness
+    weights `delta`). Points are fitted in blocks of about `block_size`
+    window elements.
+    """
+    lo, h = _lowess_windows(xs, q, k)
+    est = numpy.zeros(len(q))
+    step = max(1, block_size // k)
+
+    def windows(a):
+        # a (read only) view of all windows of k consecutive elements
+        a = numpy.ascontiguousarray(a, dtype=float)
+        return as_strided(a, (len(a) - k + 1, k), (a.strides[0],) * 2)
+
+    xs_w, ys_w, delta_w = windows(xs), windows(ys), windows(delta)
+    for start in range(0, len(q), step):
+        end = min(start + step, len(q))
+        rows = lo[start:end]
+        qb, hb = q[start:end, None], h[start:end, None]
+        xw = xs_w[rows] - qb
+        with numpy.errstate(divide="ignore"):
+            scale = numpy.where(hb > 0, 1.0 / hb, 0.0)
+        # tricube weights (1 - |d / h| ** 3) ** 3
+        w = numpy.abs(xw)
+        w *= scale
+        numpy.minimum(w, 1.0, w)
+        u = w * w
+        u *= w
+        numpy.subtract(1.0, u, u)
+        numpy.multiply(u, u, w)
+        w *= u
+        w *= delta_w[rows]
+        yw = ys_w[rows]
+        A11 = w.sum(axis=1)
+        A12 = numpy.einsum("ij,ij->i", w, xw)
+        b1 = numpy.einsum("ij,ij->i", w, yw)
+        w *= xw
+        A22 = numpy.einsum("ij,ij->i", w, xw)
+        b2 = numpy.einsum("ij,ij->i", w, yw)
+        # x is centered at the fitted point, so the fit is the intercept
+        determinant = A11 * A22 - A12 * A12
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            degenerate = determinant <= 1e-12 * A11 * A22
+            est[start:end] = numpy.where(
+                degenerate, b1 / A11,
+                (A22 * b1 - A12 * b2) / numpy.where(degenerate, 1,
+                                                    determinant))
+        if progressCallback:
+            progressCallback(100. * end / len(q))
+    return est
+
+
+def lowess_windowed(x, y, xest=None, f=2./3., iter=3, grid=None,
+                    progressCallback=None):
+    """Robust locally weighted regression (as :func:`lowess` and
+    :func:`lowess2`) with memory linear in the number of points.
+
+    Return the estimated values of y in points xest (in x if None).
+    The points are sorted by x, so the f * n nearest neighbours of each
+    estimated point form a window found by bisection, and the fits are
+    computed in blocks of windows. If `grid` is given, the curve is
+    only fitted in `grid` equally spaced points and linearly
+    interpolated (also for the residuals of the robustifying
+    iterations), which takes time linear in the number of points.
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    n = len(x)
+    if n == 0:
+        return numpy.zeros(0 if xest is None else len(xest))
+    k = min(int(numpy.ceil(f * n)), n - 1) + 1
+    order = numpy.argsort(x, kind="mergesort")
+    xs, ys = x[order], y[order]
+    if grid is not None:
+        points = numpy.linspace(xs[0], xs[-1], max(int(grid), 2))
+    elif xest is not None:
+        points = numpy.asarray(xest, dtype=float)
+    else:
+        points = xs
+
+    delta = numpy.ones(n)
+    for iteration in range(iter):
+        callback = None
+        if progressCallback:
+            callback = lambda val, iteration=iteration: progressCallback(
+                (100. * iteration + val) / iter)
+        last = iteration == iter - 1
+        if last or grid is not None or xest is None:
+            fit = _lowess_fit(xs, ys, delta, points, k,
+                              progressCallback=callback)
+            if last:
+                break
+            fitted = fit if grid is None else numpy.interp(xs, points, fit)
+        else:
+            fitted = _lowess_fit(xs, ys, delta, xs, k,
+                                 progressCallback=callback)
+        residuals = ys - fitted
+        s = numpy.median(numpy.abs(residuals))
+        if s > 0:
+            delta = numpy.clip(residuals / (6 * s), -1, 1)
+            delta = 1 - delta * delta
+            delta = delta * delta
+
+    if grid is not None:
+        return numpy.interp(x if xest is None else xest, points, fit)
+    elif xest is None:
+        est = numpy.zeros(n)
+        est[order] = fit
+        return est
+    else:
+        return fit
+
+
 def attr_group_indices(data, label_groups):
     """ Return a two or more lists of indices into `data.domain` based on `label_groups`
     
@@ -751,11 +1242,11 @@ def MA_center_lowess(G, R, f=2./3., iter=1, progressCallback=None):
     """ return the G, R by centering the average log2 ratio locally
     depending on the intensity using lowess (locally weighted linear regression)
     """
-#    from Bio.Statistics.lowess import lowess
     ratio, intensity = ratio_intensity(G, R)
     valid = ~ (ratio.mask & intensity.mask)
-    valid_ind = numpy.ma.where(valid)
-    center_est = lowess(intensity[valid], ratio[valid], f=f, iter=iter, progressCallback=progressCallback)
+    center_est = lowess_windowed(numpy.ma.getdata(intensity[valid]),
+                                 numpy.ma.getdata(ratio[valid]), f=f,
+                                 iter=iter, progressCallback=progressCallback)
     Gc, R = G.copy(), R.copy()
     Gc[valid] *= numpy.exp2(center_est)
     Gc.mask, R.mask = ~valid, ~valid
@@ -765,19 +1256,18 @@ def MA_center_lowess(G, R, f=2./3., iter=1, progressCallback=None):
 def MA_center_lowess_fast(G, R, f=2./3., iter=1, resolution=100, progressCallback=None):
     """return the G, R by centering the average log2 ratio locally
     depending on the intensity using lowess (locally weighted linear regression),
-    approximated only in a limited resolution.
+    approximated only in a limited resolution (the curve is fitted in
+    one point per `resolution` points and interpolated).
     """
     
     ratio, intensity = ratio_intensity(G, R)
     valid = ~ (ratio.mask & intensity.mask)
-    resolution = min(resolution, len(intensity[valid]))
-    hist, edges = numpy.histogram(intensity[valid], len(intensity[valid])//resolution)
-    
-    progressCallback2 = (lambda val: progressCallback(val/2)) if progressCallback else None 
-    centered = lowess2(intensity[valid], ratio[valid], edges, f, iter, progressCallback=progressCallback2)
-
-    progressCallback2 = (lambda val: progressCallback(50 + val/2)) if progressCallback else None
-    centered = lowess2(edges, centered, intensity[valid], f, iter, progressCallback=progressCallback2)
+    n = len(intensity[valid])
+    resolution = max(min(resolution, n), 1)
+    centered = lowess_windowed(numpy.ma.getdata(intensity[valid]),
+                               numpy.ma.getdata(ratio[valid]), f=f,
+                               iter=iter, grid=n // resolution + 1,
+                               progressCallback=progressCallback)
     
     Gc, R = G.copy(), R.copy()
     Gc[valid] *= numpy.exp2(centered)
@@ -837,37 +1327,38 @@ def MA_zscore(G, R, window=1./5., padded=False, progressCallback=None):
     """
     ratio, intensity = ratio_intensity(G, R)
     
+    # Windows of r consecutive points in the intensity order (extended
+    # by the points at the start and past the end if padded); their
+    # standard deviations come from cumulative sums.
+    order = numpy.ma.argsort(intensity)
+    n = len(order)
+    r = int(numpy.ceil(n * window)) # number of window elements
+    values = numpy.ma.getdata(ratio)[order]
+    valid = ~numpy.ma.getmaskarray(ratio)[order]
+    center = values[valid].mean() if valid.any() else 0.
+    centered = numpy.where(valid, values - center, 0.)
+    sums = numpy.r_[0., numpy.cumsum(centered)]
+    squares = numpy.r_[0., numpy.cumsum(centered * centered)]
+    counts = numpy.r_[0, numpy.cumsum(valid)]
+
+    i = numpy.arange(n)
+    start, end = i - r // 2, i + r // 2 + r % 2
+    windows = [(numpy.clip(start, 0, n), numpy.clip(end, 0, n))]
+    if padded:
+        windows.append((numpy.zeros(n, dtype=int), numpy.clip(-start, 0, n)))
+        windows.append((numpy.where(end > n, end - n, n),
+                        numpy.zeros(n, dtype=int) + n))
+    s1 = sum(sums[b] - sums[a] for a, b in windows)
+    s2 = sum(squares[b] - squares[a] for a, b in windows)
+    count = sum(counts[b] - counts[a] for a, b in windows)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        mean = s1 / count
+        local_std = numpy.sqrt(numpy.maximum(s2 / count - mean * mean, 0))
+        z = values / local_std
+    if progressCallback:
+        progressCallback(100.)
+
     z_scores = numpy.ma.zeros(G.shape)
-    sorted = list(numpy.ma.argsort(intensity))
-    import math, random
-    r = int(math.ceil(len(sorted)*window)) # number of window elements
-    def local_indices(i, sorted):
-        """ local indices in sorted (mirror padded if out of bounds)
-        """
-        start, end = i - r // 2, i + r // 2 + r % 2
-        pad_start, pad_end = [], []
-        if start < 0:
-            pad_start = sorted[:abs(start)]
-            random.shuffle(pad_start)
-            start = 0
-        if end > len(sorted):
-            pad_end = sorted[end - len(sorted):]
-            random.shuffle(pad_end)
-            end = len(sorted)
-        
-        if padded:
-            return pad_start + sorted[start: end] + pad_end
-        else:
-            return sorted[start:end]
-
-    for i in range(len(sorted)):
-        indices = local_indices(i, sorted)
-        localRatio = numpy.take(ratio, indices)
-        local_std = numpy.ma.std(localRatio)
-        ind = sorted[i]
-        z_scores[ind] = ratio[ind] / local_std
-        if progressCallback and i % (len(sorted) // 100 + 1) == 0:
-            progressCallback(100. * i / len(sorted))
-        
-    z_scores._mask = ~numpy.isfinite(z_scores)
+    z_scores[order] = numpy.ma.array(z, mask=~numpy.isfinite(z) | ~valid)
     return z_scores
+
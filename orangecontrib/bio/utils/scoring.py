@@ -0,0 +1,512 @@
+"""
+Gene scoring for differential expression
+
+Score functions take an array of samples (in rows with axis=0) for each
+group and return a score for each gene. :func:`null_scores` scores
+label permutations in batches: permuted groups are stacked as
+membership masks and the scores of all permutations in a batch are
+computed from group moments (:func:`expression.group_moments`) or, for
+rank based scores, from rank sums of the data ranked once.
+"""
+import multiprocessing
+
+import numpy as np
+import numpy.ma as ma
+import scipy.stats
+import scipy.special
+
+from orangecontrib.bio.utils import expression
+
+
+def score_fold_change(a, b, axis=0):
+    """
+    Calculate the fold change between `a` and `b` samples.
+
+    Parameters
+    ----------
+    a, b : array
+        Arrays containing the samples
+    axis : int
+        Axis over which to compute the FC
+
+    Returns
+    -------
+    FC : array
+        The FC scores
+    """
+    mean_a = np.nanmean(a, axis=axis)
+    mean_b = np.nanmean(b, axis=axis)
+    res = mean_a / mean_b
+    warning = None
+    if np.any(res < 0):
+        res[res < 0] = float("nan")
+        warning = "Negative fold change scores were ignored. You should use another scoring method."
+    return res, warning
+
+
+def score_log_fold_change(a, b, axis=0):
+    """
+    Return the log2(FC).
+
+    See Also
+    --------
+    score_fold_change
+
+    """
+    s, w = score_fold_change(a, b, axis=axis) 
+    return np.log2(s), w
+
+
+def score_ttest(a, b, axis=0):
+    T, P = scipy.stats.ttest_ind(a, b, axis=axis)
+    return T, P
+
+
+def score_ttest_t(a, b, axis=0):
+    T, _ = score_ttest(a, b, axis=axis)
+    return T
+
+
+def score_ttest_p(a, b, axis=0):
+    _, P = score_ttest(a, b, axis=axis)
+    return P
+
+
+def score_anova(*arrays, axis=0):
+    F, P = f_oneway(*arrays, axis=axis)
+    return F, P
+
+
+def score_anova_(*arrays, axis=0):
+    arrays = [np.asarray(arr, dtype=float) for arr in arrays]
+
+    if not len(arrays) > 1:
+        raise TypeError("Need at least 2 positional arguments")
+
+    if not 0 <= axis < 2:
+        raise ValueError("0 <= axis < 2")
+
+    if not all(arrays[i].ndim == arrays[i + 1].ndim
+               for i in range(len(arrays) - 2)):
+        raise ValueError("All arrays must have the same number of dimensions")
+
+    if axis >= arrays[0].ndim:
+        raise ValueError()
+
+    if axis == 0:
+        arrays = [arr.T for arr in arrays]
+
+    scores = [scipy.stats.f_oneway(*ars) for ars in zip(*arrays)]
+    F, P = zip(*scores)
+    return np.array(F, dtype=float), np.array(P, dtype=float)
+
+
+def _stacked(arrays, axis):
+    """
+    Stack samples (along `axis`) of `arrays` into rows of a matrix.
+    Return the matrix and the array index of each row.
+    """
+    arrays = [np.asarray(a, dtype=float) for a in arrays]
+    if not 0 <= axis < 2:
+        raise ValueError("0 <= axis < 2")
+    if any(a.ndim != arrays[0].ndim for a in arrays):
+        raise ValueError("All arrays must have the same number of dimensions")
+    if axis >= arrays[0].ndim:
+        raise ValueError("axis >= ndim")
+    X = np.concatenate(arrays, axis)
+    if axis == 1:
+        X = X.T
+    y = np.repeat(np.arange(len(arrays)), [a.shape[axis] for a in arrays])
+    return X.reshape(len(y), -1), y
+
+
+def f_oneway(*arrays, axis=0):
+    """
+    Perform a 1-way ANOVA
+
+    Like `scipy.stats.f_oneway` but accept 2D arrays, with `axis`
+    specifying over which axis to operate (in which axis the samples
+    are stored). Unknown values (NaN) are left out gene by gene.
+
+    Parameters
+    ----------
+    A1, A2, ... : array_like
+        The samples for each group.
+    axis : int
+        The axis which contain the samples.
+
+    Returns
+    -------
+    F : array
+        F scores
+    P : array
+        P values
+
+    See also
+    --------
+    scipy.stats.f_oneway, expression.f_oneway_columns
+    """
+    X, y = _stacked(arrays, axis)
+    F, P = expression.f_oneway_columns(X, y, range(len(arrays)))
+    if np.ndim(arrays[0]) == 1:
+        return F[0], P[0]
+    return F, P
+
+
+def score_anova_f(*arrays, axis=0):
+    F, _ = score_anova(*arrays, axis=axis)
+    return F
+
+
+def score_anova_p(*arrays, axis=0):
+    _, P = score_anova(*arrays, axis=axis)
+    return P
+
+
+def score_signal_to_noise(a, b, axis=0):
+    mean_a = np.nanmean(a, axis=axis)
+    mean_b = np.nanmean(b, axis=axis)
+
+    std_a = np.nanstd(a, axis=axis, ddof=1)
+    std_b = np.nanstd(b, axis=axis, ddof=1)
+
+    return (mean_a - mean_b) / (std_a + std_b)
+
+
+def score_mann_whitney(a, b, axis=0):
+    """
+    Mann-Whitney U statistics (of `a`) and two sided p-values from the
+    normal approximation (see :func:`expression.mann_whitney_columns`).
+    """
+    X, y = _stacked([a, b], axis)
+    U, P = expression.mann_whitney_columns(X, y)
+    if np.ndim(a) == 1:
+        return U[0], P[0]
+    return U, P
+
+
+def score_mann_whitney_u(a, b, axis=0):
+    U, _ = score_mann_whitney(a, b, axis=axis)
+    return U
+
+
+def batch_fold_change(groups):
+    """
+    Fold change (as :func:`score_fold_change`) from group moments
+    (see :func:`expression.group_moments`) of a batch of permutations.
+    """
+    (_, _, mean_a, _), (_, _, mean_b, _) = groups
+    res = mean_a / mean_b
+    return np.where(res < 0, np.nan, res)
+
+
+def batch_log_fold_change(groups):
+    return np.log2(batch_fold_change(groups))
+
+
+def _batch_t(groups):
+    (rows_a, count_a, mean_a, var_a), (rows_b, count_b, mean_b, var_b) = groups
+    df = count_a + count_b - 2
+    svar = (count_a * var_a + count_b * var_b) / df
+    T = (mean_a - mean_b) / np.sqrt(svar * (1 / count_a + 1 / count_b))
+    return np.where((count_a < rows_a) | (count_b < rows_b), np.nan, T), df
+
+
+def batch_ttest(groups):
+    """
+    The t-test (as :func:`score_ttest`) from group moments. Genes with
+    unknown values have undefined scores.
+    """
+    T, df = _batch_t(groups)
+    return T, 2 * scipy.special.stdtr(df, -np.abs(T))
+
+
+def batch_ttest_t(groups):
+    T, _ = _batch_t(groups)
+    return T
+
+
+def batch_ttest_p(groups):
+    _, P = batch_ttest(groups)
+    return P
+
+
+def _batch_f(groups):
+    # as expression.f_oneway_columns: groups without known values do
+    # not count
+    counts = np.array([count for _, count, _, _ in groups])
+    present = counts > 0
+    means = np.where(present, [mean for _, _, mean, _ in groups], 0)
+    variances = np.where(present, [var for _, _, _, var in groups], 0)
+    k = present.sum(axis=0)
+    bign = counts.sum(axis=0)
+    grand = (counts * means).sum(axis=0) / bign
+    ssbn = (counts * (means - grand) ** 2).sum(axis=0)
+    sswn = (counts * variances).sum(axis=0)
+    dfbn, dfwn = k - 1, bign - k
+    F = np.where((dfbn > 0) & (dfwn > 0), (ssbn / dfbn) / (sswn / dfwn),
+                 np.nan)
+    return F, np.maximum(dfbn, 1), np.maximum(dfwn, 1)
+
+
+def batch_anova(groups):
+    """
+    One-way ANOVA (as :func:`f_oneway`) from group moments.
+    """
+    F, dfbn, dfwn = _batch_f(groups)
+    return F, scipy.special.fdtrc(dfbn, dfwn, F)
+
+
+def batch_anova_f(groups):
+    F, _, _ = _batch_f(groups)
+    return F
+
+
+def batch_anova_p(groups):
+    _, P = batch_anova(groups)
+    return P
+
+
+def batch_signal_to_noise(groups):
+    (_, count_a, mean_a, var_a), (_, count_b, mean_b, var_b) = groups
+    std_a = np.sqrt(var_a * count_a / (count_a - 1))
+    std_b = np.sqrt(var_b * count_b / (count_b - 1))
+    return (mean_a - mean_b) / (std_a + std_b)
+
+
+#: Batch versions of score functions
+BATCH_SCORES = {
+    score_fold_change: batch_fold_change,
+    score_log_fold_change: batch_log_fold_change,
+    score_ttest_t: batch_ttest_t,
+    score_ttest_p: batch_ttest_p,
+    score_anova_f: batch_anova_f,
+    score_anova_p: batch_anova_p,
+    score_signal_to_noise: batch_signal_to_noise,
+}
+
+
+def batch_mann_whitney_u(groups, ties):
+    """
+    Mann-Whitney U statistics (as :func:`score_mann_whitney_u`) from
+    rank sums and counts of known values of the two groups.
+    """
+    (ranksum_a, n_a), (_, n_b) = groups
+    U = ranksum_a - n_a * (n_a + 1) / 2
+    return np.where((n_a > 0) & (n_b > 0), U, np.nan)
+
+
+#: Batch versions of rank based score functions
+RANK_SCORES = {
+    score_mann_whitney_u: batch_mann_whitney_u,
+}
+
+
+def permuted_labels(group_indices, n, count, random_state=None):
+    """
+    Return group labels of `n` samples under `count` permutations.
+
+    The joined group indices are shuffled and split for each permutation,
+    so the permutations are the same as from sequential shuffles with
+    the same `random_state`.
+
+    Parameters
+    ----------
+    group_indices : list of int arrays
+        Sample indices of each group.
+    n : int
+        The number of samples.
+    count : int
+        The number of permutations.
+    random_state : np.random.RandomState, optional
+
+    Returns
+    -------
+    labels : (count, n) int array
+        Group index of each sample (-1 for samples in no group).
+    """
+    if random_state is None:
+        random_state = np.random
+    groups = np.repeat(np.arange(len(group_indices)),
+                       [len(ind) for ind in group_indices])
+    labels = np.full((count, n), -1, dtype=int)
+    for i in range(count):
+        joined = np.hstack(group_indices)
+        random_state.shuffle(joined)
+        labels[i, joined] = groups
+    return labels
+
+
+class PermutationScorer:
+    """
+    Score a batch of label permutations (a `labels` matrix from
+    :func:`permuted_labels`) with `score_func`.
+
+    Score functions with a batch version in :obj:`BATCH_SCORES` or
+    :obj:`RANK_SCORES` are computed for all permutations at once; others
+    once per permutation.
+    """
+    def __init__(self, X, score_func, ngroups):
+        self.X = np.asarray(X, dtype=float)
+        self.score_func = score_func
+        self.ngroups = ngroups
+        self.batch = BATCH_SCORES.get(score_func)
+        if self.batch is not None:
+            self.data = expression.moment_arrays(ma.masked_invalid(self.X))
+        self.rank_batch = RANK_SCORES.get(score_func)
+        self.__ranks = None
+
+    def ranks(self, grouped):
+        """
+        Return ranks (0 for unknown values), indicators of known values
+        and tie terms (see :func:`expression.rank_columns`) of the
+        samples in groups (a boolean mask).
+        """
+        # Permutations only reorder the samples in groups, so these
+        # are computed once
+        if self.__ranks is None or \
+                not np.array_equal(self.__ranks[0], grouped):
+            ranks, ties = expression.rank_columns(self.X[grouped])
+            known = ~np.isnan(ranks)
+            self.__ranks = (grouped, np.where(known, ranks, 0.0),
+                            known.astype(float), ties)
+        return self.__ranks[1:]
+
+    def __call__(self, labels):
+        if self.rank_batch is not None:
+            grouped = labels[0] >= 0
+            ranks, known, ties = self.ranks(grouped)
+            members = np.array([labels[:, grouped] == g
+                                for g in range(self.ngroups)], dtype=float)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return self.rank_batch(
+                    [(m.dot(ranks), m.dot(known)) for m in members], ties)
+
+        if self.batch is not None:
+            members = np.array([labels == g for g in range(self.ngroups)],
+                               dtype=float)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return self.batch(expression.group_moments(members, self.data))
+
+        scores = []
+        for row in labels:
+            ss = self.score_func(*[self.X[row == g]
+                                   for g in range(self.ngroups)], axis=0)
+            scores.append(ss[0] if isinstance(ss, tuple) else ss)
+        return np.array(scores, dtype=float).reshape(len(labels), -1)
+
+
+#: state of null_scores worker processes
+_null_shared = {}
+
+
+def _null_init(X, score_func, ngroups):
+    _null_shared.clear()
+    _null_shared["scorer"] = PermutationScorer(
+        expression.from_shared(X), score_func, ngroups)
+
+
+def _null_batch(labels):
+    return _null_shared["scorer"](labels)
+
+
+def null_scores(X, group_indices, score_func, count, random_state=None,
+                memory=2 ** 27, n_jobs=None):
+    """
+    Score `count` permutations of group labels.
+
+    Parameters
+    ----------
+    X : (N, M) array
+        Samples in rows, genes in columns.
+    group_indices : list of int arrays
+        Sample indices of each group.
+    score_func : callable
+        A score function (like :func:`score_ttest_t`).
+    count : int
+        The number of permutations.
+    random_state : np.random.RandomState, optional
+    memory : int
+        Approximate memory (in bytes) for a batch of permutations.
+    n_jobs : int, optional
+        Score batches in a pool of `n_jobs` processes (which share `X`).
+
+    Returns
+    -------
+    batches : generator of (P, M) arrays
+        Scores of consecutive batches of permutations. The permutations
+        (and scores) do not depend on `memory` or `n_jobs`.
+    """
+    X = np.asarray(X, dtype=float)
+    n, genes = X.shape
+    k = len(group_indices)
+    rows = max(1, memory // (8 * (genes * (4 * k + 2) + n * k)))
+
+    def batches():
+        # labels are always permuted here, in order
+        for start in range(0, count, rows):
+            yield permuted_labels(group_indices, n, min(rows, count - start),
+                                  random_state)
+
+    if not n_jobs or n_jobs == 1 or count <= rows:
+        scorer = PermutationScorer(X, score_func, k)
+        for labels in batches():
+            yield scorer(labels)
+        return
+
+    pool = multiprocessing.Pool(n_jobs, _null_init,
+                                (expression.shared_array(X), score_func, k))
+    try:
+        yield from pool.imap(_null_batch, batches())
+    finally:
+        pool.terminate()
+
+
+class NullDistribution:
+    """
+    Null scores collected from batches of permutations.
+
+    Only finite scores are kept, at most `max_size` of them: when there
+    are more, the stored scores are a uniform random sample (with
+    `rate` the sampling rate) of all scores.
+    """
+    def __init__(self, max_size=2 ** 23, random_state=None):
+        self.max_size = max_size
+        self.random_state = random_state or np.random.RandomState(0)
+        #: The sampling rate
+        self.rate = 1.0
+        #: The number of permutations
+        self.permutations = 0
+        self.__chunks = []
+
+    def __sample(self, values, rate):
+        if rate >= 1:
+            return values
+        return values[self.random_state.rand(values.size) < rate]
+
+    def add(self, scores):
+        """Add scores (an array with a row for each permutation)."""
+        scores = np.asarray(scores, dtype=float)
+        self.permutations += len(scores)
+        self.__chunks.append(
+            self.__sample(scores[np.isfinite(scores)], self.rate))
+        while sum(c.size for c in self.__chunks) > self.max_size:
+            self.rate /= 2
+            self.__chunks = [self.__sample(c, 0.5) for c in self.__chunks]
+
+    def values(self):
+        """Return the stored scores."""
+        if len(self.__chunks) != 1:
+            self.__chunks = [np.hstack([np.zeros(0)] + self.__chunks)]
+        return self.__chunks[0]
+
+    def histogram(self, bins):
+        """Return (estimated) counts of all scores in bins."""
+        freq, _ = np.histogram(self.values(), bins=bins)
+        return freq / self.rate
+
+    def percentile(self, q):
+        return np.percentile(self.values(), q)
+
+    def __len__(self):
+        return self.permutations
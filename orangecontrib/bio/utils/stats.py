@@ -2,6 +2,9 @@ import math
 import threading
 import six
 
+import numpy
+import scipy.special
+
 
 def _lngamma(z):
     x = 0
@@ -55,6 +58,120 @@ class LogBin(object):
         else:
             return _lngamma(n + 1)
 
+#: Size of the shared log factorial lookup table used by the array
+#: p-value functions. Larger arguments are computed with `gammaln`.
+LOG_FACTORIAL_TABLE_MAX = 2 ** 20
+
+_log_factorial_table = numpy.zeros(2)
+_log_factorial_lock = threading.Lock()
+
+
+def log_factorial(n):
+    """ Return an array of log(n!) for an array of non negative integers `n`.
+    """
+    global _log_factorial_table
+    n = numpy.asarray(n, dtype=int)
+    if n.size == 0:
+        return numpy.zeros(n.shape)
+    nmax = int(n.max())
+    if nmax >= len(_log_factorial_table) and \
+            nmax < LOG_FACTORIAL_TABLE_MAX:
+        with _log_factorial_lock:
+            size = min(max(nmax + 1, 2 * len(_log_factorial_table)),
+                       LOG_FACTORIAL_TABLE_MAX)
+            if size > len(_log_factorial_table):
+                _log_factorial_table = \
+                    scipy.special.gammaln(numpy.arange(size) + 1.0)
+    table = _log_factorial_table
+    if nmax < len(table):
+        return table[n]
+    small = n < len(table)
+    return numpy.where(small, table[numpy.where(small, n, 0)],
+                       scipy.special.gammaln(n + 1.0))
+
+
+def log_binomial(n, k):
+    """ Return an array of log(bin(n, k)) (`-inf` where k < 0 or k > n).
+    """
+    n, k = numpy.broadcast_arrays(numpy.asarray(n, dtype=int),
+                                  numpy.asarray(k, dtype=int))
+    valid = (k >= 0) & (k <= n)
+    n_, k_ = numpy.where(valid, n, 0), numpy.where(valid, k, 0)
+    logbin = log_factorial(n_) - log_factorial(n_ - k_) - log_factorial(k_)
+    return numpy.where(valid, logbin, -numpy.inf)
+
+
+def _log_sum_exp(x, axis=1):
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        xmax = numpy.max(x, axis=axis)
+        finite = numpy.isfinite(xmax)
+        shift = numpy.where(finite, xmax, 0.0)
+        s = numpy.sum(numpy.exp(x - numpy.expand_dims(shift, axis)), axis=axis)
+        return numpy.where(finite, shift + numpy.log(s), -numpy.inf)
+
+
+def _log_range_sum(log_pmf, start, stop, chunk_size=2 ** 20):
+    """ Return an array with log(sum(exp(log_pmf(i, j)) for i in
+    range(start[j], stop[j] + 1))) for all j (`-inf` for empty ranges).
+
+    `log_pmf(i, j)` is called with 2D arrays of values and indices into
+    `start`. The tests are processed in chunks of at most `chunk_size`
+    elements.
+    """
+    width = numpy.maximum(stop - start + 1, 0)
+    result = numpy.full(len(start), -numpy.inf)
+    order = numpy.argsort(width, kind="mergesort")
+    order = order[width[order] > 0]
+    pos = 0
+    while pos < len(order):
+        end = min(pos + max(chunk_size // width[order[pos]], 1), len(order))
+        w = width[order[end - 1]]
+        while end - pos > 1 and (end - pos) * w > chunk_size:
+            end = pos + max(chunk_size // w, 1)
+            w = width[order[end - 1]]
+        j = order[pos:end]
+        i = start[j, numpy.newaxis] + numpy.arange(w)
+        jj = numpy.broadcast_to(j[:, numpy.newaxis], i.shape)
+        valid = i <= stop[j, numpy.newaxis]
+        values = numpy.full(i.shape, -numpy.inf)
+        values[valid] = log_pmf(i[valid], jj[valid])
+        result[j] = _log_sum_exp(values)
+        pos = end
+    return result
+
+
+def _tail_p_values(log_pmf, k, lower, upper):
+    """ Return the upper tail probabilities P(X >= k) of a discrete
+    distribution with support [lower, upper], summing the shorter of
+    the two tails (see :func:`Hypergeometric.p_value`).
+    """
+    upper_len = upper - numpy.maximum(k, lower) + 1
+    lower_len = k - lower
+    use_lower = lower_len < upper_len
+
+    p = numpy.zeros(len(k))
+    if numpy.any(use_lower):
+        idx = numpy.flatnonzero(use_lower)
+        log_p = _log_range_sum(lambda i, j: log_pmf(i, idx[j]),
+                               lower[idx], k[idx] - 1)
+        p[idx] = 1.0 - numpy.exp(log_p)
+        # small values are inexact due to the limited precision of floats
+        use_lower[idx[p[idx] < 1e-3]] = False
+
+    idx = numpy.flatnonzero(~use_lower)
+    if len(idx):
+        log_p = _log_range_sum(lambda i, j: log_pmf(i, idx[j]),
+                               numpy.maximum(k[idx], lower[idx]), upper[idx])
+        p[idx] = numpy.exp(log_p)
+    return numpy.clip(p, 0.0, 1.0)
+
+
+def _int_arrays(*args):
+    arrays = numpy.broadcast_arrays(*[numpy.asarray(a, dtype=int)
+                                      for a in args])
+    return [a.ravel() for a in arrays], arrays[0].shape
+
+
 class Binomial(LogBin):
     """ `Binomial distribution 
     <http://en.wikipedia.org/wiki/Binomial_distribution>`_ is a discrete
@@ -102,6 +219,28 @@ class Binomial(LogBin):
             else:
                 return value
 
+    def p_value_array(self, k, N, m, n):
+        """ Array version of :func:`p_value`. All arguments can be arrays
+        (or scalars) of integers which are broadcast together.
+        """
+        (k, N, m, n), shape = _int_arrays(k, N, m, n)
+        p = m / N.astype(float)
+        log_p = numpy.log(numpy.where(p > 0.0, p, 1.0))
+        log_q = numpy.log(numpy.where(p < 1.0, 1.0 - p, 1.0))
+
+        def log_pmf(i, j):
+            logpmf = log_binomial(n[j], i)
+            logpmf = logpmf + numpy.where(i > 0, i * log_p[j], 0.0)
+            logpmf = logpmf + numpy.where(n[j] - i > 0, (n[j] - i) * log_q[j],
+                                          0.0)
+            # degenerate distributions (p == 0 or p == 1)
+            logpmf[(p[j] == 0.0) & (i > 0)] = -numpy.inf
+            logpmf[(p[j] == 1.0) & (i < n[j])] = -numpy.inf
+            return logpmf
+
+        lower = numpy.zeros_like(n)
+        return _tail_p_values(log_pmf, k, lower, n).reshape(shape)
+
 class Hypergeometric(LogBin):
     """ `Hypergeometric distribution
     <http://en.wikipedia.org/wiki/Hypergeometric_distribution>`_ is
@@ -144,6 +283,21 @@ class Hypergeometric(LogBin):
             else:
                 return value
 
+    def p_value_array(self, k, N, m, n):
+        """ Array version of :func:`p_value`. All arguments can be arrays
+        (or scalars) of integers which are broadcast together.
+        """
+        (k, N, m, n), shape = _int_arrays(k, N, m, n)
+        log_total = log_binomial(N, n)
+
+        def log_pmf(i, j):
+            return (log_binomial(m[j], i) + log_binomial(N[j] - m[j], n[j] - i)
+                    - log_total[j])
+
+        lower = numpy.maximum(0, n + m - N)
+        upper = numpy.minimum(n, m)
+        return _tail_p_values(log_pmf, k, lower, upper).reshape(shape)
+
 ## to speed-up FDR, calculate ahead sum([1/i for i in range(1, m+1)]), for m in [1,100000]. For higher values of m use an approximation, with error less or equal to 4.99999157277e-006. (sum([1/i for i in range(1, m+1)])  ~ log(m) + 0.5772..., 0.5572 is an Euler-Mascheroni constant) 
 c = [1.0]
 for m in range(2, 100000):
@@ -43,30 +43,52 @@ class ExpressionSignificance_TTest_PValue(ExpressionSignificance_TTest):
         return [(key, pval) for key, (t, pval) in \
                 ExpressionSignificance_TTest.__call__(self, *args, **kwargs)]
 
+    @classmethod
+    def batch_statistic(cls, moments):
+        return ExpressionSignificance_TTest.batch_statistic(moments)[1]
+
 
 class ExpressionSignificance_TTest_T(ExpressionSignificance_TTest):
     def __call__(self, *args, **kwargs):
         return [(key, t) for key, (t, pval) in \
                 ExpressionSignificance_TTest.__call__(self, *args, **kwargs)]
 
+    @classmethod
+    def batch_statistic(cls, moments):
+        return ExpressionSignificance_TTest.batch_statistic(moments)[0]
+
 
 class ExpressionSignificance_ANOVA_PValue(ExpressionSignificance_ANOVA):
     def __call__(self, *args, **kwargs):
         return [(key, pval) for key, (t, pval) in \
                 ExpressionSignificance_ANOVA.__call__(self, *args, **kwargs)]
 
+    @classmethod
+    def batch_statistic(cls, moments):
+        return ExpressionSignificance_ANOVA.batch_statistic(moments)[1]
+
 
 class ExpressionSignificance_ANOVA_F(ExpressionSignificance_ANOVA):
     def __call__(self, *args, **kwargs):
         return [(key, f) for key, (f, pval) in \
                 ExpressionSignificance_ANOVA.__call__(self, *args, **kwargs)]
 
+    @classmethod
+    def batch_statistic(cls, moments):
+        return ExpressionSignificance_ANOVA.batch_statistic(moments)[0]
+
 
 class ExpressionSignificance_Log2FoldChange(ExpressionSignificance_FoldChange):
     def __call__(self, *args, **kwargs):
         return [(key, math.log(fold, 2.0) if fold > 1e-300 and fold < 1e300 else 0.0) \
                 for key, fold in ExpressionSignificance_FoldChange.__call__(self, *args, **kwargs)]
 
+    @classmethod
+    def batch_statistic(cls, moments):
+        fold = ExpressionSignificance_FoldChange.batch_statistic(moments)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where((fold > 1e-300) & (fold < 1e300), np.log2(fold), 0.0)
+
 
 class ExpressionSignigicance_MannWhitneyu_U(ExpressionSignificance_MannWhitneyu):
     def __call__(self, *args, **kwargs):
@@ -372,6 +394,9 @@ class OWFeatureSelection(OWWidget):
     def compute_null_distribution(self, data, score_func, use_attributes,
                                   target=None, perm_count=10, advance=lambda: None):
         score_func = score_func(data, use_attributes)
+        if score_func.batch_statistic is not None:
+            dist = score_func.null_distribution_batch(perm_count, target, advance=advance)
+            return [score for score in np.ravel(dist) if not np.isnan(score)]
         dist = score_func.null_distribution(perm_count, target, advance=advance)
         return [score for run in dist for k, score in run if score is not ma.masked]
             
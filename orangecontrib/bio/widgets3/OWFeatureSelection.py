@@ -10,7 +10,6 @@ from types import SimpleNamespace as namespace
 
 import numpy as np
 import scipy.stats
-import scipy.special
 
 from AnyQt.QtGui import QStandardItemModel, QPen
 from AnyQt.QtCore import Qt, QLineF, QSize, QRectF, Signal, Slot
@@ -29,181 +28,12 @@ from Orange.widgets.utils import concurrent
 from orangecontrib.bio.widgets3.utils import gui as guiutils
 from orangecontrib.bio.widgets3.utils import group as grouputils
 from orangecontrib.bio.widgets3.utils.settings import SetContextHandler
-
-
-def score_fold_change(a, b, axis=0):
-    """
-    Calculate the fold change between `a` and `b` samples.
-
-    Parameters
-    ----------
-    a, b : array
-        Arrays containing the samples
-    axis : int
-        Axis over which to compute the FC
-
-    Returns
-    -------
-    FC : array
-        The FC scores
-    """
-    mean_a = np.nanmean(a, axis=axis)
-    mean_b = np.nanmean(b, axis=axis)
-    res = mean_a / mean_b
-    warning = None
-    if np.any(res < 0):
-        res[res < 0] = float("nan")
-        warning = "Negative fold change scores were ignored. You should use another scoring method."
-    return res, warning
-
-
-def score_log_fold_change(a, b, axis=0):
-    """
-    Return the log2(FC).
-
-    See Also
-    --------
-    score_fold_change
-
-    """
-    s, w = score_fold_change(a, b, axis=axis) 
-    return np.log2(s), w
-
-
-def score_ttest(a, b, axis=0):
-    T, P = scipy.stats.ttest_ind(a, b, axis=axis)
-    return T, P
-
-
-def score_ttest_t(a, b, axis=0):
-    T, _ = score_ttest(a, b, axis=axis)
-    return T
-
-
-def score_ttest_p(a, b, axis=0):
-    _, P = score_ttest(a, b, axis=axis)
-    return P
-
-
-def score_anova(*arrays, axis=0):
-    F, P = f_oneway(*arrays, axis=axis)
-    return F, P
-
-
-def score_anova_(*arrays, axis=0):
-    arrays = [np.asarray(arr, dtype=float) for arr in arrays]
-
-    if not len(arrays) > 1:
-        raise TypeError("Need at least 2 positional arguments")
-
-    if not 0 <= axis < 2:
-        raise ValueError("0 <= axis < 2")
-
-    if not all(arrays[i].ndim == arrays[i + 1].ndim
-               for i in range(len(arrays) - 2)):
-        raise ValueError("All arrays must have the same number of dimensions")
-
-    if axis >= arrays[0].ndim:
-        raise ValueError()
-
-    if axis == 0:
-        arrays = [arr.T for arr in arrays]
-
-    scores = [scipy.stats.f_oneway(*ars) for ars in zip(*arrays)]
-    F, P = zip(*scores)
-    return np.array(F, dtype=float), np.array(P, dtype=float)
-
-
-def f_oneway(*arrays, axis=0):
-    """
-    Perform a 1-way ANOVA
-
-    Like `scipy.stats.f_oneway` but accept 2D arrays, with `axis`
-    specifying over which axis to operate (in which axis the samples
-    are stored).
-
-    Parameters
-    ----------
-    A1, A2, ... : array_like
-        The samples for each group.
-    axis : int
-        The axis which contain the samples.
-
-    Returns
-    -------
-    F : array
-        F scores
-    P : array
-        P values
-
-    See also
-    --------
-    scipy.stats.f_oneway
-    """
-    arrays = [np.asarray(a, dtype=float) for a in arrays]
-    alldata = np.concatenate(arrays, axis)
-    bign = alldata.shape[axis]
-    sstot = np.sum(alldata ** 2, axis) - (np.sum(alldata, axis) ** 2) / bign
-
-    ssarrays = [(np.sum(a, axis, keepdims=True) ** 2) / a.shape[axis]
-                for a in arrays]
-    ssbn = np.sum(np.concatenate(ssarrays, axis), axis)
-    ssbn -= (np.sum(alldata, axis) ** 2) / bign
-    assert sstot.shape == ssbn.shape
-
-    sswn = sstot - ssbn
-    dfbn = len(arrays) - 1
-    dfwn = bign - len(arrays)
-    msb = ssbn / dfbn
-    msw = sswn / dfwn
-    f = msb / msw
-    prob = scipy.special.fdtrc(dfbn, dfwn, f)
-    return f, prob
-
-
-def score_anova_f(*arrays, axis=0):
-    F, _ = score_anova(*arrays, axis=axis)
-    return F
-
-
-def score_anova_p(*arrays, axis=0):
-    _, P = score_anova(*arrays, axis=axis)
-    return P
-
-
-def score_signal_to_noise(a, b, axis=0):
-    mean_a = np.nanmean(a, axis=axis)
-    mean_b = np.nanmean(b, axis=axis)
-
-    std_a = np.nanstd(a, axis=axis, ddof=1)
-    std_b = np.nanstd(b, axis=axis, ddof=1)
-
-    return (mean_a - mean_b) / (std_a + std_b)
-
-
-def score_mann_whitney(a, b, axis=0):
-    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
-
-    if not 0 <= axis < 2:
-        raise ValueError("Axis")
-
-    if a.ndim != b.ndim:
-        raise ValueError
-
-    if axis >= a.ndim:
-        raise ValueError
-
-    if axis == 0:
-        a, b = a.T, b.T
-
-    res = [scipy.stats.mannwhitneyu(a_, b_) for a_, b_ in zip(a, b)]
-    U, P = zip(*res)
-    return np.array(U), np.array(P)
-
-
-def score_mann_whitney_u(a, b, axis=0):
-    U, _ = score_mann_whitney(a, b, axis=axis)
-    return U
+from orangecontrib.bio.utils import scoring
+from orangecontrib.bio.utils.scoring import (
+    score_fold_change, score_log_fold_change, score_ttest, score_ttest_t,
+    score_ttest_p, score_anova, score_anova_f, score_anova_p, f_oneway,
+    score_signal_to_noise, score_mann_whitney, score_mann_whitney_u
+)
 
 
 class InfiniteLine(pg.InfiniteLine):
@@ -441,6 +271,15 @@ class Histogram(pg.PlotWidget):
         self.setLower(self.__cutlow.value())
 
 
+def score_histogram(scores):
+    """
+    Return the histogram (counts and bin edges) of finite scores.
+    """
+    validscores = scores[np.isfinite(scores)]
+    nbins = int(max(np.ceil(np.sqrt(len(validscores))), 20))
+    return np.histogram(validscores, bins=nbins)
+
+
 def histogram_cut(hist, bins, low, high):
     """
     Return a subset of a histogram between low and high values.
@@ -595,6 +434,8 @@ class OWFeatureSelection(widget.OWWidget):
         self.nulldist = None
 
         self.__scores_future = self.__scores_state = None
+        self.__partial_state = None
+        self.__plot_histogram = self.__null_item = None
 
         self.__in_progress = False
 
@@ -660,7 +501,7 @@ class OWFeatureSelection(widget.OWWidget):
             callback=self.update_scores)
 
         perm_spin = gui.spin(
-            box, self, "permutations_count", minv=1, maxv=50,
+            box, self, "permutations_count", minv=1, maxv=10000,
             label="Permutations:", callback=self.update_scores,
             callbackOnReturn=True)
 
@@ -722,6 +563,7 @@ class OWFeatureSelection(widget.OWWidget):
         """Clear the histogram plot.
         """
         self.histogram.clear()
+        self.__plot_histogram = self.__null_item = None
 
     def initialize(self, data):
         """Initialize widget state from the data."""
@@ -821,16 +663,6 @@ class OWFeatureSelection(widget.OWWidget):
             ss = score_func(*arrays, axis=0)
             return ss[0] if isinstance(ss, tuple) and not warn else ss
 
-        def permute_indices(group_indices, random_state=None):
-            assert all(ind.dtype.kind == "i" for ind in group_indices)
-            assert all(ind.ndim == 1 for ind in group_indices)
-            if random_state is None:
-                random_state = np.random
-            joined = np.hstack(group_indices)
-            random_state.shuffle(joined)
-            split_ind = np.cumsum([len(ind) for ind in group_indices])
-            return np.split(joined, split_ind[:-1])
-
         if isinstance(grp, grouputils.RowGroup):
             axis = 0
         else:
@@ -864,7 +696,8 @@ class OWFeatureSelection(widget.OWWidget):
         # raise warning otherwise.
 
         def compute_scores_with_perm(X, indices, nperm=0, rstate=None,
-                                     progress_advance=None):
+                                     progress_advance=None,
+                                     partial_results=None):
             warning = None
             scores = compute_scores(X, indices, warn=True)
             if isinstance(scores, tuple):
@@ -872,32 +705,40 @@ class OWFeatureSelection(widget.OWWidget):
 
             if progress_advance is not None:
                 progress_advance()
-            null_scores = []
+            nulldist = None
             if nperm > 0:
                 if rstate is None:
                     rstate = np.random.RandomState(0)
 
-                for i in range(nperm):
-                    p_indices = permute_indices(indices, rstate)
-                    assert all(pind.shape == ind.shape
-                               for pind, ind in zip(indices, p_indices))
-                    pscore = compute_scores(X, p_indices)
-                    assert pscore.shape == scores.shape
-                    null_scores.append(pscore)
+                nulldist = scoring.NullDistribution()
+                _, edges = score_histogram(scores)
+                # Permutations are scored in batches; the null histogram
+                # is reported after each one
+                for pscores in scoring.null_scores(
+                        X, indices, score_func, nperm, rstate):
+                    assert pscores.shape[1:] == scores.shape
+                    nulldist.add(pscores)
+                    if partial_results is not None:
+                        partial_results(scores, nulldist.histogram(edges))
                     if progress_advance is not None:
-                        progress_advance()
+                        progress_advance(len(pscores))
 
-            return scores, null_scores, warning
+            return scores, nulldist, warning
 
         p_advance = concurrent.methodinvoke(
             self, "progressBarAdvance", (float,))
+        p_results = concurrent.methodinvoke(
+            self, "__set_partial_results", (object,))
         state = namespace(cancelled=False, advance=p_advance)
 
-        def progress():
+        def progress(count=1):
             if state.cancelled:
                 raise concurrent.CancelledError
             else:
-                state.advance(100 / (nperm + 1))
+                state.advance(100 * count / (nperm + 1))
+
+        def partial_results(scores, nullfreq):
+            p_results((state, scores, nullfreq))
 
         self.progressBarInit()
         set_scores = concurrent.methodinvoke(
@@ -907,7 +748,7 @@ class OWFeatureSelection(widget.OWWidget):
         self.__scores_state = state
         self.__scores_future = self._executor.submit(
                 compute_scores_with_perm, X, indices, nperm,
-                progress_advance=progress)
+                progress_advance=progress, partial_results=partial_results)
         self.__scores_future.add_done_callback(set_scores)
 
     @Slot(float)
@@ -923,6 +764,18 @@ class OWFeatureSelection(widget.OWWidget):
             finally:
                 self.__in_progress = False
 
+    @Slot(object)
+    def __set_partial_results(self, results):
+        # show the null distribution of the permutations scored so far
+        state, scores, nullfreq = results
+        if state is not self.__scores_state or state.cancelled:
+            return
+        if self.__partial_state is not state:
+            self.__partial_state = state
+            self.clear_plot()
+            self.setup_plot(self.score_index, scores)
+        self.set_null_histogram(nullfreq)
+
     @Slot(concurrent.Future)
     def __set_score_results(self, scores):
         # set score results from a Future
@@ -950,17 +803,13 @@ class OWFeatureSelection(widget.OWWidget):
             self.__scores_state.cancelled = True
             self.__scores_state = self.__scores_future = None
 
-    def set_scores(self, scores, null_scores=None, warning=None):
+    def set_scores(self, scores, nulldist=None, warning=None):
         self.scores = scores
-        self.nulldist = null_scores
-
-        if null_scores:
-            nulldist = np.array(null_scores, dtype=float)
-        else:
-            nulldist = None
+        self.nulldist = nulldist
 
         self.warning(10, warning)
 
+        self.clear_plot()
         self.setup_plot(self.score_index, scores, nulldist)
         self.update_data_info_label()
         self.update_selected_info_label()
@@ -976,36 +825,22 @@ class OWFeatureSelection(widget.OWWidget):
             Score index (into OWFeatureSelection.Scores)
         scores : (N, ) array
             The scores obtained
-        nulldist (P, N) array optional
-            The scores obtained under P permutations of labels.
+        nulldist : scoring.NullDistribution optional
+            The scores obtained under label permutations.
         """
         score_name, side, test_type, _ = self.Scores[scoreindex]
         low, high = self.thresholds.get(score_name, (-np.inf, np.inf))
 
-        validmask = np.isfinite(scores)
-        validscores = scores[validmask]
-
-        nbins = int(max(np.ceil(np.sqrt(len(validscores))), 20))
-        freq, edges = np.histogram(validscores, bins=nbins)
+        freq, edges = score_histogram(scores)
         self.histogram.setHistogramCurve(
             pg.PlotCurveItem(x=edges, y=freq, stepMode=True,
                              pen=pg.mkPen("b", width=2))
         )
+        self.__plot_histogram = (freq, edges)
 
         if nulldist is not None:
-            nulldist = nulldist.ravel()
-            validmask = np.isfinite(nulldist)
-            validnulldist = nulldist[validmask]
-            nullbins = edges  # XXX: extend to the full range of nulldist
-            nullfreq, _ = np.histogram(validnulldist, bins=nullbins)
-            nullfreq = nullfreq * (freq.sum() / nullfreq.sum())
-            nullitem = pg.PlotCurveItem(
-                x=nullbins, y=nullfreq, stepMode=True,
-                pen=pg.mkPen((50, 50, 50, 100))
-            )
-            # Ensure it stacks behind the main curve
-            nullitem.setZValue(nullitem.zValue() - 10)
-            self.histogram.addItem(nullitem)
+            # XXX: extend to the full range of nulldist
+            self.set_null_histogram(nulldist.histogram(edges))
 
         # Restore saved thresholds
         eps = np.finfo(float).eps
@@ -1052,9 +887,36 @@ class OWFeatureSelection(widget.OWWidget):
             labelitem.setPos(x2, y2)
             self.histogram.addItem(labelitem)
 
+        self.__update_plot_range()
+
+    def set_null_histogram(self, nullfreq):
+        """
+        Show the null score distribution (counts in the score histogram
+        bins) behind the score histogram.
+        """
+        freq, edges = self.__plot_histogram
+        total = nullfreq.sum()
+        if total > 0:
+            nullfreq = nullfreq * (freq.sum() / total)
+        if self.__null_item is None:
+            self.__null_item = pg.PlotCurveItem(
+                x=edges, y=nullfreq, stepMode=True,
+                pen=pg.mkPen((50, 50, 50, 100))
+            )
+            # Ensure it stacks behind the main curve
+            self.__null_item.setZValue(self.__null_item.zValue() - 10)
+            self.histogram.addItem(self.__null_item)
+        else:
+            self.__null_item.setData(x=edges, y=nullfreq, stepMode=True)
+        self.__update_plot_range()
+
+    def __update_plot_range(self):
+        freq, edges = self.__plot_histogram
+        eps = np.finfo(float).eps
+        minx, maxx = edges[0] - eps, edges[-1] + eps
         miny, maxy = 0.0, np.max(freq)
-        if nulldist is not None:
-            maxy = max(np.max(nullfreq), maxy)
+        if self.__null_item is not None:
+            maxy = max(np.max(self.__null_item.yData), maxy)
 
         if not np.any(np.isnan([maxx, minx, maxy])):
             self.histogram.setRange(
@@ -1162,13 +1024,11 @@ class OWFeatureSelection(widget.OWWidget):
         self._invalidate_selection()
 
     def select_p_best(self):
-        if not self.nulldist:
+        if not self.nulldist or not len(self.nulldist.values()):
             return
 
         _, side, _, _ = self.Scores[self.score_index]
-        nulldist = np.asarray(self.nulldist).ravel()
-        nulldist = nulldist[np.isfinite(nulldist)]
-        nulldist = np.sort(nulldist)
+        nulldist = self.nulldist.values()
 
         assert 0 <= self.alpha_value <= 1
         p = self.alpha_value
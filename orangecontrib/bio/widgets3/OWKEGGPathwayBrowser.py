@@ -858,17 +858,20 @@ def pathway_enrichment(genesets, genes, reference, prob=None, callback=None):
     for i, gs in enumerate(genesets):
         cluster = gs.genes.intersection(genes)
         ref = gs.genes.intersection(reference)
-        k = len(cluster)
-        N = len(reference)
-        m = len(ref)
-        n = len(genes)
-        if k:
-            p_val = prob.p_value(k, N, m, n)
+        if cluster:
             result_sets.append((gs.id, cluster, ref))
-            p_values.append(p_val)
         if callback is not None:
             callback(100.0 * i / len(genesets))
 
+    if result_sets:
+        k = [len(cluster) for _, cluster, _ in result_sets]
+        m = [len(ref) for _, _, ref in result_sets]
+        N, n = len(reference), len(genes)
+        if hasattr(prob, "p_value_array"):
+            p_values = list(prob.p_value_array(k, N, m, n))
+        else:
+            p_values = [prob.p_value(k_, N, m_, n) for k_, m_ in zip(k, m)]
+
     # FDR correction
     p_values = stats.FDR(p_values)
 
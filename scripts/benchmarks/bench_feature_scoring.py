@@ -0,0 +1,77 @@
+"""
+Time permutation null distributions of the gene scores used by the
+Differential Expression widget (utils.scoring) on a synthetic
+expression matrix: the former loop, which shuffles the group indices and
+calls the score function once per permutation, and null_scores.
+
+    python scripts/benchmarks/bench_feature_scoring.py --genes 20000 \
+        --permutations 1000
+
+"""
+import argparse
+import time
+
+import numpy as np
+
+from orangecontrib.bio.utils import scoring
+
+
+def reference_null(X, group_indices, score_func, count, random_state):
+    """ The former compute_scores_with_perm loop. """
+    null = []
+    for _ in range(count):
+        joined = np.hstack(group_indices)
+        random_state.shuffle(joined)
+        splits = np.split(joined, np.cumsum(
+            [len(ind) for ind in group_indices])[:-1])
+        scores = score_func(*[X[ind] for ind in splits], axis=0)
+        null.append(scores[0] if isinstance(scores, tuple) else scores)
+    return np.array(null, dtype=float)
+
+
+def timed(func, *args, **kwargs):
+    t = time.time()
+    res = func(*args, **kwargs)
+    return time.time() - t, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=60)
+    parser.add_argument("--genes", type=int, default=20000)
+    parser.add_argument("--permutations", type=int, default=1000)
+    parser.add_argument("--reference-permutations", type=int, default=20,
+                        help="permutations for the former loop")
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    X = rng.randn(args.samples, args.genes) + 5
+    X[rng.rand(*X.shape) < 0.02] = np.nan
+    third = args.samples // 3
+    two = [np.arange(0, args.samples, 2), np.arange(1, args.samples, 2)]
+    three = [np.arange(0, third), np.arange(third, 2 * third),
+             np.arange(2 * third, args.samples)]
+
+    for score_func, groups in [(scoring.score_fold_change, two),
+                               (scoring.score_ttest_t, two),
+                               (scoring.score_signal_to_noise, two),
+                               (scoring.score_anova_f, three)]:
+        t_ref, ref = timed(reference_null, X, groups, score_func,
+                           args.reference_permutations,
+                           np.random.RandomState(1))
+        t_batch, null = timed(
+            lambda: np.vstack(list(scoring.null_scores(
+                X, groups, score_func, args.permutations,
+                np.random.RandomState(1), n_jobs=args.jobs))))
+        n = args.reference_permutations
+        with np.errstate(invalid="ignore"):
+            diff = np.nanmax(np.abs(null[:n] - ref) / (1 + np.abs(ref)))
+        print("%s (%i genes, %i permutations): former ~%.1fs, batch %.2fs, "
+              "max rel. difference %.1e" %
+              (score_func.__name__, args.genes, args.permutations,
+               t_ref * args.permutations / float(n), t_batch, diff))
+
+
+if __name__ == "__main__":
+    main()
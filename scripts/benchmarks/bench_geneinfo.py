@@ -0,0 +1,105 @@
+"""
+Time and measure the memory of loading a gene_info file (a synthetic one
+the size of the human gene_info file, or --filename) into the former
+dictionary of lines used by gene.NCBIGeneInfo and into gene.GeneInfoTable
+(building the index, and loading it from the cache), and of looking up
+random genes.
+
+    python scripts/benchmarks/bench_geneinfo.py --genes 190000
+
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from orangecontrib.bio import gene
+
+
+def write_gene_info(filename, genes, seed=0):
+    rng = random.Random(seed)
+    words = ["alpha", "protein", "kinase", "receptor", "family", "member",
+             "subunit", "binding", "domain", "containing"]
+
+    def text(n):
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    with open(filename, "w") as f:
+        f.write("#tax_id\tGeneID\tSymbol\t...\n")
+        for i in range(genes):
+            symbol = "G%i" % i
+            fields = ["9606", str(100000 + i), symbol, "-",
+                      "|".join("%s_%i" % (symbol, j)
+                               for j in range(rng.randint(0, 4))) or "-",
+                      "MIM:%i|HGNC:HGNC:%i|Ensembl:ENSG%011i" % (i, i, i),
+                      str(rng.randint(1, 22)), "%ip%i" % (i % 22, i % 40),
+                      text(5), "protein-coding", symbol, text(5), "O",
+                      "|".join(text(4) for _ in range(rng.randint(0, 5))),
+                      "20160110"]
+            f.write("\t".join(fields) + "\n")
+
+
+def reference_load(filename):
+    """ The former NCBIGeneInfo loader. """
+    with open(filename, "rt") as f:
+        return dict([(line.split("\t", 3)[1], line)
+                     for line in f.read().splitlines()
+                     if line.strip() and not line.startswith("#")])
+
+
+def measured(func, *args):
+    tracemalloc.start()
+    t = time.time()
+    res = func(*args)
+    t = time.time() - t
+    memory = tracemalloc.get_traced_memory()[0] / 2.0 ** 20
+    tracemalloc.stop()
+    return t, memory, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--genes", type=int, default=190000)
+    parser.add_argument("--filename", help="an existing gene_info file")
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(path, "gene_info.db")
+        if args.filename:
+            shutil.copy(args.filename, filename)
+        else:
+            write_gene_info(filename, args.genes)
+        size = os.path.getsize(filename) / 2.0 ** 20
+
+        t_ref, m_ref, ref = measured(reference_load, filename)
+        t_build, m_build, _ = measured(gene.GeneInfoTable, filename)
+        t_load, m_load, table = measured(gene.GeneInfoTable, filename)
+        print("%i genes, %.1f MB" % (len(ref), size))
+        print("load:  dict %.2fs %.1f MB | table build %.2fs %.1f MB, "
+              "cached %.3fs %.1f MB" %
+              (t_ref, m_ref, t_build, m_build, t_load, m_load))
+
+        ids = random.Random(0).sample(sorted(ref), min(args.lookups,
+                                                       len(ref)))
+        t = time.time()
+        expected = [gene.GeneInfo(ref[id]) for id in ids]
+        t_ref = time.time() - t
+        t = time.time()
+        found = [gene.GeneInfo(table[id]) for id in ids]
+        t_table = time.time() - t
+        assert [repr(g) for g in found] == [repr(g) for g in expected]
+        print("%i lookups: dict %.3fs | table %.3fs" %
+              (len(ids), t_ref, t_table))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
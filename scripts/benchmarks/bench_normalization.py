@@ -0,0 +1,129 @@
+"""
+Compare the MA-plot normalization functions in utils.expression with
+the former implementations (all pairs lowess, lowess2 on histogram
+edges, a Python loop over local windows for the z-scores) on synthetic
+two channel arrays: the differences on a small array and the time of
+the new functions on a whole array.
+
+    python scripts/benchmarks/bench_normalization.py --small 2000 --spots 40000
+
+"""
+from __future__ import print_function
+
+import argparse
+import math
+import time
+
+import numpy
+
+from orangecontrib.bio.utils import expression
+
+
+def two_channels(spots, seed=0):
+    rng = numpy.random.RandomState(seed)
+    A = rng.uniform(1, 5, size=spots)
+    M = 0.5 * numpy.sin(A) + 0.3 * (A - 3) + rng.normal(0, 0.3, size=spots)
+    M[rng.rand(spots) < 0.01] += 3  # a few outliers
+    # A = log10(R * G), M = log2(R / G)
+    G = numpy.sqrt(10 ** A / 2 ** M)
+    R = G * 2 ** M
+    G = numpy.ma.masked_array(G, mask=rng.rand(spots) < 0.02)
+    return G, numpy.ma.masked_array(R)
+
+
+def reference_center_lowess_fast(G, R, f=2./3., iter=1, resolution=100):
+    """ The former expression.MA_center_lowess_fast. """
+    ratio, intensity = expression.ratio_intensity(G, R)
+    valid = ~ (ratio.mask & intensity.mask)
+    resolution = min(resolution, len(intensity[valid]))
+    hist, edges = numpy.histogram(intensity[valid],
+                                  len(intensity[valid]) // resolution)
+    centered = expression.lowess2(intensity[valid], ratio[valid], edges,
+                                  f, iter)
+    centered = expression.lowess2(edges, centered, intensity[valid], f, iter)
+    Gc, R = G.copy(), R.copy()
+    Gc[valid] *= numpy.exp2(centered)
+    return Gc, R
+
+
+def reference_zscore(G, R, window=1./5.):
+    """ The former expression.MA_zscore (not padded). """
+    ratio, intensity = expression.ratio_intensity(G, R)
+    z_scores = numpy.ma.zeros(G.shape)
+    order = list(numpy.ma.argsort(intensity))
+    r = int(math.ceil(len(order) * window))
+    for i in range(len(order)):
+        start, end = max(i - r // 2, 0), i + r // 2 + r % 2
+        local_std = numpy.ma.std(numpy.take(ratio, order[start:end]))
+        z_scores[order[i]] = ratio[order[i]] / local_std
+    return z_scores
+
+
+def timed(func, *args, **kwargs):
+    t = time.time()
+    res = func(*args, **kwargs)
+    return time.time() - t, res
+
+
+def difference(a, b):
+    a, b = numpy.ma.asarray(a), numpy.ma.asarray(b)
+    mask = numpy.ma.getmaskarray(a) | numpy.ma.getmaskarray(b)
+    return numpy.max(numpy.abs(a.data[~mask] - b.data[~mask]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--small", type=int, default=2000,
+                        help="spots for the comparison with the former "
+                             "(quadratic memory) functions")
+    parser.add_argument("--spots", type=int, default=40000)
+    args = parser.parse_args()
+
+    G, R = two_channels(args.small)
+    ratio, intensity = expression.ratio_intensity(G, R)
+    x, y = intensity.data, ratio.data
+    for iter in [1, 3]:
+        t_ref, ref = timed(expression.lowess, x, y, iter=iter)
+        t_new, new = timed(expression.lowess_windowed, x, y, iter=iter)
+        print("lowess (%i spots, iter=%i): former %.2fs, windowed %.2fs, "
+              "max abs. difference %.1e" %
+              (args.small, iter, t_ref, t_new, difference(ref, new)))
+
+    def exact_center(G, R):
+        # MA_center_lowess with the all pairs lowess
+        ratio, intensity = expression.ratio_intensity(G, R)
+        valid = ~ (ratio.mask & intensity.mask)
+        est = expression.lowess(intensity[valid].data, ratio[valid].data,
+                                iter=1)
+        Gc = G.copy()
+        Gc[valid] *= numpy.exp2(est)
+        return Gc, R
+
+    cases = [("MA_center_lowess", exact_center,
+              expression.MA_center_lowess),
+             ("MA_center_lowess_fast", reference_center_lowess_fast,
+              expression.MA_center_lowess_fast),
+             ("MA_center_lowess_fast vs. exact", exact_center,
+              expression.MA_center_lowess_fast),
+             ("MA_zscore", reference_zscore, expression.MA_zscore)]
+    for name, reference, func in cases:
+        t_ref, ref = timed(reference, G, R)
+        t_new, new = timed(func, G, R)
+        if isinstance(ref, tuple):
+            # compare the log2 centering factors
+            ref, new = numpy.ma.log2(ref[0] / G), numpy.ma.log2(new[0] / G)
+        print("%s (%i spots): former %.2fs, new %.3fs, max abs. difference "
+              "%.1e" % (name, args.small, t_ref, t_new,
+                        difference(ref, new)))
+
+    G, R = two_channels(args.spots)
+    for name, func in [("MA_center_lowess", expression.MA_center_lowess),
+                       ("MA_center_lowess_fast",
+                        expression.MA_center_lowess_fast),
+                       ("MA_zscore", expression.MA_zscore)]:
+        t, _ = timed(func, G, R)
+        print("%s (%i spots): %.2fs" % (name, args.spots, t))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Time permutation null distributions of utils.expression significance
+tests on a synthetic expression matrix: the former null_distribution,
+which shuffles the classes and calls the test once per permutation, and
+null_distribution_batch.
+
+    python scripts/benchmarks/bench_null_distribution.py --genes 20000 \
+        --permutations 1000
+
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy
+import numpy.ma as ma
+
+from orangecontrib.bio.utils import expression
+
+
+def expression_test(cls, samples, genes, seed=0):
+    """ A significance test on a random matrix, without an Orange table. """
+    rng = numpy.random.RandomState(seed)
+    test = object.__new__(cls)
+    test.array = ma.masked_array(rng.randn(samples, genes) + 5,
+                                 mask=rng.rand(samples, genes) < 0.02)
+    test.classes = numpy.array(["a", "b"] * (samples // 2) +
+                               ["b"] * (samples % 2))
+    test.useAttributeLabels, test.dim = False, 0
+    test.keys = list(range(genes))
+    return test
+
+
+def timed(func, *args, **kwargs):
+    t = time.time()
+    res = func(*args, **kwargs)
+    return time.time() - t, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=60)
+    parser.add_argument("--genes", type=int, default=20000)
+    parser.add_argument("--permutations", type=int, default=1000)
+    parser.add_argument("--reference-permutations", type=int, default=20,
+                        help="permutations for the former null_distribution")
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args()
+
+    for cls in [expression.ExpressionSignificance_FoldChange,
+                expression.ExpressionSignificance_SignalToNoise,
+                expression.ExpressionSignificance_TTest]:
+        test = expression_test(cls, args.samples, args.genes)
+        t_batch, _ = timed(test.null_distribution_batch, args.permutations,
+                           {"a"}, n_jobs=args.jobs)
+        if cls is expression.ExpressionSignificance_TTest:
+            # __call__ needs scipy.stats.betai (removed from scipy)
+            former = "n/a"
+        else:
+            t_ref, _ = timed(test.null_distribution,
+                             args.reference_permutations, {"a"})
+            former = "~%.1fs" % (t_ref * args.permutations /
+                                 float(args.reference_permutations))
+        print("%s (%i genes, %i permutations): former %s, batch %.2fs" %
+              (cls.__name__, args.genes, args.permutations, former, t_batch))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Time loading of synthetic OBO files the size of GO, MeSH and ChEBI with
+ontology.OBOOntology: line tokenization with the reference and the fast
+tag value parser, a full parse, and a load from the binary snapshot.
+
+    python scripts/benchmarks/bench_ontology.py --scale 0.2
+
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from orangecontrib.bio import ontology
+
+#: (name, number of terms, synonyms per term, xrefs per term)
+SIZES = [("GO", 47000, 2, 2),
+         ("MeSH", 28000, 6, 1),
+         ("ChEBI", 130000, 5, 4)]
+
+
+def write_obo(filename, prefix, terms, synonyms, xrefs, seed=0):
+    rng = random.Random(seed)
+    words = ["alpha", "beta", "kinase", "binding", "process", "activity",
+             "regulation", "membrane", "complex", "transport"]
+
+    def text(n):
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    with open(filename, "w") as f:
+        f.write("format-version: 1.2\nontology: %s\n" % prefix.lower())
+        for i in range(terms):
+            f.write("\n[Term]\nid: %s:%07i\nname: %s\n" % (prefix, i, text(3)))
+            f.write("namespace: %s\n" % rng.choice(words))
+            f.write('def: "%s." [PMID:%i, %s:curators]\n' %
+                    (text(12), rng.randint(1, 10 ** 7), prefix))
+            for _ in range(rng.randint(0, 2 * synonyms)):
+                f.write('synonym: "%s" %s [] {source="x"}\n' %
+                        (text(3), rng.choice(["EXACT", "RELATED"])))
+            for _ in range(rng.randint(0, 2 * xrefs)):
+                f.write("xref: DB:%i\n" % rng.randint(1, 10 ** 6))
+            for _ in range(rng.randint(1, 2) if i else 0):
+                parent = rng.randrange(i)
+                f.write("is_a: %s:%07i ! %s\n" % (prefix, parent, text(3)))
+            if i > 1 and rng.random() < 0.2:
+                f.write("relationship: part_of %s:%07i ! %s\n" %
+                        (prefix, rng.randrange(i), text(2)))
+
+
+def timed(func, *args, **kwargs):
+    t = time.time()
+    res = func(*args, **kwargs)
+    return time.time() - t, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="fraction of the full ontology sizes")
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    try:
+        for name, terms, synonyms, xrefs in SIZES:
+            filename = os.path.join(path, name + ".obo")
+            write_obo(filename, name.upper(), int(terms * args.scale),
+                      synonyms, xrefs)
+            with open(filename) as f:
+                lines = [line.rstrip("\n") for line in f
+                         if ":" in line and not line.startswith("[")]
+
+            t_ref, ref = timed(
+                lambda: [ontology.parse_tag_value(l) for l in lines])
+            t_fast, fast = timed(
+                lambda: [ontology._parse_tag_value_fast(l) for l in lines])
+            assert ref == fast
+
+            t_parse, parsed = timed(ontology.OBOOntology)
+            t_parse, parsed = timed(parsed.load, filename, snapshot=False)
+            t_save, _ = timed(ontology.OBOOntology, filename)
+            t_snap, _ = timed(ontology.OBOOntology, filename)
+            size = os.path.getsize(filename) / 2.0 ** 20
+
+            print("%-6s %7i terms %6.1f MB | tokenize: reference %6.2fs "
+                  "fast %6.2fs (%4.1fx) | load: parse %6.2fs, "
+                  "parse + snapshot %6.2fs, snapshot %6.2fs (%4.1fx)" %
+                  (name, int(terms * args.scale), size, t_ref, t_fast,
+                   t_ref / t_fast, t_parse, t_save, t_snap,
+                   t_parse / t_snap))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
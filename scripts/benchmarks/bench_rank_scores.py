@@ -0,0 +1,128 @@
+"""
+Time the Mann-Whitney and one-way ANOVA gene scores on a synthetic
+expression matrix: the former functions of the Differential Expression
+widget (scipy.stats.mannwhitneyu and scipy.stats.f_oneway column by
+column, and the former whole matrix f_oneway, which does not allow
+unknown values) against expression.mann_whitney_columns and
+expression.f_oneway_columns, and a Mann-Whitney permutation null
+(scored once per permutation, and from rank sums in batches).
+
+    python scripts/benchmarks/bench_rank_scores.py --genes 50000 \
+        --samples 200
+
+"""
+import argparse
+import time
+
+import numpy as np
+import scipy.special
+import scipy.stats
+
+from orangecontrib.bio.utils import expression
+from orangecontrib.bio.utils import scoring
+
+
+def reference_mann_whitney(a, b):
+    """ The former score_mann_whitney (axis=0). """
+    res = [scipy.stats.mannwhitneyu(a_, b_) for a_, b_ in zip(a.T, b.T)]
+    U, P = zip(*res)
+    return np.array(U), np.array(P)
+
+
+def reference_f_oneway_columns(*arrays):
+    """ The former score_anova_ (axis=0). """
+    scores = [scipy.stats.f_oneway(*ars)
+              for ars in zip(*[a.T for a in arrays])]
+    F, P = zip(*scores)
+    return np.array(F, dtype=float), np.array(P, dtype=float)
+
+
+def reference_f_oneway(*arrays):
+    """ The former f_oneway (axis=0). """
+    alldata = np.concatenate(arrays, 0)
+    bign = alldata.shape[0]
+    sstot = np.sum(alldata ** 2, 0) - (np.sum(alldata, 0) ** 2) / bign
+    ssbn = np.sum([np.sum(a, 0) ** 2 / a.shape[0] for a in arrays], 0)
+    ssbn -= (np.sum(alldata, 0) ** 2) / bign
+    dfbn = len(arrays) - 1
+    dfwn = bign - len(arrays)
+    f = (ssbn / dfbn) / ((sstot - ssbn) / dfwn)
+    return f, scipy.special.fdtrc(dfbn, dfwn, f)
+
+
+def timed(func, *args, **kwargs):
+    t = time.time()
+    res = func(*args, **kwargs)
+    return time.time() - t, res
+
+
+def difference(ref, new):
+    ref, new = np.asarray(ref), np.asarray(new)
+    return np.max(np.abs(ref - new) / (1 + np.abs(ref)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--genes", type=int, default=50000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--groups", type=int, default=3)
+    parser.add_argument("--reference-genes", type=int, default=5000,
+                        help="genes for the former column by column scores")
+    parser.add_argument("--permutations", type=int, default=100)
+    parser.add_argument("--reference-permutations", type=int, default=2)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    # rounded, so there are ties
+    X = np.round(rng.randn(args.samples, args.genes) + 5, 2)
+    y = np.arange(args.samples) % args.groups
+    groups = [X[y == g] for g in range(args.groups)]
+    scale = args.genes / float(args.reference_genes)
+    sub = [g[:, :args.reference_genes] for g in groups]
+
+    t_ref, (U_ref, P_ref) = timed(reference_mann_whitney, *sub[:2])
+    t_new, (U, P) = timed(expression.mann_whitney_columns, X, y)
+    print("Mann-Whitney (%i x %i): former ~%.1fs, mann_whitney_columns "
+          "%.2fs, max rel. difference U %.1e, p %.1e" %
+          (args.genes, args.samples, t_ref * scale, t_new,
+           difference(U_ref, U[:args.reference_genes]),
+           difference(P_ref, P[:args.reference_genes])))
+
+    t_ref, (F_ref, P_ref) = timed(reference_f_oneway_columns, *sub)
+    t_mat, _ = timed(reference_f_oneway, *groups)
+    t_new, (F, P) = timed(expression.f_oneway_columns, X, y)
+    print("ANOVA (%i x %i, %i groups): former column by column ~%.1fs, "
+          "former f_oneway %.2fs, f_oneway_columns %.2fs, max rel. "
+          "difference F %.1e, p %.1e" %
+          (args.genes, args.samples, args.groups, t_ref * scale, t_mat,
+           t_new,
+           difference(F_ref, F[:args.reference_genes]),
+           difference(P_ref, P[:args.reference_genes])))
+
+    X[rng.rand(*X.shape) < 0.02] = np.nan
+    indices = [np.flatnonzero(y == 0), np.flatnonzero(y == 1)]
+    t_new, (U, _) = timed(expression.mann_whitney_columns, X, y)
+    print("Mann-Whitney with 2%% unknown values: %.2fs, %i undefined "
+          "scores" % (t_new, np.isnan(U).sum()))
+
+    def reference_null(count, random_state):
+        # the former loop: score_mann_whitney once per permutation
+        for _ in range(count):
+            joined = np.hstack(indices)
+            random_state.shuffle(joined)
+            a, b = np.split(joined, [len(indices[0])])
+            reference_mann_whitney(X[a, :args.reference_genes],
+                                   X[b, :args.reference_genes])
+
+    t_ref, _ = timed(reference_null, args.reference_permutations,
+                     np.random.RandomState(1))
+    t_new, _ = timed(lambda: list(scoring.null_scores(
+        X, indices, scoring.score_mann_whitney_u, args.permutations,
+        np.random.RandomState(1))))
+    print("Mann-Whitney null (%i permutations): former ~%.1fs, rank sums "
+          "%.2fs" % (args.permutations, t_ref * scale * args.permutations /
+                     float(args.reference_permutations), t_new))
+
+
+if __name__ == "__main__":
+    main()
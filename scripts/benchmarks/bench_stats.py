@@ -0,0 +1,55 @@
+"""
+Compare the scalar and the array p-value functions in utils.stats on
+human scale enrichment tests (N ~ 20000 genes).
+
+    python scripts/benchmarks/bench_stats.py --tests 20000
+
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy
+
+from orangecontrib.bio.utils import stats
+
+
+def random_tests(count, N, max_n, seed=0):
+    rng = numpy.random.RandomState(seed)
+    n = rng.randint(1, max_n + 1, size=count)
+    m = rng.randint(1, N // 10, size=count)
+    k = rng.binomial(numpy.minimum(n, m), 0.5)
+    return k, N, m, n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tests", type=int, default=20000)
+    parser.add_argument("--N", type=int, default=20000)
+    parser.add_argument("--max-n", type=int, default=500)
+    parser.add_argument("--scalar-tests", type=int, default=2000,
+                        help="number of tests to time with the scalar path")
+    args = parser.parse_args()
+
+    k, N, m, n = random_tests(args.tests, args.N, args.max_n)
+    ns = args.scalar_tests
+    for prob in [stats.Hypergeometric(), stats.Binomial()]:
+        t = time.time()
+        scalar = [prob.p_value(int(k[i]), N, int(m[i]), int(n[i]))
+                  for i in range(ns)]
+        t_scalar = (time.time() - t) * args.tests / ns
+
+        t = time.time()
+        array = prob.p_value_array(k, N, m, n)
+        t_array = time.time() - t
+
+        err = numpy.max(numpy.abs(array[:ns] - numpy.array(scalar)))
+        print("%-15s scalar: %8.2fs (extrapolated)  array: %8.2fs  "
+              "speedup: %6.1fx  max abs. difference: %.2e" %
+              (type(prob).__name__, t_scalar, t_array, t_scalar / t_array,
+               err))
+
+
+if __name__ == "__main__":
+    main()
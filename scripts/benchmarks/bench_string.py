@@ -0,0 +1,153 @@
+"""
+Time building a STRING PPI database from synthetic protein.links,
+protein.actions and protein.aliases files with a line by line reference
+loader (the former ppi.STRING.init_db) and with ppi.STRING.build_db.
+Optionally build several synthetic organisms in parallel processes.
+
+    python scripts/benchmarks/bench_string.py --proteins 20000 --links 2000000
+
+"""
+from __future__ import print_function
+
+import argparse
+import csv
+import gzip
+import io
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from orangecontrib.bio import ppi
+
+
+def write_files(path, taxid, proteins, links, seed=0):
+    rng = random.Random(seed)
+    ids = ["%s.ENSP%011i" % (taxid, i) for i in range(proteins)]
+    names = [os.path.join(path, "%s.%s.txt.gz" % (taxid, name))
+             for name in ["links", "actions", "aliases"]]
+    modes = ["activation", "binding", "catalysis", "expression",
+             "inhibition", "ptmod", "reaction"]
+
+    def opengz(filename):
+        return io.TextIOWrapper(gzip.open(filename, "wb"), encoding="utf-8")
+
+    with opengz(names[0]) as flinks, opengz(names[1]) as factions:
+        flinks.write(u"protein1 protein2 combined_score\n")
+        factions.write(u"item_id_a\titem_id_b\tmode\taction\t"
+                       u"a_is_acting\tscore\n")
+        for _ in range(links // 2):
+            a, b = rng.sample(ids, 2)
+            score = rng.randint(150, 999)
+            flinks.write(u"%s %s %i\n%s %s %i\n" % (a, b, score, b, a, score))
+            if rng.random() < 0.3:
+                factions.write(u"%s\t%s\t%s\t\tt\t%i\n" %
+                               (a, b, rng.choice(modes), score))
+
+    with opengz(names[2]) as faliases:
+        faliases.write(u"## string_protein_id\talias\tsource\n")
+        for i, id in enumerate(ids):
+            for j in range(rng.randint(2, 8)):
+                faliases.write(u"%s\tALIAS%i_%i\tEnsembl Uniprot\n" %
+                               (id, i, j))
+    return names
+
+
+def reference_build(dbfilename, version, links, actions, aliases):
+    """ The former line by line ppi.STRING.init_db loader. """
+    con = sqlite3.connect(dbfilename)
+    with con:
+        ppi.STRING.clear_db(con)
+        links_file = gzip.open(links, mode="rt")
+        links_file.readline()
+        con.executemany("INSERT INTO links VALUES (?, ?, ?)",
+                        ((p1, p2, int(score)) for p1, p2, score in
+                         csv.reader(links_file, delimiter=" ")))
+        con.create_function("part", 3, lambda s, sep, i: s.split(sep)[i])
+        con.execute("""
+            INSERT INTO proteins
+            SELECT protein_id1, part(protein_id1, '.', 0)
+            FROM (SELECT DISTINCT(protein_id1)
+                 FROM links
+                 ORDER BY protein_id1)
+        """)
+        actions_file = gzip.open(actions, mode="rt")
+        actions_file.readline()
+        con.executemany("INSERT INTO actions VALUES (?, ?, ?, ?, ?)",
+                        ((p1, p2, mode, action, int(score))
+                         for p1, p2, mode, action, _, score in
+                         csv.reader(actions_file, delimiter="\t")))
+        aliases_file = gzip.open(aliases, mode="rt")
+        aliases_file.readline()
+        con.executemany("INSERT INTO aliases VALUES (?, ?, ?)",
+                        csv.reader(aliases_file, delimiter="\t"))
+        ppi.STRING.create_db_index(con)
+    con.close()
+
+
+def build(args):
+    path, taxid, names = args
+    ppi.STRING.build_db(os.path.join(path, "%s.sqlite" % taxid), "v0", *names)
+
+
+def timed(func, *args):
+    t = time.time()
+    func(*args)
+    return time.time() - t
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--proteins", type=int, default=20000)
+    parser.add_argument("--links", type=int, default=1000000)
+    parser.add_argument("--organisms", type=int, default=1,
+                        help="number of synthetic organisms to build")
+    parser.add_argument("--processes", type=int, default=1)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    try:
+        taxids = [str(9606 + i) for i in range(args.organisms)]
+        files = [write_files(path, taxid, args.proteins, args.links, seed=i)
+                 for i, taxid in enumerate(taxids)]
+        size = sum(os.path.getsize(f) for names in files
+                   for f in names) / 2.0 ** 20
+        print("%i organisms, %i proteins, %i links, %.1f MB gzipped" %
+              (args.organisms, args.proteins, args.links, size))
+
+        t_ref = sum(timed(reference_build,
+                          os.path.join(path, "ref%s.sqlite" % taxid), "v0",
+                          *names)
+                    for taxid, names in zip(taxids, files))
+        print("reference: %.2fs" % t_ref)
+
+        tasks = [(path, taxid, names) for taxid, names in zip(taxids, files)]
+        t = time.time()
+        if args.processes > 1:
+            pool = multiprocessing.Pool(args.processes)
+            pool.map(build, tasks)
+            pool.close()
+            pool.join()
+        else:
+            for task in tasks:
+                build(task)
+        t_build = time.time() - t
+        print("build_db: %.2fs (%.1fx)" % (t_build, t_ref / t_build))
+
+        ref = sqlite3.connect(os.path.join(path, "ref%s.sqlite" % taxids[0]))
+        new = sqlite3.connect(os.path.join(path, "%s.sqlite" % taxids[0]))
+        for table in ["links", "proteins", "actions", "aliases"]:
+            query = "SELECT COUNT(*) FROM %s" % table
+            assert (ref.execute(query).fetchone() ==
+                    new.execute(query).fetchone()), table
+        ref.close()
+        new.close()
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()